@@ -0,0 +1 @@
+"""Throughput benchmarks for Metrum's hot paths."""
@@ -0,0 +1,76 @@
+"""Measure LogEvent writes per second as a function of the group-commit size.
+
+Usage:
+    python -m benchmarks.bench_event_writer --events 20000
+    python -m benchmarks.bench_event_writer --db-url postgresql+psycopg://metrum@localhost/metrum
+"""
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import click
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader.checkpoint import Checkpoint, CheckpointStore, FileIdentity
+from metrum.collector.log_reader.event_writer import EventWriter, event_row
+from metrum.db.models import Base, LogCheckpoint, LogEvent
+
+BATCH_SIZES = (1, 10, 100, 1000, 5000)
+
+
+def _events(count: int) -> List[Dict[str, Any]]:
+    started = datetime(2025, 3, 8, 17, 0, 0)
+    return [
+        event_row(LogEvent(
+            timestamp=started + timedelta(milliseconds=i),
+            query_text=f"SELECT * FROM accounts WHERE id = {i}",
+            explain_text='{"Plan": {"Node Type": "Index Scan"}}',
+            duration_ms=1.5,
+            pattern_name="index_scan",
+        ))
+        for i in range(count)
+    ]
+
+
+def _measure(engine, events: List[Dict[str, Any]], batch_size: int) -> float:
+    """Write events one at a time, as the pipeline completes them, and return the seconds taken."""
+    with Session(engine) as session:
+        session.execute(delete(LogEvent))
+        session.execute(delete(LogCheckpoint))
+        session.commit()
+    # Only the count decides when to flush, so timings do not depend on the delay
+    writer = EventWriter(engine, CheckpointStore(engine), max_events=batch_size, max_delay=float("inf"))
+    identity = FileIdentity(1, 1, 0, "")
+    started = time.perf_counter()
+    for offset, event in enumerate(events, 1):
+        writer.add([event], Checkpoint(Path("postgresql.log"), identity._replace(size=offset), offset, offset))
+        if writer.due():
+            writer.flush()
+    writer.flush()
+    return time.perf_counter() - started
+
+
+@click.command()
+@click.option("--events", type=int, default=20_000, help="Events written per batch size")
+@click.option("--db-url", help="Database to write to. Defaults to a temporary SQLite file")
+def main(events: int, db_url: Optional[str]):
+    """Report events per second for each group-commit size."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(db_url or f"sqlite:///{Path(tmp) / 'metrum.db'}")
+        Base.metadata.create_all(engine)
+        rows = _events(events)
+        click.echo(f"database:   {engine.dialect.name} ({engine.dialect.driver})")
+        click.echo(f"{'batch':>10}  {'events/s':>12}")
+        for batch_size in BATCH_SIZES:
+            # One transaction per event is slow enough that a sample suffices
+            written = events if batch_size > 1 else min(events, 2000)
+            seconds = _measure(engine, rows[:written], batch_size)
+            click.echo(f"{batch_size:>10}  {written / seconds:>12,.0f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
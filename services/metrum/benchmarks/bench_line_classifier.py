@@ -0,0 +1,157 @@
+"""Compare the single-pass line classifier with the original per-line checks.
+
+Usage:
+    python -m benchmarks.bench_line_classifier --size-mb 4096
+"""
+import re
+import tempfile
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import click
+
+from metrum.common.logger import logger
+from metrum.collector.log_reader import LogMonitor
+from metrum.collector.log_reader.pipeline import StageBatch
+from benchmarks.synthetic_logs import write_log
+
+BATCH_LINES = 10_000
+
+
+class LegacyLoop:
+    """The per-line checks LogMonitor.run performed before the classifier."""
+
+    def __init__(self):
+        self.query_buffer: List[str] = []
+        self.explain_buffer: List[str] = []
+        self.duration: Optional[float] = None
+        self.timestamp: Optional[datetime] = None
+        self.statements = 0
+
+    def _parse_timestamp(self, line: str) -> Optional[datetime]:
+        match = re.match(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})", line)
+        if match:
+            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S.%f")
+            logger.debug("parsed_timestamp", timestamp=timestamp.isoformat())
+            return timestamp
+        logger.debug("failed_to_parse_timestamp", line=line)
+        return None
+
+    def _extract_duration(self, line: str) -> Optional[float]:
+        match = re.search(r"duration: ([\d.]+) ms", line)
+        if match:
+            duration = float(match.group(1))
+            logger.debug("extracted_duration", duration_ms=duration)
+            return duration
+        logger.debug("failed_to_extract_duration", line=line)
+        return None
+
+    def _is_query_line(self, line: str) -> bool:
+        is_query = "LOG:  execute" in line
+        logger.debug("checked_query_line", is_query=is_query, line=line)
+        return is_query
+
+    def _is_explain_line(self, line: str) -> bool:
+        is_explain = "LOG:  duration:" in line and "plan:" in line
+        logger.debug("checked_explain_line", is_explain=is_explain, line=line)
+        return is_explain
+
+    def _is_temporary_file_line(self, line: str) -> bool:
+        is_temp_file = "LOG:  temporary file:" in line
+        logger.debug("checked_temp_file_line", is_temp_file=is_temp_file, line=line)
+        return is_temp_file
+
+    def consume(self, lines: List[str]) -> int:
+        for line in lines:
+            timestamp = self._parse_timestamp(line)
+            if timestamp:
+                self.timestamp = timestamp
+            if self._is_query_line(line):
+                if self.query_buffer:
+                    self.statements += 1
+                self.query_buffer = [line]
+                self.explain_buffer = []
+                self.duration = None
+            elif self._is_explain_line(line):
+                self.explain_buffer.append(line)
+                self.duration = self._extract_duration(line)
+            elif self._is_temporary_file_line(line):
+                if self.explain_buffer:
+                    self.statements += 1
+                    self.query_buffer = []
+                    self.explain_buffer = []
+                    self.duration = None
+            elif self.query_buffer:
+                self.query_buffer.append(line)
+        return self.statements
+
+
+class CountingMonitor(LogMonitor):
+    """LogMonitor that counts completed statements instead of building events.
+
+    Event construction costs the same on both paths, so the comparison is
+    limited to classification and buffering.
+    """
+
+    statements = 0
+
+    def _process_query(self, *args) -> None:
+        self.statements += 1
+        return None
+
+
+def _batches(path: Path) -> Iterable[List[str]]:
+    with path.open() as f:
+        while True:
+            batch = list(islice(f, BATCH_LINES))
+            if not batch:
+                return
+            yield batch
+
+
+def _measure(path: Path, consume: Callable[[List[str]], object]) -> tuple[float, int]:
+    lines = 0
+    started = time.perf_counter()
+    for batch in _batches(path):
+        consume(batch)
+        lines += len(batch)
+    return time.perf_counter() - started, lines
+
+
+@click.command()
+@click.option("--size-mb", type=int, default=256, help="Size of the generated log in MB")
+@click.option(
+    "--log-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Benchmark an existing log file instead of a generated one",
+)
+def main(size_mb: int, log_file: Optional[Path]):
+    """Report lines per second for the legacy loop and the classifier."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = log_file or write_log(Path(tmp) / "postgresql.log", size_mb * 1024 * 1024)
+        size = path.stat().st_size
+        monitor = CountingMonitor(
+            log_file_path=str(path),
+            patterns={},
+            http_endpoint="http://localhost",
+            db_url="sqlite://",
+        )
+
+        def classify(batch: List[str]) -> None:
+            # The pipeline's assemble and match steps
+            monitor._build_events(monitor._assemble(StageBatch(0, None, batch)))
+
+        legacy_seconds, lines = _measure(path, LegacyLoop().consume)
+        classifier_seconds, _ = _measure(path, classify)
+
+    click.echo(f"log size:        {size / 1024 / 1024:.1f} MB, {lines} lines")
+    click.echo(f"legacy loop:     {lines / legacy_seconds:,.0f} lines/s ({legacy_seconds:.2f}s)")
+    click.echo(f"classifier loop: {lines / classifier_seconds:,.0f} lines/s ({classifier_seconds:.2f}s)")
+    click.echo(f"speedup:         {legacy_seconds / classifier_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
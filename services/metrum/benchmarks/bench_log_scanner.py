@@ -0,0 +1,69 @@
+"""Compare text-mode line iteration with the mmap scanner.
+
+Usage:
+    python -m benchmarks.bench_log_scanner --size-mb 4096
+"""
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import click
+
+from metrum.collector.log_reader.log_scanner import LogScanner
+from metrum.collector.log_reader.session_assembler import SessionAssembler
+from benchmarks.synthetic_logs import write_log
+
+
+def _text_mode(path: Path, assembler: SessionAssembler) -> int:
+    lines = []
+    count = 0
+    with path.open() as f:
+        for line in f:
+            lines.append(line.rstrip())
+            if len(lines) >= 10_000:
+                count += len(assembler.feed(lines))
+                lines = []
+    return count + len(assembler.feed(lines))
+
+
+def _scanner(path: Path, assembler: SessionAssembler) -> int:
+    count = 0
+    with LogScanner(path) as scanner:
+        for offset, lines in scanner.message_batches():
+            count += len(assembler.feed(lines, offset))
+    return count
+
+
+def _measure(path: Path, read: Callable[[Path, SessionAssembler], int]) -> tuple[float, int]:
+    started = time.perf_counter()
+    statements = read(path, SessionAssembler())
+    return time.perf_counter() - started, statements
+
+
+@click.command()
+@click.option("--size-mb", type=int, default=256, help="Size of the generated log in MB")
+@click.option(
+    "--log-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    help="Benchmark an existing log file instead of a generated one",
+)
+def main(size_mb: int, log_file: Optional[Path]):
+    """Report MB per second for assembling statements from each reader."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = log_file or write_log(Path(tmp) / "postgresql.log", size_mb * 1024 * 1024)
+        size_mb = path.stat().st_size / 1024 / 1024
+
+        text_seconds, text_statements = _measure(path, _text_mode)
+        scanner_seconds, scanner_statements = _measure(path, _scanner)
+
+    click.echo(f"log size:   {size_mb:.1f} MB")
+    click.echo(f"text mode:  {size_mb / text_seconds:,.1f} MB/s ({text_statements} statements)")
+    click.echo(f"scanner:    {size_mb / scanner_seconds:,.1f} MB/s ({scanner_statements} statements)")
+    click.echo(f"speedup:    {text_seconds / scanner_seconds:.1f}x")
+    click.echo(f"max RSS:    {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measure the per-line cost of debug instrumentation with logging at INFO.
+
+Usage:
+    python -m benchmarks.bench_logging --lines 1000000
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Callable, List
+
+import click
+
+os.environ["LOG_LEVEL"] = "INFO"
+
+from metrum.common.logger import debug_enabled, json_serializer, logger  # noqa: E402
+from structlog.processors import JSONRenderer  # noqa: E402
+
+
+def _lines(count: int) -> List[str]:
+    return [
+        f"2025-03-08 17:06:20.{i % 1000:03d} GMT [{i % 64}] LOG:  execute <unnamed>: SELECT {i}"
+        for i in range(count)
+    ]
+
+
+def _bare(lines: List[str]) -> int:
+    total = 0
+    for line in lines:
+        total += len(line)
+    return total
+
+
+def _unguarded(lines: List[str]) -> int:
+    total = 0
+    for line in lines:
+        logger.debug("read_line", file="postgresql.log", line_length=len(line))
+        total += len(line)
+    return total
+
+
+def _guarded(lines: List[str]) -> int:
+    total = 0
+    for line in lines:
+        if debug_enabled():
+            logger.debug("read_line", file="postgresql.log", line_length=len(line))
+        total += len(line)
+    return total
+
+
+def _per_line_ns(lines: List[str], loop: Callable[[List[str]], int]) -> float:
+    started = time.perf_counter()
+    loop(lines)
+    return (time.perf_counter() - started) / len(lines) * 1e9
+
+
+def _render_rate(serializer: Callable[..., str], count: int) -> float:
+    renderer = JSONRenderer(serializer=serializer)
+    event = {
+        "event": "committed_log_checkpoint",
+        "event_count": 500,
+        "resume_offset": 123456789,
+        "committed_offset": 123459999,
+        "file": "/var/log/postgresql/postgresql-2025-03-08.log",
+        "level": "info",
+        "logger": "metrum.collector.log_reader.event_writer",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    started = time.perf_counter()
+    for _ in range(count):
+        renderer(None, "info", dict(event))
+    return count / (time.perf_counter() - started)
+
+
+@click.command()
+@click.option("--lines", type=int, default=1_000_000, help="Lines processed per variant")
+@click.option("--events", type=int, default=200_000, help="Events rendered per serializer")
+def main(lines: int, events: int):
+    """Report nanoseconds per line for each call-site style, and rendered events per second."""
+    sample = _lines(lines)
+    bare = _per_line_ns(sample, _bare)
+    click.echo(f"no logging:         {bare:8.1f} ns/line")
+    for name, loop in (("unguarded debug:", _unguarded), ("guarded debug:", _guarded)):
+        ns = _per_line_ns(sample, loop)
+        click.echo(f"{name:<20}{ns:8.1f} ns/line (+{ns - bare:.1f})")
+
+    click.echo(f"json renderer:      {_render_rate(json.dumps, events):,.0f} events/s")
+    if json_serializer() is json.dumps:
+        click.echo("orjson renderer:    not installed (pip install metrum[speedups])")
+    else:
+        click.echo(f"orjson renderer:    {_render_rate(json_serializer(), events):,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare log_events bytes per event with whole explain plans and with plans stored by shape.
+
+Usage:
+    python -m benchmarks.bench_plan_store --events 10000 --shapes 20
+"""
+import json
+import random
+from typing import Any, Dict, List
+
+import click
+
+from metrum.collector.log_reader.plan_parser import parse_plan
+from metrum.collector.log_reader.plan_store import split_plan
+
+QUERY = (
+    "SELECT a.name, sum(o.total) FROM accounts_{shape} a JOIN orders o ON o.account_id = a.id "
+    "WHERE o.created_at > now() - interval '30 days' GROUP BY a.name ORDER BY 2 DESC LIMIT 50"
+)
+
+
+def _node(rng: random.Random, node_type: str, relation: str = None, children: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """A plan node as auto_explain logs it with log_analyze, log_buffers and log_verbose."""
+    rows = rng.randint(1, 100_000)
+    node = {
+        "Node Type": node_type,
+        "Parent Relationship": "Outer",
+        "Parallel Aware": False,
+        "Async Capable": False,
+        "Startup Cost": round(rng.uniform(0, 100), 2),
+        "Total Cost": round(rng.uniform(100, 10_000), 2),
+        "Plan Rows": rows,
+        "Plan Width": 64,
+        "Actual Startup Time": round(rng.uniform(0, 1), 3),
+        "Actual Total Time": round(rng.uniform(1, 100), 3),
+        "Actual Rows": rng.randint(1, rows),
+        "Actual Loops": 1,
+        "Output": ["o.id", "o.account_id", "o.total", "o.created_at"],
+        "Shared Hit Blocks": rng.randint(0, 10_000),
+        "Shared Read Blocks": rng.randint(0, 1_000),
+        "Shared Dirtied Blocks": 0,
+        "Shared Written Blocks": 0,
+        "Local Hit Blocks": 0,
+        "Local Read Blocks": 0,
+        "Local Dirtied Blocks": 0,
+        "Local Written Blocks": 0,
+        "Temp Read Blocks": 0,
+        "Temp Written Blocks": 0,
+    }
+    if relation:
+        node.update({
+            "Relation Name": relation,
+            "Schema": "public",
+            "Alias": relation[0],
+            "Filter": "(o.created_at > (now() - '30 days'::interval))",
+            "Rows Removed by Filter": rng.randint(0, 1_000),
+        })
+    if children:
+        node["Plans"] = list(children)
+    return node
+
+
+def make_plan(rng: random.Random, shape: int) -> str:
+    """An auto_explain JSON plan of one of several shapes, with fresh figures."""
+    relation = f"accounts_{shape}"
+    scan = _node(rng, "Index Scan" if shape % 2 else "Seq Scan", relation)
+    plan = _node(rng, "Limit", children=[_node(rng, "Sort", children=[
+        _node(rng, "Aggregate", children=[_node(rng, "Hash Join", children=[
+            _node(rng, "Seq Scan", "orders"),
+            _node(rng, "Hash", children=[scan]),
+        ])]),
+    ])])
+    return json.dumps({"Query Text": QUERY.format(shape=shape), "Plan": plan}, indent=2)
+
+
+@click.command()
+@click.option("--events", type=int, default=10_000, help="Events generated")
+@click.option("--shapes", type=int, default=20, help="Distinct plan shapes among them")
+def main(events: int, shapes: int):
+    """Report the plan bytes stored per event, and once per shape."""
+    rng = random.Random(0)
+    whole = by_shape = 0
+    stored_shapes: Dict[str, int] = {}
+    for _ in range(events):
+        shape = rng.randrange(shapes)
+        explain_text = make_plan(rng, shape)
+        digest, shape_tree, stats = split_plan(parse_plan(explain_text.split("\n")).root.to_dict())
+        whole += len(explain_text)
+        # plan_id as a 4-byte integer plus the figures
+        by_shape += 4 + len(json.dumps(stats))
+        stored_shapes.setdefault(digest, len(digest) + len(json.dumps(shape_tree)) + len(explain_text))
+
+    shape_bytes = sum(stored_shapes.values())
+    click.echo(f"{events} events, {len(stored_shapes)} plan shapes")
+    click.echo(f"  explain_text per event:     {whole / events:10,.0f} bytes")
+    click.echo(f"  plan_id + plan_stats:       {by_shape / events:10,.0f} bytes "
+               f"({whole / by_shape:.1f}x smaller)")
+    click.echo(f"  plans table, once:          {shape_bytes:10,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compare MetrumQuery.from_query with and without the query analysis cache.
+
+Usage:
+    python -m benchmarks.bench_query_analysis --calls 20000 --statements 500
+"""
+import random
+import time
+from typing import List
+
+import click
+
+from benchmarks.bench_pattern_engine import make_queries
+from metrum.collector.queries import MetrumQuery, query_analysis_cache
+
+
+def _measure(calls: List[str]) -> float:
+    started = time.perf_counter()
+    for query in calls:
+        MetrumQuery.from_query(query)
+    return len(calls) / (time.perf_counter() - started)
+
+
+@click.command()
+@click.option("--calls", type=int, default=20_000, help="from_query calls")
+@click.option("--statements", type=int, default=500, help="Distinct statements among them")
+def main(calls: int, statements: int):
+    """Report from_query calls per second, uncached and cached."""
+    # from_query only analyses SELECT, UPDATE, DELETE and MERGE
+    distinct = [query for query in make_queries(statements * 2, 1_000) if not query.startswith("INSERT")][:statements]
+    rng = random.Random(0)
+    # A few statements make up most calls, as in application traffic
+    sample = rng.choices(distinct, weights=[1 / (rank + 1) for rank in range(len(distinct))], k=calls)
+
+    budget = query_analysis_cache.max_bytes
+    query_analysis_cache.max_bytes = 0
+    uncached = _measure(sample)
+    query_analysis_cache.max_bytes = budget
+    query_analysis_cache.clear()
+    cached = _measure(sample)
+    stats = query_analysis_cache.stats()
+
+    click.echo(f"{calls} calls, {len(distinct)} statements")
+    click.echo(f"  uncached:  {uncached:12,.0f} calls/s")
+    click.echo(f"  cached:    {cached:12,.0f} calls/s ({cached / uncached:.1f}x), "
+               f"hit rate {stats['hit_rate']:.1%}, {stats['bytes'] / 1024:,.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare relation extraction by the tokenizer with the top-level sqlparse identifiers it replaced.
+
+Usage:
+    python -m benchmarks.bench_relation_extraction --rounds 200
+"""
+import time
+from typing import Callable, List, Set, Tuple
+
+import click
+import sqlparse
+from sqlparse.sql import Identifier, IdentifierList
+
+from metrum.collector.queries.relations import extract_relations
+
+# Statements and the relations they reference
+CORPUS: List[Tuple[str, Set[str]]] = [
+    ("SELECT id, name FROM accounts WHERE id = $1", {"accounts"}),
+    ("SELECT a.id, sum(o.total) FROM accounts a JOIN orders o ON o.account_id = a.id "
+     "LEFT JOIN public.refunds r USING (order_id) GROUP BY a.id", {"accounts", "orders", "public.refunds"}),
+    ("SELECT * FROM orders, customers c WHERE c.id = orders.customer_id", {"orders", "customers"}),
+    ("SELECT * FROM items WHERE order_id IN (SELECT id FROM orders WHERE status = 'paid')", {"items", "orders"}),
+    ("WITH recent AS (SELECT id FROM events WHERE ts > now() - interval '1 day') "
+     "SELECT u.name FROM users u JOIN recent r ON r.id = u.last_event_id", {"events", "users"}),
+    ("WITH RECURSIVE tree (id, parent) AS (SELECT id, parent FROM nodes WHERE parent IS NULL "
+     "UNION ALL SELECT n.id, n.parent FROM nodes n JOIN tree t ON n.parent = t.id) SELECT * FROM tree", {"nodes"}),
+    ("UPDATE accounts SET balance = balance - t.amount FROM transfers t WHERE t.account_id = accounts.id",
+     {"accounts", "transfers"}),
+    ("DELETE FROM sessions USING users u WHERE sessions.user_id = u.id AND u.disabled", {"sessions", "users"}),
+    ("MERGE INTO stock s USING deliveries d ON s.item = d.item WHEN MATCHED THEN UPDATE SET qty = s.qty + d.qty "
+     "WHEN NOT MATCHED THEN INSERT (item, qty) VALUES (d.item, d.qty)", {"stock", "deliveries"}),
+    ("SELECT extract(year FROM created_at), count(*) FROM ONLY logs l "
+     "CROSS JOIN LATERAL (SELECT max(level) FROM log_levels WHERE log_levels.id = l.level_id) m "
+     "GROUP BY 1 FOR UPDATE", {"logs", "log_levels"}),
+    ("SELECT coalesce((SELECT max(v) FROM metrics m WHERE m.host = h.id), 0) FROM hosts h "
+     "WHERE EXISTS (SELECT 1 FROM alerts WHERE alerts.host = h.id)", {"metrics", "hosts", "alerts"}),
+    ('SELECT * FROM "Audit"."Log" a JOIN generate_series(1, 10) g ON g = a.level', {"Audit.Log"}),
+]
+
+
+def sqlparse_relations(query: str) -> List[str]:
+    """Names of top-level identifiers, as MetrumQuery.from_query listed tables with sqlparse."""
+    names = []
+    for token in sqlparse.parse(query)[0].tokens:
+        if isinstance(token, Identifier):
+            if token.get_name():
+                names.append(token.get_name())
+        elif isinstance(token, IdentifierList):
+            for identifier in token.get_identifiers():
+                if identifier.get_name():
+                    names.append(identifier.get_name())
+    return names
+
+
+def _report(name: str, extract: Callable[[str], List[str]], rounds: int) -> None:
+    correct = found = expected_count = exact = 0
+    for query, expected in CORPUS:
+        result = set(extract(query))
+        correct += len(result & expected)
+        found += len(result)
+        expected_count += len(expected)
+        exact += result == expected
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query, _ in CORPUS:
+            extract(query)
+    rate = rounds * len(CORPUS) / (time.perf_counter() - started)
+    click.echo(f"  {name:<10}{rate:12,.0f} queries/s  precision {correct / max(found, 1):6.1%}  "
+               f"recall {correct / expected_count:6.1%}  exact {exact}/{len(CORPUS)}")
+
+
+@click.command()
+@click.option("--rounds", type=int, default=200, help="Passes over the corpus when timing")
+def main(rounds: int):
+    """Report speed, precision and recall of each extractor on a labelled corpus."""
+    click.echo(f"{len(CORPUS)} statements")
+    _report("sqlparse", sqlparse_relations, rounds)
+    _report("tokenizer", extract_relations, rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare stored bytes of query and plan text, plain, compressed, and compressed with a trained dictionary.
+
+Usage:
+    python -m benchmarks.bench_text_codec --values 5000
+"""
+import random
+import time
+from typing import List
+
+import click
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from benchmarks.bench_pattern_engine import make_queries
+from benchmarks.bench_plan_store import make_plan
+from metrum.db.models import Base
+from metrum.db.text_codec import TextCodec, zstandard
+
+
+def _report(name: str, codec: TextCodec, values: List[str], plain: int) -> None:
+    encoded = [codec.encode(value) for value in values]
+    started = time.perf_counter()
+    for value in encoded:
+        codec.decode(value)
+    decode_rate = len(values) / (time.perf_counter() - started)
+    stored = sum(map(len, encoded))
+    click.echo(f"  {name:<22}{stored / len(values):8,.0f} bytes/value  "
+               f"{plain / stored:5.1f}x  {decode_rate:10,.0f} decodes/s")
+
+
+@click.command()
+@click.option("--values", type=int, default=5_000, help="Queries and plans encoded per codec")
+def main(values: int):
+    """Report average stored size and decode rate for each codec."""
+    rng = random.Random(0)
+    training = make_queries(values, 1_000, seed=2) + [make_plan(rng, rng.randrange(20)) for _ in range(values // 10)]
+    samples = {
+        "queries": make_queries(values, 1_000),
+        "plans": [make_plan(rng, rng.randrange(20)) for _ in range(values // 10)],
+    }
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    compressions = ["zlib"] + (["zstd"] if zstandard is not None else [])
+    for kind, texts in samples.items():
+        plain = sum(len(value.encode()) + 1 for value in texts)
+        click.echo(f"{kind} ({plain / len(texts):,.0f} bytes/value plain)")
+        for compression in compressions:
+            codec = TextCodec(compression)
+            _report(f"{compression}:", codec, texts, plain)
+            with Session(engine) as session:
+                codec.train(session, training)
+            _report(f"{compression} + dictionary:", codec, texts, plain)
+    if zstandard is None:
+        click.echo("zstd: not installed (pip install metrum[compression])")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List
+
+_STATEMENTS = [
+    "SELECT a.id, a.balance FROM accounts a WHERE a.customer_id = {n}",
+    "UPDATE accounts SET balance = balance - {n} WHERE id = {n}",
+    "SELECT t.id, t.amount\n\tFROM transactions t\n\tJOIN accounts a ON a.id = t.account_id\n\tWHERE a.customer_id = {n}\n\tORDER BY t.created_at DESC",
+    "DELETE FROM sessions WHERE last_seen < now() - interval '{n} minutes'",
+    "WITH ranked AS (\n\t  SELECT id, ROW_NUMBER() OVER (PARTITION BY customer_id ORDER BY created_at) AS rn\n\t  FROM transactions\n\t)\n\tSELECT * FROM ranked WHERE rn = {n}",
+]
+
+
+def _plan(statement: str, rows: int) -> List[str]:
+    """Render an auto_explain JSON plan the way it appears in stderr logs."""
+    plan = {
+        "Query Text": statement.replace("\n\t", " "),
+        "Plan": {
+            "Node Type": "Index Scan",
+            "Relation Name": "accounts",
+            "Actual Rows": rows,
+            "Actual Loops": 1,
+            "Shared Hit Blocks": rows * 3,
+        },
+    }
+    return ["\t" + line for line in json.dumps(plan, indent=2).splitlines()]
+
+
+def generate_lines(seed: int = 7) -> Iterator[str]:
+    """Yield an endless stream of realistic PostgreSQL stderr log lines."""
+    rng = random.Random(seed)
+    now = datetime(2025, 3, 8, 17, 6, 20)
+    while True:
+        now += timedelta(microseconds=rng.randint(100, 5000))
+        pid = rng.randint(1000, 1400)
+        prefix = f"{now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]} GMT [{pid}] "
+        statement = rng.choice(_STATEMENTS).format(n=rng.randint(1, 10_000))
+        lines = statement.split("\n")
+        yield f"{prefix}LOG:  execute <unnamed>: {lines[0]}"
+        yield from lines[1:]
+        roll = rng.random()
+        if roll < 0.5:
+            yield f"{prefix}LOG:  duration: {rng.uniform(0.1, 900):.3f} ms  plan:"
+            yield from _plan(statement, rng.randint(1, 500))
+        if roll < 0.1:
+            yield f"{prefix}LOG:  temporary file: path \"base/pgsql_tmp/pgsql_tmp{pid}.0\", size {rng.randint(1, 99) * 8192}"
+        if roll > 0.8:
+            yield f"{prefix}LOG:  connection received: host=10.0.0.{pid % 250} port={rng.randint(30000, 60000)}"
+        yield f"{prefix}LOG:  duration: {rng.uniform(0.01, 50):.3f} ms"
+
+
+def write_log(path: Path, size_bytes: int, seed: int = 7) -> Path:
+    """Write a synthetic log file of at least size_bytes bytes."""
+    written = 0
+    with path.open("w") as f:
+        buffer = []
+        for line in generate_lines(seed):
+            buffer.append(line)
+            written += len(line) + 1
+            if len(buffer) >= 10_000:
+                f.write("\n".join(buffer) + "\n")
+                buffer = []
+            if written >= size_bytes:
+                break
+        if buffer:
+            f.write("\n".join(buffer) + "\n")
+    return path
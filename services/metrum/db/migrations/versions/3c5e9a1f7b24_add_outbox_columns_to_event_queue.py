@@ -0,0 +1,45 @@
+"""add outbox columns to event queue
+
+Revision ID: 3c5e9a1f7b24
+Revises: 71b77e78218b
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c5e9a1f7b24'
+down_revision: Union[str, None] = '71b77e78218b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('event_queue', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('event_queue', sa.Column('next_attempt_at', sa.DateTime(), nullable=False,
+                                           server_default=sa.text('CURRENT_TIMESTAMP')))
+    op.create_index('ix_event_queue_due', 'event_queue', ['next_attempt_at', 'id'], unique=False,
+                    postgresql_where=sa.text("status IN ('PENDING', 'PROCESSING')"))
+    # Queue the log events that were never sent, including the ones that
+    # failed before failures were retried
+    op.execute("""
+        INSERT INTO event_queue (event_type, payload, status, attempts, next_attempt_at, created_at, updated_at)
+        SELECT 'log_event', json_build_object('log_event_id', id), 'PENDING', 0,
+               CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM log_events
+        WHERE status IN ('pending', 'failed')
+        ORDER BY id
+    """)
+    op.execute("UPDATE log_events SET status = 'pending' WHERE status = 'failed'")
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM event_queue WHERE event_type = 'log_event'")
+    op.drop_index('ix_event_queue_due', table_name='event_queue',
+                  postgresql_where=sa.text("status IN ('PENDING', 'PROCESSING')"))
+    op.drop_column('event_queue', 'next_attempt_at')
+    op.drop_column('event_queue', 'attempts')
@@ -122,4 +122,46 @@ def reset():
             click.echo("Database has been reset and migrations have been applied.")
         except Exception as e:
             log_command_output(log_file, "reset", f"Error: {str(e)}")
-            raise 
\ No newline at end of file
+            raise 
+
+@db.command("train-dictionary")
+@click.option(
+    "--samples",
+    type=int,
+    default=10_000,
+    help="Recent queries and plans to train on"
+)
+@click.option(
+    "--size-kb",
+    type=int,
+    default=64,
+    help="Largest dictionary size in kB"
+)
+def train_dictionary(samples: int, size_kb: int):
+    """Train a compression dictionary on stored queries and plans.
+
+    Text stored from then on is compressed with the new dictionary; text
+    stored before keeps the dictionary it was compressed with.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+
+    from metrum.db.models import ExplainPlan, LogEvent
+    from metrum.db.text_codec import text_codec
+
+    engine = create_engine(settings.database_url)
+    with Session(engine) as session:
+        text_codec.load(session)
+        texts = list(session.execute(
+            select(LogEvent.query_text).where(LogEvent.query_text.is_not(None)).order_by(LogEvent.id.desc()).limit(samples)
+        ).scalars())
+        texts.extend(session.execute(
+            select(ExplainPlan.explain_text).where(ExplainPlan.explain_text.is_not(None))
+            .order_by(ExplainPlan.id.desc()).limit(samples)
+        ).scalars())
+        if not texts:
+            click.echo("No stored queries or plans to train on.", err=True)
+            return
+        dictionary_id = text_codec.train(session, texts, size=size_kb * 1024)
+        session.commit()
+    click.echo(f"Trained {text_codec.compression} dictionary {dictionary_id} on {len(texts)} samples.")
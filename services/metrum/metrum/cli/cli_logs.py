@@ -96,5 +96,42 @@ def list():
                     modified=mtime.isoformat())
         click.echo(f"  {log_file.name} ({size/1024:.1f}KB, modified: {mtime})")
 
+
+@logs.command()
+@click.option(
+    "--workers", "-w",
+    type=int,
+    help="Worker processes (default: number of CPUs)"
+)
+@click.option(
+    "--shard-mb",
+    type=int,
+    help="Split log files into pieces of this many MB"
+)
+def backfill(workers: Optional[int] = None, shard_mb: Optional[int] = None):
+    """Import all existing log files into the database."""
+    from metrum.collector.queries import LogMonitorService
+
+    logger.debug("backfilling_logs", workers=workers, shard_mb=shard_mb)
+    try:
+        count = LogMonitorService(from_beginning=True).backfill(workers=workers, shard_mb=shard_mb)
+    except RuntimeError as e:
+        click.echo(str(e), err=True)
+        return
+    click.echo(f"Imported {count} events.")
+
+
+@logs.command()
+def deliver():
+    """Send queued events to the HTTP endpoint, beside or instead of the monitor."""
+    from metrum.collector.queries import LogMonitorService
+
+    logger.debug("delivering_events")
+    try:
+        asyncio.run(LogMonitorService().deliver())
+    except KeyboardInterrupt:
+        logger.info("event_delivery_stopped_by_user")
+        click.echo("\nStopped delivering events")
+
 if __name__ == '__main__':
     logs() 
\ No newline at end of file
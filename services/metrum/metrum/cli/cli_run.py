@@ -26,13 +26,7 @@ def run(latest):
         pretty=settings.metric_sink_pretty
     )
     
-    async def run_services():
-        # Start both services concurrently
-        await asyncio.gather(
-            metrics_collector.start(),
-            log_monitor.run()
-        )
-        
+    async def write_metrics():
         # Collect and send metrics in a loop
         while True:
             try:
@@ -42,6 +36,15 @@ def run(latest):
             except Exception as e:
                 logger.error("error_collecting_metrics", error=str(e), exc_info=True)
                 await asyncio.sleep(metrics_collector.interval)
+
+    async def run_services():
+        # The log monitor runs until cancelled, so metrics are written
+        # alongside it rather than after it
+        await metrics_collector.start()
+        await asyncio.gather(
+            log_monitor.run(),
+            write_metrics(),
+        )
     
     try:
         asyncio.run(run_services())
@@ -3,5 +3,12 @@
 from .log_reader import LogReader
 from .create_log_reader import create_log_reader
 from .log_monitor import LogMonitor
+from .checkpoint import CheckpointStore
+from .backfill import Backfill, BackfillOptions
+from .event_sender import EventSender
+from .outbox import Outbox, OutboxWorker
+from .log_line_prefix import LogLinePrefix
+from .structured_log import LogRecord
+from .plan_parser import Plan, PlanNode, parse_plan
 
-__all__ = ["LogReader", "LogMonitor", "create_log_reader"] 
\ No newline at end of file
+__all__ = ["LogReader", "LogMonitor", "CheckpointStore", "Backfill", "BackfillOptions", "EventSender", "Outbox", "OutboxWorker", "LogLinePrefix", "LogRecord", "Plan", "PlanNode", "create_log_reader", "parse_plan"] 
\ No newline at end of file
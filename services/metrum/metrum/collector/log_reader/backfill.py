@@ -0,0 +1,294 @@
+import heapq
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from metrum.common.logger import logger
+from .checkpoint import CheckpointStore, file_identity
+from .event_builder import EventBuilder
+from .event_writer import insert_events
+from .plan_store import PlanStore
+from .line_classifier import LineClassifier
+from .log_line_prefix import DEFAULT_LOG_LINE_PREFIX, LogLinePrefix
+from .compressed_log import detect_compression
+from .log_scanner import LogScanner, open_scanner
+from .session_assembler import AssembledStatement, SessionAssembler
+from .structured_log import RecordAssembler, create_record_parser
+
+# Rows inserted per statement while bulk loading
+INSERT_ROWS = 10_000
+
+
+class Shard(NamedTuple):
+    """A byte range of a log file, starting and ending at line boundaries.
+
+    Attributes:
+        path: Log file
+        start: Offset of the first line
+        end: Offset after the last line
+    """
+    path: Path
+    start: int
+    end: int
+
+
+class BackfillOptions(NamedTuple):
+    """Parsing settings shipped to backfill workers.
+
+    Attributes:
+        patterns: Query patterns to tag events with, by name
+        log_format: stderr, csvlog or jsonlog
+        log_line_prefix: log_line_prefix of stderr logs
+        max_sessions: Sessions buffered at once per worker
+        max_session_lines: Lines buffered per query or explain plan
+        overflow_bytes: How far past its end a shard may read to complete
+            statements that started inside it
+    """
+    patterns: Dict[str, Any]
+    log_format: str = "stderr"
+    log_line_prefix: str = DEFAULT_LOG_LINE_PREFIX
+    max_sessions: int = 1024
+    max_session_lines: int = 10_000
+    overflow_bytes: int = 64 * 1024 * 1024
+
+
+class ShardResult(NamedTuple):
+    """Events parsed from one shard, sorted by timestamp.
+
+    Attributes:
+        shard: The parsed shard
+        rows: LogEvent column values
+    """
+    shard: Shard
+    rows: List[Dict[str, Any]]
+
+
+def plan_shards(files: List[Path], shard_bytes: int) -> List[Shard]:
+    """Split log files into shards of about shard_bytes, cut at line boundaries.
+
+    Compressed files are not split; each is parsed whole by one worker.
+
+    Args:
+        files: Log files in the order they were written
+        shard_bytes: Target shard size
+
+    Returns:
+        Shards in file and offset order
+    """
+    shards: List[Shard] = []
+    for path in files:
+        size = path.stat().st_size
+        if detect_compression(path) is not None:
+            # Compressed streams cannot be entered in the middle
+            shards.append(Shard(path, 0, size))
+            continue
+        start = 0
+        with path.open("rb") as f:
+            while start < size:
+                cut = start + shard_bytes
+                if cut >= size:
+                    cut = size
+                else:
+                    f.seek(cut)
+                    cut += len(f.readline())
+                shards.append(Shard(path, start, cut))
+                start = cut
+    return shards
+
+
+def _record_batches(chunks: Iterable[Tuple[int, Union[bytes, memoryview]]]) -> Iterator[Tuple[int, List[str]]]:
+    """Decode scanner windows into lines that keep their newlines, as the record parsers need."""
+    for offset, chunk in chunks:
+        yield offset, io.StringIO(str(chunk, "utf-8", "replace"), newline="\n").readlines()
+
+
+def parse_shard(shard: Shard, options: BackfillOptions) -> ShardResult:
+    """Parse the statements that start inside a shard.
+
+    Statements that are still open at the end of the shard are completed by
+    reading on, up to options.overflow_bytes past it. Statements that start
+    before or after the shard belong to its neighbours and are dropped.
+
+    Args:
+        shard: Byte range to parse
+        options: Parsing settings
+
+    Returns:
+        The shard's events, sorted by timestamp
+    """
+    builder = EventBuilder(options.patterns)
+    if options.log_format == "stderr":
+        assembler = SessionAssembler(
+            max_sessions=options.max_sessions,
+            max_buffer_lines=options.max_session_lines,
+            classifier=LineClassifier(LogLinePrefix(options.log_line_prefix)),
+        )
+    else:
+        assembler = RecordAssembler(create_record_parser(options.log_format), max_sessions=options.max_sessions)
+
+    with open_scanner(shard.path) as scanner:
+        if isinstance(scanner, LogScanner):
+            end = shard.end
+            overflow_end = min(end + options.overflow_bytes, scanner.size)
+        else:
+            # A compressed file is one shard, read to EOF in decompressed offsets
+            end = overflow_end = None
+        if options.log_format == "stderr":
+            # Messages the assembler ignores are skipped without being decoded
+            batches = scanner.message_batches(shard.start, end)
+            overflow = scanner.message_batches(end, overflow_end) if end is not None else ()
+        else:
+            batches = _record_batches(scanner.chunks(shard.start, end))
+            overflow = _record_batches(scanner.chunks(end, overflow_end)) if end is not None else ()
+        statements = _assemble(assembler, end, batches, overflow)
+
+    rows = []
+    for statement in statements:
+        if end is not None and not shard.start <= statement.offset < end:
+            continue
+        fields = builder.build(
+            statement.query_lines,
+            statement.explain_lines,
+            statement.duration_ms,
+            statement.timestamp,
+            statement.query_id,
+        )
+        if fields:
+            rows.append(fields)
+    rows.sort(key=_timestamp)
+    return ShardResult(shard, rows)
+
+
+def _assemble(
+    assembler: Union[SessionAssembler, RecordAssembler],
+    end: Optional[int],
+    batches: Iterable[Tuple[int, List[str]]],
+    overflow: Iterable[Tuple[int, List[str]]],
+) -> List[AssembledStatement]:
+    """Feed a shard's batches, then overflow batches while a statement started in the shard is open."""
+    statements = []
+    for offset, lines in batches:
+        statements.extend(assembler.feed(lines, offset))
+    for offset, lines in overflow:
+        pending = assembler.pending_offset()
+        if pending is None or pending >= end:
+            break
+        statements.extend(assembler.feed(lines, offset))
+    statements.extend(assembler.flush_all())
+    return statements
+
+
+def _timestamp(row: Dict[str, Any]):
+    return row["timestamp"]
+
+
+class Backfill:
+    """Bounded import of historical log files.
+
+    Files are split into shards that are parsed in a process pool. Results
+    come back in shard order and are merged by timestamp. As log files are
+    written in time order, rows older than the first row of the newest
+    shard cannot be preceded by anything still to come, so they are bulk
+    loaded and only the rest stays in memory.
+    Once everything is loaded, each file gets a checkpoint at the end of
+    its last shard, so the follow mode resumes every file, including a
+    live one that kept growing, after the lines that were parsed.
+    """
+
+    def __init__(
+        self,
+        db_url: str,
+        options: BackfillOptions,
+        workers: Optional[int] = None,
+        shard_bytes: int = 256 * 1024 * 1024,
+    ):
+        """Initialize the backfill.
+
+        Args:
+            db_url: Database URL of metrum's database
+            options: Parsing settings
+            workers: Worker processes. Defaults to the number of CPUs
+            shard_bytes: Target shard size
+        """
+        self.engine = create_engine(db_url)
+        self.options = options
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_bytes = shard_bytes
+        self.loaded_rows = 0
+        self.plans = PlanStore()
+
+    def run(self, files: List[Path]) -> int:
+        """Import log files to EOF.
+
+        Args:
+            files: Log files in the order they were written
+
+        Returns:
+            Number of events loaded
+        """
+        shards = plan_shards(files, self.shard_bytes)
+        # Shards are in file and offset order, so the last one of a file wins
+        parsed_ends = {shard.path: shard.end for shard in shards}
+        total_bytes = sum(shard.end - shard.start for shard in shards)
+        logger.info("starting_backfill",
+                  file_count=len(files),
+                  shard_count=len(shards),
+                  total_bytes=total_bytes,
+                  workers=self.workers)
+
+        started = time.monotonic()
+        done_bytes = 0
+        pending: List[Dict[str, Any]] = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(parse_shard, shards, [self.options] * len(shards))
+            for index, result in enumerate(results):
+                if result.rows:
+                    horizon = result.rows[0]["timestamp"]
+                    merged = list(heapq.merge(pending, result.rows, key=_timestamp))
+                    ready = next((i for i, row in enumerate(merged) if row["timestamp"] >= horizon), len(merged))
+                    self._load(merged[:ready])
+                    pending = merged[ready:]
+
+                done_bytes += result.shard.end - result.shard.start
+                elapsed = time.monotonic() - started
+                logger.info("backfill_progress",
+                          shard=f"{index + 1}/{len(shards)}",
+                          file=str(result.shard.path),
+                          percent=round(100 * done_bytes / total_bytes, 1) if total_bytes else 100.0,
+                          events=self.loaded_rows + len(pending),
+                          mb_per_second=round(done_bytes / 1024 / 1024 / elapsed, 1) if elapsed else None)
+
+        self._load(pending, parsed_ends)
+        logger.info("finished_backfill",
+                  events=self.loaded_rows,
+                  total_bytes=total_bytes,
+                  seconds=round(time.monotonic() - started, 1))
+        return self.loaded_rows
+
+    def _load(self, rows: List[Dict[str, Any]], parsed_ends: Optional[Dict[Path, int]] = None) -> None:
+        """Bulk insert rows, and write the final checkpoints in the same transaction.
+
+        Args:
+            rows: LogEvent column values
+            parsed_ends: Offset each file was parsed up to, to checkpoint it at
+        """
+        if not rows and not parsed_ends:
+            return
+        with Session(self.engine) as session:
+            for start in range(0, len(rows), INSERT_ROWS):
+                insert_events(session, rows[start:start + INSERT_ROWS], self.plans)
+            checkpoints = CheckpointStore(self.engine)
+            for path, end in (parsed_ends or {}).items():
+                identity = file_identity(path)
+                if identity is not None:
+                    # The file may have grown since it was parsed
+                    identity = identity._replace(size=end)
+                    checkpoints.save(session, path.absolute(), identity, end, end)
+            session.commit()
+        self.loaded_rows += len(rows)
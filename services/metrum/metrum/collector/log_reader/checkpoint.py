@@ -0,0 +1,203 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from metrum.common.logger import logger
+from metrum.db.models import LogCheckpoint
+
+# Bytes of the first line hashed to recognize a file after a restart
+FIRST_LINE_BYTES = 4096
+
+
+class FileIdentity(NamedTuple):
+    """Identity of a log file, used to detect rotation and truncation.
+
+    Attributes:
+        inode: Inode number
+        device: Device number
+        size: Size in bytes
+        first_line_hash: SHA-256 of the first line, or of the first
+            FIRST_LINE_BYTES bytes if the line is longer
+    """
+    inode: int
+    device: int
+    size: int
+    first_line_hash: str
+
+
+def file_identity(path: Path) -> Optional[FileIdentity]:
+    """Read the identity of a log file.
+
+    Args:
+        path: Path to the log file
+
+    Returns:
+        The file's identity, or None if it cannot be read or its first line
+        is still being written
+    """
+    try:
+        with path.open("rb") as f:
+            first_line = f.readline(FIRST_LINE_BYTES)
+            stat = os.fstat(f.fileno())
+    except OSError as e:
+        logger.debug("failed_to_read_file_identity", file=str(path), error=str(e))
+        return None
+    if not first_line.endswith(b"\n") and len(first_line) < FIRST_LINE_BYTES:
+        return None
+    return FileIdentity(
+        stat.st_ino,
+        stat.st_dev,
+        stat.st_size,
+        hashlib.sha256(first_line).hexdigest(),
+    )
+
+
+class ResumePoint(NamedTuple):
+    """Where to continue reading a log file after a restart.
+
+    Attributes:
+        resume_offset: Offset to start reading from
+        committed_offset: Statements completed before this offset have
+            already been committed and must not be produced again
+    """
+    resume_offset: int
+    committed_offset: int
+
+
+class Checkpoint(NamedTuple):
+    """Position in a log file up to which events are ready to be committed.
+
+    Attributes:
+        path: Path to the log file
+        identity: Identity of the file when it was read, or None if it
+            could not be read; no checkpoint is stored then
+        resume_offset: Start of the oldest statement still being assembled
+        committed_offset: End of the last line consumed
+    """
+    path: Path
+    identity: Optional[FileIdentity]
+    resume_offset: int
+    committed_offset: int
+
+
+class CheckpointStore:
+    """Persists byte-offset checkpoints for tailed log files.
+
+    Checkpoints are written with save() into the caller's session, so they
+    commit in the same transaction as the events read up to them.
+    """
+
+    def __init__(self, engine):
+        """Initialize the store.
+
+        Args:
+            engine: SQLAlchemy engine of metrum's database
+        """
+        self.engine = engine
+
+    def resume_point(self, path: Path, identity: Optional[FileIdentity]) -> ResumePoint:
+        """Find where reading a file should resume.
+
+        The checkpoint is only used if the file still has the same inode,
+        device and first line, and has not shrunk below the checkpoint.
+
+        Args:
+            path: Path to the log file
+            identity: Current identity of the file
+
+        Returns:
+            The stored resume point, or the start of the file
+        """
+        checkpoint = self._valid_checkpoint(path, identity)
+        if checkpoint is None:
+            return ResumePoint(0, 0)
+        logger.info("resuming_from_log_checkpoint",
+                  file=str(path),
+                  resume_offset=checkpoint.resume_offset,
+                  committed_offset=checkpoint.committed_offset)
+        return ResumePoint(checkpoint.resume_offset, checkpoint.committed_offset)
+
+    def first_unfinished(self, paths: List[Path]) -> Optional[Path]:
+        """Find the oldest of a sequence of rotated log files that was not read to its end.
+
+        A file was read once its checkpoint covers all of it with no
+        statement left open in it: none was open at its end, or the next
+        file's checkpoint resumes past the start of that file, which it
+        only does once the statements carried over into it completed.
+
+        Args:
+            paths: Log files, oldest first
+
+        Returns:
+            The first file to read, or None if all of them were read
+        """
+        identities = [file_identity(path) for path in paths]
+        checkpoints = [self._valid_checkpoint(path, identity) for path, identity in zip(paths, identities)]
+        for index, (path, identity, checkpoint) in enumerate(zip(paths, identities, checkpoints)):
+            if checkpoint is None or checkpoint.committed_offset < identity.size:
+                return path
+            if checkpoint.resume_offset < checkpoint.committed_offset:
+                following = checkpoints[index + 1] if index + 1 < len(paths) else None
+                if following is None or following.resume_offset == 0:
+                    return path
+        return None
+
+    def _valid_checkpoint(self, path: Path, identity: Optional[FileIdentity]) -> Optional[LogCheckpoint]:
+        """The stored checkpoint of a file, if it still matches the file."""
+        if identity is None:
+            return None
+        with Session(self.engine) as session:
+            checkpoint = session.execute(
+                select(LogCheckpoint).where(LogCheckpoint.file_path == str(path))
+            ).scalar_one_or_none()
+        if checkpoint is None:
+            logger.debug("no_log_checkpoint", file=str(path))
+            return None
+        if (
+            checkpoint.inode != identity.inode
+            or checkpoint.device != identity.device
+            or checkpoint.first_line_hash != identity.first_line_hash
+            or checkpoint.committed_offset > identity.size
+        ):
+            logger.info("log_checkpoint_outdated",
+                      file=str(path),
+                      checkpoint_inode=checkpoint.inode,
+                      inode=identity.inode,
+                      checkpoint_offset=checkpoint.committed_offset,
+                      size=identity.size)
+            return None
+        return checkpoint
+
+    def save(
+        self,
+        session: Session,
+        path: Path,
+        identity: FileIdentity,
+        resume_offset: int,
+        committed_offset: int,
+    ) -> None:
+        """Add a checkpoint to a session without committing it.
+
+        Args:
+            session: Session that also holds the events read up to the checkpoint
+            path: Path to the log file
+            identity: Identity of the file when it was read
+            resume_offset: Start of the oldest statement still being assembled
+            committed_offset: End of the last line consumed
+        """
+        checkpoint = session.execute(
+            select(LogCheckpoint).where(LogCheckpoint.file_path == str(path))
+        ).scalar_one_or_none()
+        if checkpoint is None:
+            checkpoint = LogCheckpoint(file_path=str(path))
+            session.add(checkpoint)
+        checkpoint.inode = identity.inode
+        checkpoint.device = identity.device
+        checkpoint.size = identity.size
+        checkpoint.first_line_hash = identity.first_line_hash
+        checkpoint.resume_offset = resume_offset
+        checkpoint.committed_offset = committed_offset
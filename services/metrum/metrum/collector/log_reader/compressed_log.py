@@ -0,0 +1,95 @@
+import gzip
+import io
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from metrum.common.logger import logger
+
+# Read buffer for decompressed streams; decompressors are much faster fed
+# in large blocks
+READ_BUFFER_BYTES = 1024 * 1024
+
+# Suffixes rotated log archives are stored with
+COMPRESSED_SUFFIXES = (".gz", ".zst", ".lz4")
+
+# Leading bytes of each supported container format
+_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"\x04\x22\x4d\x18": "lz4",
+}
+
+
+class _DecompressedReader(io.BufferedReader):
+    """Buffered decompressed stream that also closes the compressed file under it."""
+
+    def __init__(self, stream, source: BinaryIO):
+        super().__init__(stream, buffer_size=READ_BUFFER_BYTES)
+        self._source = source
+
+    def close(self) -> None:
+        try:
+            super().close()
+        finally:
+            self._source.close()
+
+
+def detect_compression(path: Path) -> Optional[str]:
+    """Detect the compression of a file from its magic bytes.
+
+    Args:
+        path: File to inspect
+
+    Returns:
+        "gzip", "zstd" or "lz4", or None for uncompressed files
+    """
+    with path.open("rb") as f:
+        head = f.read(4)
+    for magic, compression in _MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_log_file(path: Path, compression: Optional[str] = None) -> BinaryIO:
+    """Open a log file for streaming reads, decompressing it if needed.
+
+    zstd and lz4 support needs the optional zstandard and lz4 packages
+    (pip install metrum[compression]).
+
+    Args:
+        path: Log file, compressed or not
+        compression: Compression of the file. Detected when not given
+
+    Returns:
+        A buffered binary stream of the decompressed contents
+
+    Raises:
+        ImportError: If the package needed for the file's compression is
+            not installed
+    """
+    compression = compression or detect_compression(path)
+    if compression is None:
+        return path.open("rb", buffering=READ_BUFFER_BYTES)
+
+    logger.debug("opening_compressed_log_file", file=str(path), compression=compression)
+    raw = path.open("rb", buffering=READ_BUFFER_BYTES)
+    try:
+        if compression == "gzip":
+            stream = gzip.GzipFile(fileobj=raw, mode="rb")
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(f"Reading {path} requires the zstandard package") from e
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_size=READ_BUFFER_BYTES)
+        else:
+            try:
+                import lz4.frame
+            except ImportError as e:
+                raise ImportError(f"Reading {path} requires the lz4 package") from e
+            stream = lz4.frame.LZ4FrameFile(raw, mode="rb")
+    except Exception:
+        raw.close()
+        raise
+    return _DecompressedReader(stream, raw)
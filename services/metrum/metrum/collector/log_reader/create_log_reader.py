@@ -3,6 +3,7 @@ from typing import Optional
 from metrum.settings import settings
 from .log_reader import LogReader
 from .file_log_reader import FileLogReader
+from .structured_log import LOG_FORMATS
 
 def create_log_reader(
     logs_dir: Optional[Path] = None,
@@ -18,9 +19,11 @@ def create_log_reader(
         A LogReader implementation appropriate for the configured log mode
         
     Raises:
-        ValueError: If the configured log mode is not supported
+        ValueError: If the configured log mode or log format is not supported
     """
+    if settings.log_format not in LOG_FORMATS:
+        raise ValueError(f"Unsupported log format: {settings.log_format}")
     if settings.log_mode == "file":
-        return FileLogReader(logs_dir=logs_dir, pattern=pattern)
+        return FileLogReader(logs_dir=logs_dir, pattern=pattern, log_format=settings.log_format)
     else:
         raise ValueError(f"Unsupported log mode: {settings.log_mode}") 
\ No newline at end of file
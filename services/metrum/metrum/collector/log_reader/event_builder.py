@@ -0,0 +1,118 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional
+
+from metrum.common.fingerprint import fingerprint
+from metrum.common.logger import debug_enabled, logger
+from .pattern_engine import PatternEngine
+from .plan_parser import parse_plan
+from .timestamp_decoder import TimestampDecoder
+
+
+class EventBuilder:
+    """Turns assembled statements into LogEvent column values."""
+
+    def __init__(self, patterns: Mapping[str, Any], timestamp_decoder: Optional[TimestampDecoder] = None):
+        """Initialize the builder.
+
+        Args:
+            patterns: Query patterns to tag events with, by name, as Pattern
+                objects or dicts with a query_pattern
+            timestamp_decoder: Decoder for prefix timestamps. Defaults to a
+                new TimestampDecoder
+        """
+        self.patterns = patterns
+        self.pattern_engine = PatternEngine(patterns)
+        self.timestamp_decoder = timestamp_decoder or TimestampDecoder()
+
+    def update_patterns(self, patterns: Mapping[str, Any]) -> None:
+        """Match events against a new set of patterns from now on.
+
+        Only patterns that are new or whose query_pattern changed are
+        compiled. The new engine replaces the current one in a single
+        assignment, so events being built concurrently use one or the other
+        in full.
+        """
+        engine = PatternEngine(patterns, previous=self.pattern_engine)
+        self.pattern_engine = engine
+        self.patterns = patterns
+
+    def parse_timestamp(self, value: str) -> Optional[datetime]:
+        """Parse a timestamp token taken from a log line prefix."""
+        timestamp = self.timestamp_decoder.decode(value)
+        if timestamp is None and debug_enabled():
+            logger.debug("failed_to_parse_timestamp", value=value)
+        return timestamp
+
+    def extract_query_text(self, explain_text: str) -> Optional[str]:
+        """Extract query text from explain plan."""
+        try:
+            # Try to parse the JSON in the explain plan
+            match = re.search(r'{\s*"Query Text":\s*"([^"]+)"', explain_text)
+            if match:
+                query_text = match.group(1)
+                # Replace escaped newlines
+                query_text = query_text.replace('\\n', '\n')
+                return query_text
+        except Exception as e:
+            logger.error("error_extracting_query_text", error=str(e), exc_info=True)
+        return None
+
+    def build(
+        self,
+        query_lines: List[str],
+        explain_lines: List[str],
+        duration: Optional[float],
+        timestamp: Optional[str],
+        query_id: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Build the column values of the event for a query and its explain plan.
+
+        Args:
+            query_lines: Statement text, one entry per log line
+            explain_lines: auto_explain plan text, one entry per log line
+            duration: Duration reported with the plan
+            timestamp: Raw timestamp token of the statement
+            query_id: Query identifier logged by the server, if any
+
+        Returns:
+            LogEvent column values and the parsed plan tree as plan, or None
+            if the statement has no query lines or no valid timestamp
+        """
+        if not query_lines or not timestamp:
+            return None
+
+        parsed_timestamp = self.parse_timestamp(timestamp)
+        if not parsed_timestamp:
+            return None
+
+        # Extract query text from the explain plan if available
+        explain_text = "\n".join(explain_lines) if explain_lines else None
+        query_text = None
+        plan = parse_plan(explain_lines) if explain_lines else None
+
+        if plan is not None:
+            query_text = plan.query_text
+        elif explain_text:
+            # Plans cut short by the session buffer limit do not parse
+            query_text = self.extract_query_text(explain_text)
+        
+        # If we couldn't extract from explain plan, try to get from query lines
+        if not query_text and query_lines:
+            query_text = "\n".join(query_lines)
+
+        # The first match in configuration order names the event
+        engine = self.pattern_engine
+        pattern_names = engine.match(query_text) if query_text else []
+
+        return {
+            "timestamp": parsed_timestamp,
+            "query_text": query_text,
+            "explain_text": explain_text,
+            "duration_ms": duration,
+            "fingerprint": fingerprint(query_text).query_id if query_text else None,
+            "query_id": int(query_id) if query_id else None,
+            "pattern_name": pattern_names[0] if pattern_names else None,
+            "pattern_names": pattern_names or None,
+            "plan": plan.root.to_dict() if plan is not None else None,
+        }
@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import importlib.util
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from metrum.common.logger import logger
+from metrum.db.models import LogEvent
+
+# Payloads smaller than this are sent uncompressed even with gzip enabled
+GZIP_MIN_BYTES = 1024
+
+# Client errors that mean "try again later" rather than "rejected"
+RETRY_STATUS_CODES = (408, 429)
+
+
+def event_payload(event: LogEvent, plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """JSON fields of an event and its plan tree, as sent to the HTTP endpoint."""
+    return {
+        "id": event.id,
+        "timestamp": event.timestamp.isoformat(),
+        "query_text": event.query_text,
+        "explain_text": event.explain_text,
+        "duration_ms": event.duration_ms,
+        "fingerprint": event.fingerprint,
+        "query_id": event.query_id,
+        "pattern_name": event.pattern_name,
+        "pattern_names": event.pattern_names,
+        "plan_id": event.plan_id,
+        "plan": plan,
+    }
+
+
+class EventSender:
+    """Posts batches of events to the HTTP endpoint over one pooled client.
+
+    A batch is a single POST of ``{"events": [...]}``, gzip-compressed when
+    enabled. A 2xx response acknowledges every event in it, and a 4xx other
+    than 408 or 429 rejects them all; anything else is retried later. At most
+    max_in_flight requests run at once, each on a kept-alive connection, or
+    as streams of one HTTP/2 connection when the h2 package is installed.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_in_flight: int = 4,
+        compress: bool = False,
+        http2: bool = True,
+        timeout: float = 10.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """Initialize the sender.
+
+        Args:
+            endpoint: URL the batches are posted to
+            max_in_flight: Requests sent concurrently
+            compress: Whether to gzip payloads
+            http2: Whether to negotiate HTTP/2; requires the h2 package
+            timeout: Seconds before a request fails
+            transport: Transport to send through instead of the network
+        """
+        self.endpoint = endpoint
+        self.max_in_flight = max_in_flight
+        self.compress = compress
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("http2_unavailable", reason="h2 is not installed, install metrum[http2]")
+            http2 = False
+        self.http2 = http2
+        self.timeout = timeout
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use so the client and semaphore belong to the
+        # running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight,
+                    max_keepalive_connections=self.max_in_flight,
+                ),
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._client
+
+    def encode(
+        self,
+        events: List[LogEvent],
+        plans: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> Tuple[bytes, Dict[str, str]]:
+        """Serialize a batch and the plan trees of its events into a request body and its headers."""
+        plans = plans or [None] * len(events)
+        body = json.dumps({"events": [event_payload(event, plan) for event, plan in zip(events, plans)]}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.compress and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    async def send(
+        self,
+        events: List[LogEvent],
+        plans: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> Optional[bool]:
+        """Post a batch of events.
+
+        Args:
+            events: Events to send
+            plans: Whole plan tree of each event, or None for events
+                without one. Defaults to none at all
+
+        Returns:
+            True if the endpoint acknowledged the batch, False if it rejected
+            it, or None if it could not be delivered and should be retried
+        """
+        client = self._get_client()
+        body, headers = self.encode(events, plans)
+        async with self._semaphore:
+            try:
+                response = await client.post(self.endpoint, content=body, headers=headers)
+            except Exception as e:
+                logger.error("event_batch_send_error",
+                           error=str(e),
+                           event_count=len(events),
+                           exc_info=True)
+                return None
+        logger.debug("event_batch_send_result",
+                   success=response.is_success,
+                   status_code=response.status_code,
+                   event_count=len(events),
+                   body_bytes=len(body),
+                   http_version=response.http_version)
+        if response.is_success:
+            return True
+        if response.is_client_error and response.status_code not in RETRY_STATUS_CODES:
+            return False
+        return None
+
+    async def aclose(self) -> None:
+        """Close the pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
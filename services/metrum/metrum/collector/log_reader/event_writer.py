@@ -0,0 +1,228 @@
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+from metrum.common.logger import logger
+from metrum.db.models import Event, LogEvent
+from metrum.db.text_codec import text_codec
+from .checkpoint import Checkpoint, CheckpointStore
+from .outbox import outbox_entry
+from .plan_store import PlanStore, split_plan
+
+# Columns filled from the log; the rest take their defaults
+EVENT_COLUMNS = (
+    "timestamp", "query_text", "explain_text", "duration_ms", "fingerprint", "query_id", "pattern_name", "pattern_names",
+    "plan_id", "plan_stats",
+)
+
+# COPY takes JSON columns as text
+_JSON_COLUMNS = ("pattern_names", "plan_stats")
+
+# Columns COPY writes compressed by text_codec, as CompressedText does
+_COMPRESSED_COLUMNS = ("query_text", "explain_text")
+
+_COPY_EVENTS = f"COPY {LogEvent.__tablename__} (id, {', '.join(EVENT_COLUMNS)}) FROM STDIN"
+
+_OUTBOX_COLUMNS = ("event_type", "payload", "status", "attempts", "next_attempt_at", "created_at", "updated_at")
+
+_COPY_OUTBOX = f"COPY {Event.__tablename__} ({', '.join(_OUTBOX_COLUMNS)}) FROM STDIN"
+
+# COPY cannot return generated keys, so they are taken from the sequence first
+_NEXT_EVENT_IDS = text(
+    f"SELECT nextval(pg_get_serial_sequence('{LogEvent.__tablename__}', 'id')) FROM generate_series(1, :count)"
+)
+
+
+def event_row(event: LogEvent) -> Dict[str, Any]:
+    """Column values of an event, for insert_events."""
+    return {column: getattr(event, column) for column in EVENT_COLUMNS}
+
+
+def _event_values(session: Session, rows: List[Dict[str, Any]], plans: PlanStore) -> List[Dict[str, Any]]:
+    """Column values of rows, with their plan trees replaced by a plan id and figures.
+
+    The plan's shape is stored once in the plans table, with the first
+    explain text seen for it. Each event keeps its own explain text, as the
+    shape and figures leave out parts of the plan, such as costs and
+    output columns. Query and explain text are compressed with the current
+    dictionary of the database.
+    """
+    text_codec.load(session)
+    encode = text_codec.encode
+    split = {}
+    shapes = {}
+    for index, row in enumerate(rows):
+        if row.get("plan"):
+            digest, shape, stats = split_plan(row["plan"])
+            split[index] = (digest, stats)
+            if digest not in shapes:
+                explain_text = row.get("explain_text")
+                shapes[digest] = (shape, encode(explain_text) if explain_text is not None else None)
+    ids = plans.resolve(session, shapes) if shapes else {}
+
+    values = []
+    for index, row in enumerate(rows):
+        columns = {column: row.get(column) for column in EVENT_COLUMNS}
+        if index in split:
+            digest, stats = split[index]
+            columns.update(plan_id=ids[digest], plan_stats=stats)
+        for column in _COMPRESSED_COLUMNS:
+            if columns[column] is not None:
+                columns[column] = encode(columns[column])
+        values.append(columns)
+    return values
+
+
+def insert_events(session: Session, rows: List[Dict[str, Any]], plans: Optional[PlanStore] = None) -> List[int]:
+    """Insert event rows and queue them for delivery, in the session's transaction.
+
+    PostgreSQL through psycopg 3 gets a COPY per table. Other databases get
+    an executemany per table, which SQLAlchemy sends as multi-row INSERTs
+    where the driver supports them.
+
+    Args:
+        session: Session to insert in
+        rows: Column values keyed by EVENT_COLUMNS, and the plan tree under
+            plan, which is stored by shape
+        plans: Store of plan shapes. Defaults to one without cached ids
+
+    Returns:
+        Ids of the inserted events, in the order of rows
+    """
+    if not rows:
+        return []
+    rows = _event_values(session, rows, plans or PlanStore())
+    connection = session.connection()
+    now = datetime.utcnow()
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg":
+        ids = list(connection.execute(_NEXT_EVENT_IDS, {"count": len(rows)}).scalars())
+        with connection.connection.dbapi_connection.cursor() as cursor:
+            with cursor.copy(_COPY_EVENTS) as copy:
+                write_row = copy.write_row
+                for event_id, row in zip(ids, rows):
+                    values = [event_id, *(
+                        json.dumps(row[column]) if column in _JSON_COLUMNS and row[column] is not None
+                        else row[column]
+                        for column in EVENT_COLUMNS
+                    )]
+                    write_row(values)
+            with cursor.copy(_COPY_OUTBOX) as copy:
+                for event_id in ids:
+                    entry = outbox_entry(event_id, now)
+                    entry["payload"] = json.dumps(entry["payload"])
+                    entry["status"] = entry["status"].name
+                    copy.write_row([entry[column] for column in _OUTBOX_COLUMNS])
+    else:
+        ids = list(session.execute(
+            insert(LogEvent).returning(LogEvent.id, sort_by_parameter_order=True), rows
+        ).scalars())
+        session.execute(insert(Event), [outbox_entry(event_id, now) for event_id in ids])
+    return ids
+
+
+class EventWriter:
+    """Group-commits events together with their log checkpoint.
+
+    Events are buffered until max_events are waiting or the oldest has waited
+    max_delay seconds, then written in one transaction that also moves the
+    checkpoint to the last batch added, so the offset never runs ahead of
+    the stored events or behind them.
+    """
+
+    def __init__(
+        self,
+        engine,
+        checkpoints: CheckpointStore,
+        max_events: int = 500,
+        max_delay: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the writer.
+
+        Args:
+            engine: SQLAlchemy engine of metrum's database
+            checkpoints: Store the checkpoints are saved with
+            max_events: Buffered events that trigger a flush
+            max_delay: Seconds after which buffered events are flushed
+            clock: Monotonic clock, in seconds
+        """
+        self.engine = engine
+        self.checkpoints = checkpoints
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.clock = clock
+        self._rows: List[Dict[str, Any]] = []
+        # Last checkpoint of each file, as a batch of events may span a rotation
+        self._checkpoints: Dict[Path, Checkpoint] = {}
+        self._since: Optional[float] = None
+        self.plans = PlanStore()
+
+    @property
+    def buffered(self) -> bool:
+        """Whether events or a checkpoint are waiting to be written."""
+        return self._since is not None
+
+    def add(self, events: List[Dict[str, Any]], checkpoint: Optional[Checkpoint] = None) -> None:
+        """Buffer the events of a batch and the checkpoint it ends at.
+
+        Args:
+            events: Events completed by the batch, in file order, as rows
+                for insert_events
+            checkpoint: Checkpoint after the batch, if any
+        """
+        if self._since is None:
+            self._since = self.clock()
+        self._rows.extend(events)
+        if checkpoint is not None:
+            self._checkpoints[checkpoint.path] = checkpoint
+
+    def due(self) -> bool:
+        """Whether the buffer should be flushed now."""
+        return self._since is not None and (
+            len(self._rows) >= self.max_events or self.clock() - self._since >= self.max_delay
+        )
+
+    def time_until_due(self) -> Optional[float]:
+        """Seconds until the buffer is due, or None while it is empty."""
+        if self._since is None:
+            return None
+        return max(self._since + self.max_delay - self.clock(), 0.0)
+
+    def flush(self) -> int:
+        """Write the buffered events and the checkpoint of each file in one transaction.
+
+        The buffer is kept if the transaction fails, so the flush can be
+        retried.
+
+        Returns:
+            Number of events written
+        """
+        if self._since is None:
+            return 0
+        rows, checkpoints = self._rows, list(self._checkpoints.values())
+        with Session(self.engine) as session:
+            insert_events(session, rows, self.plans)
+            for checkpoint in checkpoints:
+                if checkpoint.identity is not None:
+                    self.checkpoints.save(
+                        session,
+                        checkpoint.path,
+                        checkpoint.identity,
+                        checkpoint.resume_offset,
+                        checkpoint.committed_offset,
+                    )
+            session.commit()
+        logger.debug("committed_log_checkpoint",
+                   event_count=len(rows),
+                   files=[str(checkpoint.path) for checkpoint in checkpoints],
+                   resume_offset=checkpoints[-1].resume_offset if checkpoints else None,
+                   committed_offset=checkpoints[-1].committed_offset if checkpoints else None)
+        self._rows = []
+        self._checkpoints = {}
+        self._since = None
+        return len(rows)
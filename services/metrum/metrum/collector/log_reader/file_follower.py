@@ -0,0 +1,280 @@
+import asyncio
+import ctypes
+import ctypes.util
+import io
+import os
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+from metrum.common.logger import logger
+from .compressed_log import COMPRESSED_SUFFIXES
+
+# inotify(7) flags
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+)
+
+
+def _inotify_watch(directory: Path) -> Optional[int]:
+    """Open an inotify descriptor watching a directory, or None if inotify is unavailable."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        init = libc.inotify_init1
+        add_watch = libc.inotify_add_watch
+    except (OSError, AttributeError) as e:
+        logger.debug("inotify_unavailable", error=str(e))
+        return None
+
+    fd = init(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        logger.debug("inotify_init_failed", errno=ctypes.get_errno())
+        return None
+    if add_watch(fd, os.fsencode(str(directory)), _WATCH_MASK) < 0:
+        logger.debug("inotify_add_watch_failed", directory=str(directory), errno=ctypes.get_errno())
+        os.close(fd)
+        return None
+    return fd
+
+
+class FileWatcher:
+    """Waits for changes in a log directory.
+
+    On Linux the directory is watched with inotify, so waiting costs no CPU
+    until a file in it is written, created, moved or deleted. Elsewhere, or
+    when inotify cannot be set up, waiting falls back to sleeping for
+    poll_interval.
+    """
+
+    def __init__(self, directory: Path, poll_interval: float = 1.0, use_inotify: bool = True):
+        """Initialize the watcher.
+
+        Args:
+            directory: Directory containing the log files
+            poll_interval: Seconds between checks when inotify is not available
+            use_inotify: Whether to try inotify at all
+        """
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._fd = _inotify_watch(directory) if use_inotify else None
+        logger.debug("initialized_file_watcher",
+                    directory=str(directory),
+                    inotify=self._fd is not None,
+                    poll_interval=poll_interval)
+
+    @property
+    def uses_inotify(self) -> bool:
+        """Whether changes are detected with inotify rather than polling."""
+        return self._fd is not None
+
+    async def wait(self, timeout: float) -> None:
+        """Wait until something in the directory changes.
+
+        Args:
+            timeout: Maximum number of seconds to wait
+        """
+        if self._fd is None:
+            await asyncio.sleep(min(timeout, self.poll_interval))
+            return
+
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+
+        def on_readable() -> None:
+            if not changed.done():
+                changed.set_result(None)
+
+        loop.add_reader(self._fd, on_readable)
+        try:
+            await asyncio.wait_for(changed, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self._fd)
+        self._drain()
+
+    def _drain(self) -> None:
+        """Discard queued inotify events; callers re-check the files themselves."""
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        """Stop watching the directory."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class LogFileFollower:
+    """Reads complete lines from a log file and follows it across rotation.
+
+    When no new data is available, the follower checks whether the file was
+    truncated (reading restarts at offset 0), replaced by a new file at the
+    same path, or superseded by the next file matching pattern. The open
+    handle is drained to EOF before the follower switches files.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        pattern: Optional[str] = None,
+        position: int = 0,
+        max_bytes: Optional[int] = None,
+        max_lines: Optional[int] = None,
+        start_position: Optional[Callable[[Path], Tuple[int, Optional[int]]]] = None,
+    ):
+        """Initialize the follower.
+
+        Args:
+            path: Log file to start with
+            pattern: Glob for log files in the same directory. Without it the
+                follower never switches to another file
+            position: Offset to start reading at
+            max_bytes: Most bytes returned by one read; a single longer line
+                is still returned whole. Unbounded by default
+            max_lines: Most lines returned by one read. Unbounded by default
+            start_position: Called with each file the follower switches to;
+                returns the offset to start reading it at, and an offset
+                the first read stops at or None. Files are read from their
+                start by default
+        """
+        self.path = path
+        self.pattern = pattern
+        self.position = position
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.start_position = start_position
+        # Incremented whenever reading switches files or restarts after truncation
+        self.rotations = 0
+        # Whether the last read stopped at max_bytes or max_lines
+        self.backlogged = False
+        self._file: Optional[BinaryIO] = None
+        # Offset the first read of a file just switched to stops at
+        self._switch_end: Optional[int] = None
+
+    def read_lines(self, end: Optional[int] = None) -> List[str]:
+        """Read complete new lines, following rotation when the file is drained.
+
+        A trailing line that is still being written is left for the next
+        read, so position always ends on a line boundary. At most max_bytes
+        and max_lines are read at once; backlogged tells whether more lines
+        were already waiting.
+
+        Args:
+            end: Offset to stop reading at. Rotation is not followed when set
+
+        Returns:
+            The new lines, including their newlines
+        """
+        lines = self._read(end)
+        if lines or end is not None:
+            return lines
+        if self._follow_rotation():
+            end, self._switch_end = self._switch_end, None
+            return self._read(end)
+        return []
+
+    def fileno(self) -> Optional[int]:
+        """File descriptor of the open log file, if any."""
+        return self._file.fileno() if self._file is not None else None
+
+    def close(self) -> None:
+        """Close the open log file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> bool:
+        if self._file is None:
+            try:
+                self._file = self.path.open("rb")
+            except OSError as e:
+                logger.debug("failed_to_open_log_file", file=str(self.path), error=str(e))
+                return False
+        return True
+
+    def _read(self, end: Optional[int]) -> List[str]:
+        self.backlogged = False
+        if not self._open():
+            return []
+        f = self._file
+        f.seek(self.position)
+        limit = None if end is None else max(end - self.position, 0)
+        bounded = self.max_bytes is not None and (limit is None or self.max_bytes < limit)
+        if bounded:
+            limit = self.max_bytes
+        data = f.read() if limit is None else f.read(limit)
+        complete = data.rfind(b"\n") + 1
+        if bounded and len(data) == limit:
+            if not complete:
+                # A single line longer than max_bytes is returned whole
+                rest = f.readline() if end is None else f.readline(end - self.position - len(data))
+                data += rest
+                complete = len(data) if rest.endswith(b"\n") else 0
+            self.backlogged = complete > 0
+        if not complete:
+            return []
+        if self.max_lines is not None and data.count(b"\n", 0, complete) > self.max_lines:
+            complete = len(data) - len(data.split(b"\n", self.max_lines)[-1])
+            self.backlogged = True
+        self.position += complete
+        return io.StringIO(data[:complete].decode("utf-8", errors="replace"), newline="\n").readlines()
+
+    def _follow_rotation(self) -> bool:
+        """Switch files or rewind after rotation or truncation.
+
+        Called once the current file has been read to EOF. Returns whether
+        reading should continue from a new position right away.
+        """
+        if self._file is None:
+            return False
+        opened = os.fstat(self._file.fileno())
+        if opened.st_size < self.position:
+            logger.info("log_file_truncated", file=str(self.path), size=opened.st_size, position=self.position)
+            self.position = 0
+            self.rotations += 1
+            return True
+
+        try:
+            current = self.path.stat()
+        except FileNotFoundError:
+            current = None
+        if current is None or (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev):
+            following = self.path if current is not None else self._next_file()
+        else:
+            following = self._next_file()
+        if following is None:
+            return False
+        # Lines written to the old file since it was read are drained first
+        if os.fstat(self._file.fileno()).st_size != opened.st_size:
+            return False
+        logger.info("log_file_rotated", file=str(self.path), next_file=str(following))
+        self.close()
+        self.path = following
+        if self.start_position is not None:
+            self.position, self._switch_end = self.start_position(following)
+        else:
+            self.position = 0
+        self.rotations += 1
+        return True
+
+    def _next_file(self) -> Optional[Path]:
+        """The first uncompressed file matching pattern that sorts after the current one."""
+        if self.pattern is None:
+            return None
+        newer = [
+            candidate for candidate in self.path.parent.glob(self.pattern)
+            if candidate.name > self.path.name and candidate.suffix not in COMPRESSED_SUFFIXES
+        ]
+        return min(newer) if newer else None
@@ -1,30 +1,83 @@
-import asyncio
-from datetime import datetime
+import io
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import AsyncGenerator, Optional
-from metrum.common.logger import logger
+from typing import AsyncGenerator, BinaryIO, Iterator, Optional
+from metrum.common.logger import debug_enabled, logger
 from metrum.settings import settings
 from .log_reader import LogReader
+from .file_follower import FileWatcher, LogFileFollower
+from .log_line_prefix import DEFAULT_LOG_LINE_PREFIX, LogLinePrefix
+from .compressed_log import COMPRESSED_SUFFIXES, detect_compression, open_log_file
+from .log_scanner import open_scanner
+from .time_range import (
+    STRUCTURED_TIMESTAMP_PREFIXES,
+    LineTimestamps,
+    first_timestamp,
+    last_timestamp,
+    seek_time,
+)
+from .structured_log import LogRecord, create_record_parser
+
+# Seconds between checks for new lines when inotify is not available
+TAIL_POLL_INTERVAL = 0.1
+# Upper bound on an inotify wait, as a safety net for missed events
+TAIL_WAIT_TIMEOUT = 60.0
+
+# File name patterns PostgreSQL's logging collector uses for each format
+DEFAULT_LOG_PATTERNS = {
+    "stderr": "*.log",
+    "csvlog": "*.csv",
+    "jsonlog": "*.json",
+}
 
 class FileLogReader(LogReader):
     """PostgreSQL log reader for filesystem-based logs."""
 
-    def __init__(self, logs_dir: Optional[Path] = None, pattern: Optional[str] = None):
+    def __init__(
+        self,
+        logs_dir: Optional[Path] = None,
+        pattern: Optional[str] = None,
+        log_format: Optional[str] = None,
+        log_line_prefix: Optional[LogLinePrefix] = None,
+    ):
         """Initialize the log reader.
         
         Args:
             logs_dir: Directory containing log files. Defaults to settings.logs_dir
-            pattern: Log file pattern. Defaults to settings.log_pattern
+            pattern: Log file pattern. Defaults to settings.log_pattern, or the
+                collector's file extension for the log format
+            log_format: stderr, csvlog or jsonlog. Defaults to settings.log_format
+            log_line_prefix: Parser for the server's log_line_prefix, used to
+                find line timestamps in stderr logs. Defaults to
+                settings.log_line_prefix or PostgreSQL's default
         """
         self.logs_dir = (logs_dir or settings.logs_dir).absolute()
-        self.pattern = pattern or settings.log_pattern
+        self.log_format = log_format or settings.log_format
+        self.pattern = pattern or settings.log_pattern or DEFAULT_LOG_PATTERNS[self.log_format]
+        if self.log_format in STRUCTURED_TIMESTAMP_PREFIXES:
+            log_line_prefix = LogLinePrefix(STRUCTURED_TIMESTAMP_PREFIXES[self.log_format])
+        self.log_line_prefix = log_line_prefix or LogLinePrefix(settings.log_line_prefix or DEFAULT_LOG_LINE_PREFIX)
         logger.debug("initialized_log_reader", 
                     logs_dir=str(self.logs_dir),
-                    pattern=self.pattern)
+                    pattern=self.pattern,
+                    log_format=self.log_format)
 
-    def get_log_files(self) -> list[Path]:
-        """Get all matching log files in the logs directory."""
-        log_files = sorted(self.logs_dir.glob(self.pattern))
+    def get_log_files(self, include_compressed: bool = True) -> list[Path]:
+        """Get all matching log files in the logs directory.
+
+        Args:
+            include_compressed: Whether to include rotated files that were
+                compressed in place. They can be read whole but not
+                followed, so callers that tail or follow leave them out
+        """
+        log_files = set(self.logs_dir.glob(self.pattern))
+        if include_compressed:
+            for suffix in COMPRESSED_SUFFIXES:
+                log_files.update(self.logs_dir.glob(self.pattern + suffix))
+        else:
+            # A pattern may also match compressed files, e.g. "postgresql*"
+            log_files = {path for path in log_files if path.suffix not in COMPRESSED_SUFFIXES}
+        log_files = sorted(log_files)
         logger.debug("found_log_files",
                     count=len(log_files),
                     files=[str(f) for f in log_files])
@@ -32,29 +85,36 @@ class FileLogReader(LogReader):
 
     async def tail(self, file: Path) -> AsyncGenerator[str, None]:
         """Tail a log file and yield new lines.
+
+        Rotation to newer files matching the reader's pattern, replacement
+        and truncation are followed. The reader sleeps on inotify while the
+        log is idle, or polls where inotify is not available.
         
         Args:
             file: Path to the log file to tail
         
         Yields:
-            New lines from the log file
+            New lines from the log file and the files that follow it
         """
         logger.debug("starting_file_tail", file=str(file))
-        with file.open() as f:
-            # Seek to end of file
-            f.seek(0, 2)
-            current_position = f.tell()
-            logger.debug("tail_initial_position", position=current_position)
-            
+        follower = LogFileFollower(file, pattern=self.pattern, position=file.stat().st_size)
+        watcher = FileWatcher(file.parent, poll_interval=TAIL_POLL_INTERVAL)
+        logger.debug("tail_initial_position", position=follower.position)
+        try:
             while True:
-                line = f.readline()
-                if not line:
-                    await asyncio.sleep(0.1)  # Avoid busy waiting
+                lines = follower.read_lines()
+                if not lines:
+                    await watcher.wait(TAIL_WAIT_TIMEOUT)
                     continue
-                logger.debug("tail_new_line", 
-                           file=str(file),
-                           line_length=len(line))
-                yield line.rstrip()
+                if debug_enabled():
+                    logger.debug("tail_new_lines",
+                               file=str(follower.path),
+                               count=len(lines))
+                for line in lines:
+                    yield line.rstrip()
+        finally:
+            watcher.close()
+            follower.close()
 
     async def read_logs(
         self,
@@ -86,19 +146,118 @@ class FileLogReader(LogReader):
             raise FileNotFoundError(error_msg)
 
         if follow:
-            # When following, only tail the most recent log file
-            latest_log = log_files[-1]
+            # When following, only tail the most recent uncompressed log file
+            plain_files = self.get_log_files(include_compressed=False)
+            if not plain_files:
+                raise FileNotFoundError(f"No uncompressed log files found matching {self.pattern} in {self.logs_dir}")
+            latest_log = plain_files[-1]
             logger.info("following_latest_log", file=str(latest_log))
             async for line in self.tail(latest_log):
                 yield line
+        elif (start_time or end_time) and self.log_line_prefix.has_timestamp:
+            timestamp_of = LineTimestamps(self.log_line_prefix)
+            for log_file in log_files:
+                for line in self._read_time_range(log_file, start_time, end_time, timestamp_of):
+                    yield line
         else:
             # Read all matching files
             for log_file in log_files:
                 logger.debug("reading_log_file", file=str(log_file))
-                with log_file.open() as f:
-                    for line in f:
-                        # TODO: Parse timestamp and filter by start_time/end_time
-                        logger.debug("read_line", 
-                                   file=str(log_file),
-                                   line_length=len(line))
-                        yield line.rstrip() 
\ No newline at end of file
+                with open_scanner(log_file) as scanner:
+                    for offset, lines in scanner.line_batches():
+                        if debug_enabled():
+                            logger.debug("read_lines",
+                                       file=str(log_file),
+                                       offset=offset,
+                                       count=len(lines))
+                        for line in lines:
+                            yield line.rstrip()
+
+    def _read_time_range(
+        self,
+        log_file: Path,
+        start_time: Optional[datetime],
+        end_time: Optional[datetime],
+        timestamp_of: LineTimestamps,
+    ) -> Iterator[str]:
+        """Read the lines of a file logged between start_time and end_time.
+
+        Files are skipped by modification time and by their first and last
+        timestamps, the start is found by binary search on byte offsets and
+        reading stops at the first line after end_time. Compressed files
+        cannot be searched and are read from the start. Continuation lines
+        belong to the timestamp of the line they continue.
+        """
+        stat = log_file.stat()
+        modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc).replace(tzinfo=None)
+        if start_time and modified < start_time:
+            logger.debug("skipped_log_file", file=str(log_file), reason="modified_before_start")
+            return
+
+        if detect_compression(log_file) is not None:
+            # Compressed files cannot be searched, but reading still stops
+            # at the first line after end_time
+            logger.debug("reading_compressed_log_file", file=str(log_file))
+            with open_log_file(log_file) as f:
+                yield from _lines_in_range(f, start_time, end_time, timestamp_of)
+            return
+
+        with log_file.open("rb") as f:
+            first, _, _ = first_timestamp(f, 0, stat.st_size, timestamp_of)
+            if end_time and first and first > end_time:
+                logger.debug("skipped_log_file", file=str(log_file), reason="starts_after_end")
+                return
+            offset = 0
+            if start_time:
+                last = last_timestamp(f, stat.st_size, timestamp_of)
+                if last and last < start_time:
+                    logger.debug("skipped_log_file", file=str(log_file), reason="ends_before_start")
+                    return
+                offset = seek_time(f, stat.st_size, start_time, timestamp_of)
+            logger.debug("reading_log_file", file=str(log_file), offset=offset)
+
+            f.seek(offset)
+            yield from _lines_in_range(f, start_time, end_time, timestamp_of)
+
+    async def read_records(self) -> AsyncGenerator[LogRecord, None]:
+        """Read structured records from all matching csvlog or jsonlog files.
+
+        Yields:
+            One record per logged message, with multi-line fields intact
+
+        Raises:
+            ValueError: If the reader is configured for stderr logs
+        """
+        for log_file in self.get_log_files():
+            logger.debug("reading_log_records", file=str(log_file))
+            parser = create_record_parser(self.log_format)
+            with io.TextIOWrapper(open_log_file(log_file), encoding="utf-8", errors="replace", newline="") as f:
+                while True:
+                    lines = f.readlines(1 << 20)
+                    if not lines:
+                        break
+                    for record in parser.feed(lines):
+                        yield record
+
+
+def _lines_in_range(
+    f: BinaryIO,
+    start_time: Optional[datetime],
+    end_time: Optional[datetime],
+    timestamp_of: LineTimestamps,
+) -> Iterator[str]:
+    """Yield the lines of a stream logged between start_time and end_time.
+
+    Continuation lines belong to the timestamp of the line they continue,
+    and reading stops at the first line after end_time.
+    """
+    current = None
+    for line in f:
+        timestamp = timestamp_of(line)
+        if timestamp is not None:
+            if end_time and timestamp > end_time:
+                return
+            current = timestamp
+        if start_time and (current is None or current < start_time):
+            continue
+        yield line.decode("utf-8", errors="replace").rstrip()
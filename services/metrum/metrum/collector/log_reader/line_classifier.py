@@ -0,0 +1,130 @@
+from enum import Enum
+from typing import NamedTuple, Optional
+
+from .log_line_prefix import SEVERITIES, LogLinePrefix
+
+
+class LineKind(str, Enum):
+    """Kind of message that starts on a prefixed PostgreSQL log line."""
+    QUERY = "query"
+    EXPLAIN = "explain"
+    TEMP_FILE = "temp_file"
+    MESSAGE = "message"
+
+
+class LogLine(NamedTuple):
+    """A prefixed log line tokenized into prefix, severity, message kind and payload.
+
+    Attributes:
+        kind: Message kind of the line
+        timestamp: Raw timestamp token from the prefix, including its zone
+        prefix: The log_line_prefix text of the line
+        severity: Severity label (LOG, ERROR, ...)
+        payload: Statement text for queries, plan text for explain lines and
+            the message for everything else
+        duration_ms: Duration reported on explain lines
+        pid: Backend process ID ("%p") from the prefix
+        session_id: Session ID ("%c") from the prefix, when known
+        user: User name ("%u") from the prefix, when known
+        database: Database name ("%d") from the prefix, when known
+        application: Application name ("%a") from the prefix, when known
+        query_id: Query identifier ("%Q") from the prefix, when known
+    """
+    kind: LineKind
+    timestamp: Optional[str]
+    prefix: str
+    severity: str
+    payload: str
+    duration_ms: Optional[float] = None
+    pid: Optional[str] = None
+    session_id: Optional[str] = None
+    user: Optional[str] = None
+    database: Optional[str] = None
+    application: Optional[str] = None
+    query_id: Optional[str] = None
+
+
+# Enum attribute access and the generated NamedTuple constructor are
+# measurable on the per-line path, so both are resolved once here.
+_QUERY = LineKind.QUERY
+_EXPLAIN = LineKind.EXPLAIN
+_TEMP_FILE = LineKind.TEMP_FILE
+_MESSAGE = LineKind.MESSAGE
+_new_line = tuple.__new__
+
+
+class LineClassifier:
+    """Single-pass classifier for PostgreSQL stderr log lines.
+
+    The log_line_prefix is parsed by a LogLinePrefix compiled for the
+    server's configured prefix, the severity must follow the prefix directly
+    and the message kind is decided from the start of the payload. No
+    regular expressions run per line, and continuation lines are rejected
+    after a couple of character comparisons.
+    """
+
+    def __init__(self, prefix: Optional[LogLinePrefix] = None):
+        """Initialize the classifier.
+
+        Args:
+            prefix: Parser for the server's log_line_prefix. Defaults to
+                PostgreSQL's default prefix
+        """
+        self.prefix = prefix or LogLinePrefix()
+        self._parse_prefix = self.prefix.parse
+
+    def classify(self, line: str) -> Optional[LogLine]:
+        """Tokenize a log line.
+
+        Args:
+            line: Raw log line, with or without its trailing newline
+
+        Returns:
+            The classified line, or None if the line has no log_line_prefix
+            and therefore continues the previous message
+        """
+        fields = self._parse_prefix(line)
+        if fields is None:
+            return None
+        end, timestamp, pid, session_id, user, database, application, query_id = fields
+        separator = line.find(":  ", end)
+        if separator < 0:
+            return None
+        severity = line[end:separator]
+        if severity not in SEVERITIES:
+            return None
+
+        prefix = line[:end]
+        payload = line[separator + 3:].rstrip("\r\n")
+        kind = _MESSAGE
+        duration = None
+        if severity == "LOG":
+            if payload.startswith("execute "):
+                # "execute <name>: <statement>"
+                kind = _QUERY
+                statement_at = payload.find(": ", 8)
+                if statement_at >= 0:
+                    payload = payload[statement_at + 2:]
+            elif payload.startswith("duration: "):
+                plan_at = payload.find("  plan:", 10)
+                if plan_at >= 0:
+                    kind = _EXPLAIN
+                    duration = _parse_duration(payload, plan_at)
+                    payload = payload[plan_at + 7:].lstrip()
+            elif payload.startswith("temporary file: "):
+                kind = _TEMP_FILE
+        return _new_line(LogLine, (
+            kind, timestamp, prefix, severity, payload, duration,
+            pid, session_id, user, database, application, query_id,
+        ))
+
+
+def _parse_duration(payload: str, end: int) -> Optional[float]:
+    """Parse the value of a "duration: <n> ms" message ending before end."""
+    unit_at = payload.find(" ms", 10, end)
+    if unit_at < 0:
+        return None
+    try:
+        return float(payload[10:unit_at])
+    except ValueError:
+        return None
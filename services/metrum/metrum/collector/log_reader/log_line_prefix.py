@@ -0,0 +1,309 @@
+import re
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import text
+
+from metrum.common.logger import logger
+
+# PostgreSQL's default log_line_prefix since version 10
+DEFAULT_LOG_LINE_PREFIX = "%m [%p] "
+
+SEVERITIES = frozenset({
+    "DEBUG1", "DEBUG2", "DEBUG3", "DEBUG4", "DEBUG5", "LOG", "INFO", "NOTICE",
+    "WARNING", "ERROR", "FATAL", "PANIC", "STATEMENT", "DETAIL", "HINT",
+    "CONTEXT", "QUERY", "LOCATION",
+})
+
+# Prefix escapes whose values are exposed on parsed lines
+_FIELD_ESCAPES = {
+    "m": "timestamp",
+    "t": "timestamp",
+    "n": "timestamp",
+    "p": "pid",
+    "c": "session_id",
+    "u": "user",
+    "d": "database",
+    "a": "application",
+    "Q": "query_id",
+}
+
+# Regular expressions used when a prefix cannot be parsed positionally
+# Zone of a timestamp: an abbreviation, or a numeric offset where the zone
+# has none. Minutes of an offset are only taken when what follows needs it,
+# so a %p or %l right after the zone keeps its digits
+_ZONE_PATTERN = r"(?: (?:[A-Z]+|[+-]\d\d(?::?\d\d)??))?"
+
+_ESCAPE_PATTERNS = {
+    "m": r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3}" + _ZONE_PATTERN,
+    "t": r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d" + _ZONE_PATTERN,
+    "s": r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d" + _ZONE_PATTERN,
+    "n": r"\d+\.\d{3}",
+    "p": r"\d+",
+    "P": r"\d*",
+    "l": r"\d+",
+    "c": r"[0-9a-f]+\.[0-9a-f]+",
+    "Q": r"-?\d+",
+    "e": r"[0-9A-Z]{5}",
+    "x": r"\d+",
+    "v": r"[0-9/]*",
+}
+
+_ESCAPE_RE = re.compile(r"%(-?\d*)(.)", re.S)
+
+
+class PrefixFields(NamedTuple):
+    """Values extracted from the log_line_prefix of one line.
+
+    Attributes:
+        end: Offset of the first character after the prefix
+        timestamp: Raw %m, %t or %n timestamp token, including its zone
+        pid: Backend process ID (%p)
+        session_id: Session ID (%c)
+        user: User name (%u)
+        database: Database name (%d)
+        application: Application name (%a)
+        query_id: Query identifier (%Q), unless the server computed none
+    """
+    end: int
+    timestamp: Optional[str]
+    pid: Optional[str]
+    session_id: Optional[str]
+    user: Optional[str]
+    database: Optional[str]
+    application: Optional[str]
+    query_id: Optional[str] = None
+
+
+Segment = Tuple[str, str, int]
+
+
+class LogLinePrefix:
+    """Parser specialized for one PostgreSQL log_line_prefix.
+
+    The prefix is compiled once into straight-line Python code: fields at a
+    known offset are sliced out, every other field is delimited with a
+    single str.find for the literal text that follows it, and fixed-width
+    timestamps are validated with a few character comparisons. Prefixes with
+    a field that is not followed by literal text fall back to a regular
+    expression.
+    """
+
+    def __init__(self, prefix: str = DEFAULT_LOG_LINE_PREFIX):
+        """Compile a parser for a log_line_prefix.
+
+        Args:
+            prefix: Value of the log_line_prefix setting
+        """
+        self.prefix = prefix
+        self.segments = _tokenize(prefix)
+        self.source: Optional[str] = _generate_source(self.segments)
+        if self.source is not None:
+            namespace = {"SEVERITIES": SEVERITIES, "PrefixFields": PrefixFields, "_new": tuple.__new__}
+            exec(compile(self.source, f"<log_line_prefix {prefix!r}>", "exec"), namespace)
+            self.parse: Callable[[str], Optional[PrefixFields]] = namespace["parse"]
+        else:
+            self.parse = _regex_parser(self.segments)
+        logger.debug("compiled_log_line_prefix",
+                    prefix=prefix,
+                    positional=self.source is not None)
+
+    def __repr__(self) -> str:
+        return f"LogLinePrefix({self.prefix!r})"
+
+    @property
+    def has_timestamp(self) -> bool:
+        """Whether lines carry a timestamp in their prefix."""
+        return any(kind == "field" and value in "mtn" for kind, value, _ in self.segments)
+
+    @classmethod
+    def from_config_file(cls, path: Union[str, Path]) -> "LogLinePrefix":
+        """Build a parser from the log_line_prefix set in a postgresql.conf.
+
+        Args:
+            path: Path to the configuration file
+
+        Returns:
+            A parser for the configured prefix, or for PostgreSQL's default
+            prefix if the file does not set one
+        """
+        value = read_config_setting(Path(path), "log_line_prefix")
+        return cls(DEFAULT_LOG_LINE_PREFIX if value is None else value)
+
+    @classmethod
+    def from_connection(cls, conn) -> "LogLinePrefix":
+        """Build a parser from the log_line_prefix of a running server.
+
+        Args:
+            conn: SQLAlchemy connection to the server
+
+        Returns:
+            A parser for the server's prefix
+        """
+        return cls(conn.execute(text("SHOW log_line_prefix")).scalar())
+
+
+def read_config_setting(path: Path, name: str) -> Optional[str]:
+    """Read a setting from a postgresql.conf file.
+
+    Later assignments win, like they do for the server. Included files are
+    not followed.
+
+    Args:
+        path: Path to the configuration file
+        name: Name of the setting
+
+    Returns:
+        The unquoted value, or None if the setting is not set
+    """
+    pattern = re.compile(
+        rf"^\s*{re.escape(name)}\s*=?\s*(?:'((?:[^'\\]|''|\\.)*)'|([^\s#]+))",
+        re.IGNORECASE,
+    )
+    value = None
+    with path.open() as f:
+        for line in f:
+            match = pattern.match(line)
+            if match:
+                quoted, bare = match.groups()
+                if quoted is not None:
+                    value = re.sub(r"''|\\(.)", lambda m: m.group(1) or "'", quoted)
+                else:
+                    value = bare
+    return value
+
+
+def _tokenize(prefix: str) -> List[Segment]:
+    """Split a prefix into ("literal", text, 0), ("field", escape, padding) and ("stop", "q", 0) segments."""
+    segments: List[Segment] = []
+    literal = ""
+    position = 0
+    for match in _ESCAPE_RE.finditer(prefix):
+        literal += prefix[position:match.start()]
+        position = match.end()
+        padding, escape = match.groups()
+        if escape == "%":
+            literal += "%"
+            continue
+        if literal:
+            segments.append(("literal", literal, 0))
+            literal = ""
+        if escape == "q":
+            segments.append(("stop", escape, 0))
+        else:
+            segments.append(("field", escape, int(padding) if padding not in ("", "-") else 0))
+    literal += prefix[position:]
+    if literal:
+        segments.append(("literal", literal, 0))
+    return segments
+
+
+def _generate_source(segments: List[Segment]) -> Optional[str]:
+    """Generate the source of a positional parse() function, or None if the prefix needs a regex."""
+    body = ["def parse(line):"]
+    values = {name: "None" for name in PrefixFields._fields[1:]}
+    position_known = True  # whether pos is still a constant offset
+    offset = 0
+
+    def pos() -> str:
+        return str(offset) if position_known else "pos"
+
+    def result() -> str:
+        # tuple.__new__ skips the Python-level NamedTuple constructor
+        return "_new(PrefixFields, ({}, {}))".format(pos(), ", ".join(values.values()))
+
+    index = 0
+    while index < len(segments):
+        kind, value, padding = segments[index]
+        following = segments[index + 1] if index + 1 < len(segments) else None
+
+        if kind == "literal":
+            body.append(f"    if not line.startswith({value!r}, {pos()}):")
+            body.append("        return None")
+            if position_known:
+                offset += len(value)
+            else:
+                body.append(f"    pos += {len(value)}")
+
+        elif kind == "stop":
+            # Processes without a session stop printing the prefix at %q
+            body.append(f"    separator = line.find(':  ', {pos()})")
+            body.append(f"    if separator >= 0 and line[{pos()}:separator] in SEVERITIES:")
+            body.append(f"        return {result()}")
+
+        else:
+            name = _FIELD_ESCAPES.get(value)
+            variable = f"field_{index}"
+            start = pos()
+            search_from = start
+            if value in "mt" and not padding:
+                # Fixed-width date and time, followed by a variable-width zone
+                width = 23 if value == "m" else 19
+                checks = f"line[{start} + 4] != '-' or line[{start} + 13] != ':'"
+                if value == "m":
+                    checks += f" or line[{start} + 19] != '.'"
+                body.append(f"    if len(line) <= {start} + {width} or {checks}:")
+                body.append("        return None")
+                search_from = f"{start} + {width + 1}"
+
+            if following is not None and following[0] == "literal":
+                delimiter = following[1]
+                body.append(f"    end = line.find({delimiter!r}, {search_from})")
+                body.append("    if end < 0:")
+                body.append("        return None")
+                body.append(f"    {variable} = line[{start}:end]")
+                body.append(f"    pos = end + {len(delimiter)}")
+                index += 1
+            else:
+                return None
+            position_known = False
+
+            if value == "Q":
+                # 0 when compute_query_id is off or the statement has none
+                values[name] = f"None if {variable}.strip() in ('', '0') else {variable}.strip()"
+            elif name is not None:
+                values[name] = f"{variable}.strip()" if padding else f"{variable} or None"
+        index += 1
+
+    body.append(f"    return {result()}")
+    return "\n".join(body) + "\n"
+
+
+def _regex_parser(segments: List[Segment]) -> Callable[[str], Optional[PrefixFields]]:
+    """Build a regex-based parse() for prefixes with adjacent variable-width fields."""
+    parts = []
+    stops = 0
+    for index, (kind, value, _) in enumerate(segments):
+        if kind == "literal":
+            parts.append(re.escape(value))
+        elif kind == "stop":
+            parts.append("(?:")
+            stops += 1
+        else:
+            pattern = _ESCAPE_PATTERNS.get(value, r".*?")
+            group = f"f{index}"
+            parts.append(f"(?P<{group}>{pattern})")
+    # The severity always follows the prefix, which anchors lazy fields
+    severity = "|".join(sorted(SEVERITIES))
+    expression = re.compile("".join(parts) + ")?" * stops + f"(?=(?:{severity}):  )")
+    groups = {
+        _FIELD_ESCAPES[value]: f"f{index}"
+        for index, (kind, value, _) in enumerate(segments)
+        if kind == "field" and value in _FIELD_ESCAPES
+    }
+
+    def parse(line: str) -> Optional[PrefixFields]:
+        match = expression.match(line)
+        if match is None:
+            return None
+        found = match.groupdict()
+        fields = PrefixFields(
+            match.end(),
+            *((found.get(groups[name]) or None) if name in groups else None
+              for name in PrefixFields._fields[1:]),
+        )
+        if fields.query_id == "0":
+            fields = fields._replace(query_id=None)
+        return fields
+
+    return parse
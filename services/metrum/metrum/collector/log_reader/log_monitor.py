@@ -1,188 +1,221 @@
-import re
-import time
-from datetime import datetime
+import asyncio
+import os
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 from metrum.common.logger import logger
 from metrum.db.models import LogEvent
+from .event_builder import EventBuilder
+from .event_sender import EventSender
+from .outbox import Outbox, OutboxWorker
+from .event_writer import EventWriter
+from .checkpoint import Checkpoint, CheckpointStore, FileIdentity, file_identity
+from .file_follower import FileWatcher, LogFileFollower
+from .line_classifier import LineClassifier
+from .pipeline import IngestPipeline, StageBatch
+from .log_line_prefix import LogLinePrefix
+from .session_assembler import AssembledStatement, SessionAssembler
+from .structured_log import RecordAssembler, create_record_parser
 
-import httpx
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine
 
 
 class LogMonitor:
     def __init__(
         self,
         log_file_path: str,
-        patterns: Dict[str, Dict[str, str]],
+        patterns: Mapping[str, Any],
         http_endpoint: str,
         db_url: str,
         poll_interval: float = 1.0,
+        max_sessions: int = 1024,
+        max_session_lines: int = 10_000,
+        session_idle_timeout: float = 30.0,
+        log_line_prefix: Optional[LogLinePrefix] = None,
+        log_format: str = "stderr",
+        follow_pattern: Optional[str] = None,
+        read_batch_bytes: Optional[int] = 8 * 1024 * 1024,
+        read_batch_lines: Optional[int] = 100_000,
+        max_pending_events: Optional[int] = 10_000,
+        pipeline_queue_size: int = 8,
+        match_workers: int = 1,
+        delivery_concurrency: int = 4,
+        write_batch_events: int = 500,
+        write_batch_delay: float = 0.5,
+        delivery_batch_events: int = 500,
+        delivery_gzip: bool = False,
+        delivery_http2: bool = True,
+        delivery_max_attempts: int = 8,
+        delivery_backoff: float = 1.0,
+        delivery_max_backoff: float = 300.0,
+        delivery_lease: float = 60.0,
     ):
         self.log_file_path = Path(log_file_path).absolute()
         self.patterns = patterns
         self.http_endpoint = http_endpoint
         self.engine = create_engine(db_url)
         self.poll_interval = poll_interval
-        self.last_position = 0
-        self.current_query_buffer = []
-        self.current_explain_buffer = []
-        self.current_duration = None
-        self.current_timestamp = None
+        # Without follow_pattern the monitor stays on log_file_path across rotation
+        self.follower = LogFileFollower(
+            self.log_file_path,
+            pattern=follow_pattern,
+            max_bytes=read_batch_bytes,
+            max_lines=read_batch_lines,
+            start_position=self._start_position,
+        )
+        # End of the lines of the current file to replay, if any
+        self._replay_end: Optional[int] = None
+        # Offset the file the follower switched to is read from, and whether
+        # statements carry over into it, until its first batch is read
+        self._switched: Optional[Tuple[int, bool]] = None
+        self.max_pending_events = max_pending_events
+        self.pipeline_queue_size = pipeline_queue_size
+        self.match_workers = match_workers
+        self.sender = EventSender(
+            http_endpoint,
+            max_in_flight=delivery_concurrency,
+            compress=delivery_gzip,
+            http2=delivery_http2,
+        )
+        self.outbox = Outbox(
+            self.engine,
+            max_attempts=delivery_max_attempts,
+            backoff=delivery_backoff,
+            max_backoff=delivery_max_backoff,
+            lease=delivery_lease,
+        )
+        self.outbox_worker = OutboxWorker(
+            self.outbox,
+            self._send_batch,
+            batch_events=delivery_batch_events,
+            max_in_flight=delivery_concurrency,
+        )
+        self.watcher: Optional[FileWatcher] = None
+        self.checkpoints = CheckpointStore(self.engine)
+        self.writer = EventWriter(
+            self.engine,
+            self.checkpoints,
+            max_events=write_batch_events,
+            max_delay=write_batch_delay,
+        )
+        self.identity: Optional[FileIdentity] = None
+        self.log_format = log_format
+        if log_format == "stderr":
+            self.assembler = SessionAssembler(
+                max_sessions=max_sessions,
+                max_buffer_lines=max_session_lines,
+                idle_timeout=session_idle_timeout,
+                classifier=LineClassifier(log_line_prefix),
+            )
+        else:
+            # csvlog and jsonlog records carry their session and message as
+            # fields, so no prefix parsing or continuation buffering is needed
+            self.assembler = RecordAssembler(
+                create_record_parser(log_format),
+                max_sessions=max_sessions,
+                idle_timeout=session_idle_timeout,
+            )
+        self.event_builder = EventBuilder(patterns)
         logger.debug("initialized_log_monitor", 
                     log_file=str(self.log_file_path),
                     pattern_count=len(patterns),
                     http_endpoint=http_endpoint,
-                    poll_interval=poll_interval)
+                    poll_interval=poll_interval,
+                    log_format=log_format,
+                    follow_pattern=follow_pattern,
+                    read_batch_bytes=read_batch_bytes,
+                    read_batch_lines=read_batch_lines,
+                    max_pending_events=max_pending_events,
+                    write_batch_events=write_batch_events,
+                    write_batch_delay=write_batch_delay,
+                    delivery_batch_events=delivery_batch_events,
+                    delivery_concurrency=delivery_concurrency)
 
-    def _parse_timestamp(self, line: str) -> Optional[datetime]:
-        """Parse timestamp from log line."""
-        match = re.match(r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})", line)
-        if match:
-            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S.%f")
-            logger.debug("parsed_timestamp", timestamp=timestamp.isoformat())
-            return timestamp
-        logger.debug("failed_to_parse_timestamp", line=line)
-        return None
+    @property
+    def last_position(self) -> int:
+        """Offset of the end of the last line read from the current file."""
+        return self.follower.position
 
-    def _extract_duration(self, line: str) -> Optional[float]:
-        """Extract duration from log line."""
-        match = re.search(r"duration: ([\d.]+) ms", line)
-        if match:
-            duration = float(match.group(1))
-            logger.debug("extracted_duration", duration_ms=duration)
-            return duration
-        logger.debug("failed_to_extract_duration", line=line)
-        return None
+    @last_position.setter
+    def last_position(self, position: int) -> None:
+        self.follower.position = position
 
-    def _is_query_line(self, line: str) -> bool:
-        """Check if line contains a query."""
-        is_query = "LOG:  execute" in line
-        logger.debug("checked_query_line", is_query=is_query, line=line)
-        return is_query
-
-    def _is_explain_line(self, line: str) -> bool:
-        """Check if line contains explain plan."""
-        is_explain = "LOG:  duration:" in line and "plan:" in line
-        logger.debug("checked_explain_line", is_explain=is_explain, line=line)
-        return is_explain
+    def _process_query(
+        self,
+        query_lines: List[str],
+        explain_lines: List[str],
+        duration: Optional[float],
+        timestamp: Optional[str],
+        query_id: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Process a complete query and its explain plan into the fields of its event."""
+        return self.event_builder.build(query_lines, explain_lines, duration, timestamp, query_id)
 
-    def _is_temporary_file_line(self, line: str) -> bool:
-        """Check if line contains temporary file information."""
-        is_temp_file = "LOG:  temporary file:" in line
-        logger.debug("checked_temp_file_line", is_temp_file=is_temp_file, line=line)
-        return is_temp_file
+    def update_patterns(self, patterns: Mapping[str, Any]) -> None:
+        """Swap in a new set of patterns without stopping ingestion.
 
-    def _extract_query_text(self, explain_text: str) -> Optional[str]:
-        """Extract query text from explain plan."""
-        try:
-            # Try to parse the JSON in the explain plan
-            match = re.search(r'{\s*"Query Text":\s*"([^"]+)"', explain_text)
-            if match:
-                query_text = match.group(1)
-                # Replace escaped newlines
-                query_text = query_text.replace('\\n', '\n')
-                return query_text
-        except Exception as e:
-            logger.error("error_extracting_query_text", error=str(e), exc_info=True)
-        return None
+        Changed patterns are compiled in the calling thread; batches already
+        being matched finish with the previous patterns.
+        """
+        self.event_builder.update_patterns(patterns)
+        self.patterns = patterns
+        logger.info("updated_log_monitor_patterns", pattern_count=len(patterns))
 
-    def _process_query(self, query_lines: List[str], explain_lines: List[str], duration: Optional[float]) -> Optional[LogEvent]:
-        """Process a complete query and its explain plan."""
-        if not query_lines:
-            return None
+    async def _send_batch(
+        self,
+        events: List[LogEvent],
+        plans: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> Optional[bool]:
+        """Send a batch of events, with their plan trees, to the HTTP endpoint.
 
-        # Extract timestamp from the first line
-        timestamp = self._parse_timestamp(query_lines[0])
-        if not timestamp:
-            return None
+        Returns:
+            Whether the batch was acknowledged, or None to retry it later
+        """
+        return await self.sender.send(events, plans)
 
-        # Extract query text from the explain plan if available
-        explain_text = "\n".join(line.split(": ", 1)[1] for line in explain_lines) if explain_lines else None
-        query_text = None
-        
-        if explain_text:
-            query_text = self._extract_query_text(explain_text)
-        
-        # If we couldn't extract from explain plan, try to get from query lines
-        if not query_text and query_lines:
-            query_text = "\n".join(line.split(": ", 1)[1] for line in query_lines)
+    async def _process_events(self) -> int:
+        """Deliver the events that are due from the outbox.
 
-        # Match patterns
-        pattern_name = None
-        for name, pattern_info in self.patterns.items():
-            if query_text and re.search(pattern_info["query_pattern"], query_text):
-                pattern_name = name
-                break
+        Returns:
+            Number of events delivered
+        """
+        return await self.outbox_worker.drain()
 
-        return LogEvent(
-            timestamp=timestamp,
-            query_text=query_text,
-            explain_text=explain_text,
-            duration_ms=duration,
-            pattern_name=pattern_name,
-        )
+    def _build_events(self, statements: List[AssembledStatement]) -> List[Dict[str, Any]]:
+        """Turn assembled statements into event rows for the writer."""
+        events = []
+        for statement in statements:
+            event = self._process_query(
+                statement.query_lines,
+                statement.explain_lines,
+                statement.duration_ms,
+                statement.timestamp,
+                statement.query_id,
+            )
+            if event:
+                events.append(event)
+        return events
 
-    async def _send_event(self, event: LogEvent) -> bool:
-        """Send event to HTTP endpoint."""
-        async with httpx.AsyncClient() as client:
-            try:
-                logger.debug("sending_event", 
-                           event_id=event.id,
-                           pattern_name=event.pattern_name,
-                           timestamp=event.timestamp.isoformat())
-                response = await client.post(
-                    self.http_endpoint,
-                    json={
-                        "timestamp": event.timestamp.isoformat(),
-                        "query_text": event.query_text,
-                        "explain_text": event.explain_text,
-                        "duration_ms": event.duration_ms,
-                        "pattern_name": event.pattern_name,
-                    },
-                    timeout=10.0,
-                )
-                success = response.status_code == 200
-                logger.debug("event_send_result", 
-                           success=success,
-                           status_code=response.status_code,
-                           event_id=event.id)
-                return success
-            except Exception as e:
-                logger.error("event_send_error", 
-                           error=str(e),
-                           event_id=event.id,
-                           exc_info=True)
-                return False
+    def _resume_offset(self, committed_offset: int) -> int:
+        """Offset to resume reading at: the start of the oldest open statement."""
+        resume_offset = self.assembler.pending_offset()
+        # Statements open when the file was truncated have offsets past its end
+        if resume_offset is None or resume_offset > committed_offset:
+            return committed_offset
+        return resume_offset
 
-    async def _process_events(self):
-        """Process pending events from the database."""
-        with Session(self.engine) as session:
-            stmt = select(LogEvent).where(LogEvent.status == "pending")
-            events = session.execute(stmt).scalars().all()
-            logger.debug("processing_pending_events", count=len(events))
+    def _read_new_lines(self, end: Optional[int] = None) -> List[str]:
+        """Read the next batch of complete lines from the log file, following rotation.
 
-            for event in events:
-                if await self._send_event(event):
-                    event.status = "sent"
-                    logger.debug("event_marked_sent", event_id=event.id)
-                else:
-                    event.status = "failed"
-                    logger.debug("event_marked_failed", event_id=event.id)
-                session.commit()
+        A trailing line that is still being written is left for the next
+        read, so last_position always ends on a line boundary. Batches are
+        bounded by the follower's byte and line budget.
 
-    def _read_new_lines(self) -> List[str]:
-        """Read new lines from the log file."""
+        Args:
+            end: Offset to stop reading at. Defaults to the end of the file
+        """
+        rotations = self.follower.rotations
         try:
-            with open(self.log_file_path, "r") as f:
-                f.seek(self.last_position)
-                new_lines = f.readlines()
-                self.last_position = f.tell()
-                logger.debug("read_new_lines", 
-                           count=len(new_lines),
-                           position=self.last_position)
-                return new_lines
+            new_lines = self.follower.read_lines(end)
         except Exception as e:
             logger.error("error_reading_log_file", 
                         error=str(e),
@@ -190,89 +223,123 @@ class LogMonitor:
                         exc_info=True)
             return []
 
+        if self.follower.rotations != rotations:
+            logger.info("switched_log_file",
+                      previous_file=str(self.log_file_path),
+                      file=str(self.follower.path))
+            self.log_file_path = self.follower.path
+            self.identity = file_identity(self.log_file_path)
+        elif self.identity is not None and new_lines:
+            self.identity = self.identity._replace(size=os.fstat(self.follower.fileno()).st_size)
+        logger.debug("read_new_lines", 
+                   count=len(new_lines),
+                   position=self.last_position)
+        return new_lines
+
+    def _start_position(self, path: Path) -> Tuple[int, Optional[int]]:
+        """Where to start reading a file, from its checkpoint.
+
+        Lines between the checkpoint's resume and committed offsets are
+        replayed to rebuild the statements that were still being
+        assembled. A file the follower switches to only has a checkpoint
+        past its start once no statement carried over from the previous
+        file was still open, so those are dropped then.
+
+        Returns:
+            The offset to start reading at, and the end of the lines to
+            replay or None
+        """
+        try:
+            resume_offset, committed_offset = self.checkpoints.resume_point(path, file_identity(path))
+        except Exception as e:
+            logger.error("error_reading_log_checkpoint", file=str(path), error=str(e), exc_info=True)
+            resume_offset = committed_offset = 0
+        self._switched = (resume_offset, resume_offset == 0)
+        self._replay_end = committed_offset if committed_offset > resume_offset else None
+        return resume_offset, self._replay_end
+
+    def _next_batch(self) -> Optional[StageBatch]:
+        """Read the next lines with the checkpoint they end at.
+
+        Replayed lines get no checkpoint, so the stored one never moves
+        back. Returns None when there are no new lines and no new file.
+        """
+        rotations, offset = self.follower.rotations, self.last_position
+        replay = self._replay_end is not None
+        lines = self._read_new_lines(self._replay_end)
+        carry_over = None
+        if self.follower.rotations != rotations:
+            # A truncated file restarts at its start with nothing carried over
+            offset, carry_over = self._switched or (0, None)
+            self._switched = None
+            replay = self._replay_end is not None
+        if self._replay_end is not None and self.last_position >= self._replay_end:
+            self._replay_end = None
+        if not lines and carry_over is None:
+            return None
+        checkpoint = None
+        if not replay:
+            if self.identity is None:
+                self.identity = file_identity(self.log_file_path)
+            checkpoint = Checkpoint(self.log_file_path, self.identity, offset, self.last_position)
+        return StageBatch(0, checkpoint, lines, offset, replay, carry_over)
+
+    def _assemble(self, batch: StageBatch) -> List[AssembledStatement]:
+        """Feed a batch of lines and return the statements it completes.
+
+        Statements completed by replayed lines were committed before a
+        restart and are dropped.
+        """
+        if batch.carry_over is not None:
+            self.assembler.start_next_file(batch.carry_over)
+        statements = self.assembler.feed(batch.items, batch.offset)
+        return [] if batch.replay else statements
+
+    def _pending_event_count(self) -> int:
+        """Number of stored events still waiting to be sent."""
+        return self.outbox.pending_count()
+
+    def _restore_checkpoint(self) -> None:
+        """Resume from the stored checkpoint of the log file, if it is still valid.
+
+        Lines between the resume and committed offsets are replayed to rebuild
+        the statements that were still being assembled; statements they
+        complete were committed before the restart and are dropped.
+        """
+        self.identity = file_identity(self.log_file_path)
+        resume_offset, replay_end = self._start_position(self.log_file_path)
+        # Nothing is carried over into the first file
+        self._switched = None
+        self.last_position = resume_offset
+        skipped = 0
+        while self._replay_end is not None:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            skipped += len(self.assembler.feed(batch.items, batch.offset))
+        if replay_end is not None:
+            logger.debug("replayed_uncommitted_lines",
+                       resume_offset=resume_offset,
+                       committed_offset=replay_end,
+                       skipped_statements=skipped)
+            self.last_position = replay_end
+            self._replay_end = None
+
     async def run(self):
-        """Main monitoring loop."""
+        """Run the ingestion pipeline until cancelled."""
         logger.info("starting_log_monitor", 
                    file=str(self.log_file_path),
                    pattern_count=len(self.patterns))
         
-        # Process any existing events on startup
-        await self._process_events()
-
-        while True:
-            try:
-                new_lines = self._read_new_lines()
-                
-                for line in new_lines:
-                    # Extract timestamp from any line that has it
-                    timestamp = self._parse_timestamp(line)
-                    if timestamp:
-                        self.current_timestamp = timestamp
-                    
-                    if self._is_query_line(line):
-                        # Process previous query if exists
-                        if self.current_query_buffer:
-                            event = self._process_query(
-                                self.current_query_buffer,
-                                self.current_explain_buffer,
-                                self.current_duration
-                            )
-                            if event:
-                                with Session(self.engine) as session:
-                                    session.add(event)
-                                    session.commit()
-                                    logger.debug("saved_new_event", 
-                                               event_id=event.id,
-                                               pattern_name=event.pattern_name)
-                        
-                        # Start new query
-                        self.current_query_buffer = [line]
-                        self.current_explain_buffer = []
-                        self.current_duration = None
-                        logger.debug("started_new_query_buffer")
-                    
-                    elif self._is_explain_line(line):
-                        self.current_explain_buffer.append(line)
-                        self.current_duration = self._extract_duration(line)
-                        logger.debug("added_explain_line", 
-                                   buffer_size=len(self.current_explain_buffer),
-                                   duration=self.current_duration)
-                    
-                    elif self._is_temporary_file_line(line):
-                        # This is the end of an explain plan
-                        if self.current_explain_buffer:
-                            # Process the complete query with its explain plan
-                            event = self._process_query(
-                                self.current_query_buffer,
-                                self.current_explain_buffer,
-                                self.current_duration
-                            )
-                            if event:
-                                with Session(self.engine) as session:
-                                    session.add(event)
-                                    session.commit()
-                                    logger.debug("saved_new_event", 
-                                               event_id=event.id,
-                                               pattern_name=event.pattern_name)
-                            
-                            # Reset buffers
-                            self.current_query_buffer = []
-                            self.current_explain_buffer = []
-                            self.current_duration = None
-                            logger.debug("processed_explain_plan")
-                    
-                    elif self.current_query_buffer:
-                        self.current_query_buffer.append(line)
-                        logger.debug("added_query_line", 
-                                   buffer_size=len(self.current_query_buffer))
-
-                # Process any pending events
-                await self._process_events()
-                
-                time.sleep(self.poll_interval)
-                
-            except Exception as e:
-                logger.error("monitor_loop_error", 
-                           error=str(e),
-                           exc_info=True)
-                time.sleep(self.poll_interval) 
\ No newline at end of file
+        await asyncio.to_thread(self._restore_checkpoint)
+        self.watcher = FileWatcher(self.log_file_path.parent, poll_interval=self.poll_interval)
+        pipeline = IngestPipeline(
+            self,
+            queue_size=self.pipeline_queue_size,
+            match_workers=self.match_workers,
+        )
+        try:
+            await pipeline.run()
+        finally:
+            self.watcher.close()
+            await self.sender.aclose()
@@ -7,7 +7,7 @@ class LogReader(ABC):
     """Interface for reading PostgreSQL logs from various sources."""
     
     @abstractmethod
-    def get_log_files(self) -> list[Path]:
+    def get_log_files(self, include_compressed: bool = True) -> list[Path]:
         pass
 
     @abstractmethod
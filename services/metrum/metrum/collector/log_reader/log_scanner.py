@@ -0,0 +1,248 @@
+import mmap
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from .compressed_log import detect_compression, open_log_file
+
+# Bytes handed out per window
+CHUNK_BYTES = 256 * 1024
+
+# Messages the session assembler acts on
+_STATEMENT_MARKER = re.compile(rb"LOG:  (?:execute |duration: |temporary file: |disconnection: )")
+# Continuation lines at the start of a window, and the message line after them
+_WINDOW_HEAD = re.compile(rb"(?:\t[^\n]*\n)*[^\n]*\n?")
+
+
+class _Scanner(ABC):
+    """Line and message batches over the windows produced by chunks()."""
+
+    @abstractmethod
+    def chunks(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_bytes: int = CHUNK_BYTES,
+    ) -> Iterator[Tuple[int, Union[bytes, memoryview]]]:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    def line_batches(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_bytes: int = CHUNK_BYTES,
+    ) -> Iterator[Tuple[int, List[str]]]:
+        """Decode every line between two offsets, one window at a time.
+
+        Args:
+            start: Offset to scan from; must be a line boundary
+            end: Offset to stop at. Defaults to the end of the file
+            chunk_bytes: Target batch size
+
+        Yields:
+            The offset of each batch and its lines, without their newlines
+        """
+        for offset, chunk in self.chunks(start, end, chunk_bytes):
+            yield offset, _split(chunk)
+
+    def message_batches(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_bytes: int = CHUNK_BYTES,
+    ) -> Iterator[Tuple[int, List[str]]]:
+        """Decode the windows that can hold statements, plans or disconnections.
+
+        A window without any of those messages is skipped undecoded except
+        for the continuation lines it starts with, which may belong to a
+        message in the window before it, and the message line after them,
+        which ends that message so that continuation lines in later windows
+        are not added to it.
+
+        Args:
+            start: Offset to scan from; must be a line boundary
+            end: Offset to stop at. Defaults to the end of the file
+            chunk_bytes: Target batch size
+
+        Yields:
+            The offset of each batch and its lines, without their newlines
+        """
+        marker, window_head = _STATEMENT_MARKER.search, _WINDOW_HEAD.match
+        for offset, chunk in self.chunks(start, end, chunk_bytes):
+            if marker(chunk) is None:
+                chunk = chunk[:window_head(chunk).end()]
+            yield offset, _split(chunk)
+
+
+class LogScanner(_Scanner):
+    """Scans a stderr log file through mmap.
+
+    The file is handed out as memoryview windows of the mapping that end on
+    line boundaries, so nothing is copied until a window is decoded, and
+    each window is decoded and split into lines in one call instead of line
+    by line. message_batches() also checks each window for the messages the
+    session assembler acts on with a bytes search and only decodes the
+    first lines of windows without any. Pages are mapped read-only, so RSS stays flat however
+    large the file is.
+    """
+
+    def __init__(self, path: Path):
+        """Map a log file.
+
+        Args:
+            path: Log file to scan
+        """
+        self.path = path
+        with path.open("rb") as f:
+            try:
+                self._map: Optional[mmap.mmap] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self._map = None
+        if self._map is not None and hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    @property
+    def size(self) -> int:
+        """Size of the mapped file."""
+        return len(self._view)
+
+    def close(self) -> None:
+        """Unmap the file, or leave that to the last outstanding window."""
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+
+    def chunks(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_bytes: int = CHUNK_BYTES,
+    ) -> Iterator[Tuple[int, memoryview]]:
+        """Yield windows of the file that end on line boundaries.
+
+        A window is only longer than chunk_bytes when a single line is.
+
+        Args:
+            start: Offset of the first window; must be a line boundary
+            end: Offset to stop at. Defaults to the end of the file
+            chunk_bytes: Target window size
+
+        Yields:
+            The offset of each window and a view of its bytes
+        """
+        if self._map is None:
+            return
+        end = self.size if end is None else min(end, self.size)
+        mapped, view = self._map, self._view
+        position = start
+        while position < end:
+            cut = position + chunk_bytes
+            if cut >= end:
+                cut = end
+            else:
+                newline = mapped.rfind(b"\n", position, cut)
+                if newline < 0:
+                    newline = mapped.find(b"\n", cut, end)
+                cut = end if newline < 0 else newline + 1
+            yield position, view[position:cut]
+            position = cut
+
+
+class StreamScanner(_Scanner):
+    """Scans a compressed log file while decompressing it.
+
+    Windows are read from the decompressed stream, so offsets are positions
+    in the decompressed contents and the file is never written out
+    uncompressed.
+    """
+
+    def __init__(self, path: Path, compression: Optional[str] = None):
+        """Open a log file.
+
+        Args:
+            path: Log file to scan
+            compression: Compression of the file. Detected when not given
+        """
+        self.path = path
+        self._file: BinaryIO = open_log_file(path, compression)
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+    def chunks(
+        self,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_bytes: int = CHUNK_BYTES,
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Yield windows of the decompressed file that end on line boundaries.
+
+        Scanning can only move forward: skipping to start decompresses and
+        discards everything before it.
+
+        Args:
+            start: Offset of the first window; must be a line boundary
+            end: Offset to stop at. Defaults to the end of the file
+            chunk_bytes: Target window size
+
+        Yields:
+            The offset of each window and its bytes
+        """
+        read = self._file.read
+        position = 0
+        while position < start:
+            skipped = len(read(min(start - position, chunk_bytes)))
+            if not skipped:
+                return
+            position += skipped
+        remainder = b""
+        while end is None or position < end:
+            size = chunk_bytes if end is None else min(chunk_bytes, end - position - len(remainder))
+            data = read(size) if size > 0 else b""
+            if not data:
+                if remainder:
+                    yield position, remainder
+                return
+            data = remainder + data
+            cut = data.rfind(b"\n") + 1
+            if not cut:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            yield position, data[:cut]
+            position += cut
+
+
+def open_scanner(path: Path) -> Union[LogScanner, StreamScanner]:
+    """Open the scanner for a log file: mmap for plain files, streaming for compressed ones."""
+    compression = detect_compression(path)
+    if compression is None:
+        return LogScanner(path)
+    return StreamScanner(path, compression)
+
+
+def _split(chunk: Union[bytes, memoryview]) -> List[str]:
+    """Decode a window and split it into lines without their newlines."""
+    text = str(chunk, "utf-8", "replace")
+    lines = text.split("\n")
+    if text.endswith("\n"):
+        lines.pop()
+    return lines
@@ -0,0 +1,289 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, undefer
+
+from metrum.common.logger import logger
+from metrum.db.models import Event, EventStatus, ExplainPlan, LogEvent
+from metrum.db.text_codec import text_codec
+from .plan_parser import join_plan
+
+# event_type of the outbox rows that deliver a LogEvent
+LOG_EVENT_TYPE = "log_event"
+
+_UNDELIVERED = (EventStatus.PENDING, EventStatus.PROCESSING)
+
+
+def outbox_entry(log_event_id: int, now: datetime) -> Dict[str, object]:
+    """Column values of the outbox row that delivers a LogEvent."""
+    return {
+        "event_type": LOG_EVENT_TYPE,
+        "payload": {"log_event_id": log_event_id},
+        "status": EventStatus.PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class ClaimedEvent(NamedTuple):
+    """A LogEvent claimed for delivery.
+
+    Attributes:
+        outbox_id: Id of the event_queue row
+        attempts: Delivery attempts, including this one
+        event: Event to deliver, or None if it no longer exists
+        plan: Whole plan tree of the event, joined back from its shape and
+            figures, or None if it has no parsed plan
+    """
+    outbox_id: int
+    attempts: int
+    event: Optional[LogEvent]
+    plan: Optional[Dict[str, Any]] = None
+
+
+class Outbox:
+    """Delivery queue of LogEvents, kept in the event_queue table.
+
+    Rows are written in the transaction that stores their event. A worker
+    claims due rows by marking them PROCESSING until a lease expires, so
+    any number of workers, in one process or several, can drain the queue
+    without sending a row twice unless its worker dies. On PostgreSQL the
+    claim skips rows locked by other claims instead of waiting for them.
+
+    Undelivered rows are retried with exponential backoff and jitter, and
+    moved to FAILED, the dead letter state, after max_attempts attempts or
+    when the endpoint rejects them.
+    """
+
+    def __init__(
+        self,
+        engine,
+        max_attempts: int = 8,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        lease: float = 60.0,
+        clock: Callable[[], datetime] = datetime.utcnow,
+    ):
+        """Initialize the outbox.
+
+        Args:
+            engine: SQLAlchemy engine of metrum's database
+            max_attempts: Attempts after which a row is dead-lettered
+            backoff: Seconds before the first retry, doubled for each further one
+            max_backoff: Longest wait between two attempts, in seconds
+            lease: Seconds a claim lasts before the row can be claimed again
+            clock: Current UTC time
+        """
+        self.engine = engine
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.clock = clock
+
+    def claim(self, limit: int) -> List[ClaimedEvent]:
+        """Claim up to limit due rows, oldest first, with their events."""
+        now = self.clock()
+        due = (
+            select(Event.id)
+            .where(Event.status.in_(_UNDELIVERED), Event.next_attempt_at <= now)
+            .order_by(Event.next_attempt_at, Event.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        with Session(self.engine) as session:
+            claimed = session.execute(
+                update(Event)
+                .where(Event.id.in_(due.scalar_subquery()))
+                .values(
+                    status=EventStatus.PROCESSING,
+                    attempts=Event.attempts + 1,
+                    next_attempt_at=now + timedelta(seconds=self.lease),
+                    updated_at=now,
+                )
+                .returning(Event.id, Event.attempts, Event.payload)
+                .execution_options(synchronize_session=False)
+            ).all()
+            session.commit()
+            ids = [payload["log_event_id"] for _, _, payload in claimed]
+            # Events are sent with their text, which may use a dictionary
+            # trained in another process
+            text_codec.load(session)
+            events = {}
+            plans = {}
+            for event, shape in session.execute(
+                select(LogEvent, ExplainPlan.shape)
+                .outerjoin(ExplainPlan, ExplainPlan.id == LogEvent.plan_id)
+                .where(LogEvent.id.in_(ids))
+                .options(undefer(LogEvent.query_text), undefer(LogEvent.explain_text))
+            ):
+                # Sent as one tree, as it was before being stored by shape
+                if shape is not None:
+                    plans[event.id] = join_plan(shape, event.plan_stats or [])
+                events[event.id] = event
+        claimed = sorted(claimed, key=lambda row: row[0])
+        return [
+            ClaimedEvent(
+                outbox_id,
+                attempts,
+                events.get(payload["log_event_id"]),
+                plans.get(payload["log_event_id"]),
+            )
+            for outbox_id, attempts, payload in claimed
+        ]
+
+    def complete(self, claimed: List[ClaimedEvent]) -> None:
+        """Record that the events were delivered."""
+        now = self.clock()
+        with Session(self.engine) as session:
+            session.execute(
+                update(Event)
+                .where(Event.id.in_([row.outbox_id for row in claimed]))
+                .values(status=EventStatus.COMPLETED, processed_at=now, updated_at=now, error_message=None)
+            )
+            self._mark_log_events(session, claimed, "sent")
+            session.commit()
+
+    def retry(self, claimed: List[ClaimedEvent], error: str) -> None:
+        """Schedule another attempt, or dead-letter rows that used all of theirs."""
+        exhausted = [row for row in claimed if row.attempts >= self.max_attempts]
+        retried = [row for row in claimed if row.attempts < self.max_attempts]
+        now = self.clock()
+        with Session(self.engine) as session:
+            if retried:
+                session.execute(update(Event), [
+                    {
+                        "id": row.outbox_id,
+                        "status": EventStatus.PENDING,
+                        "next_attempt_at": now + timedelta(seconds=self._backoff(row.attempts)),
+                        "updated_at": now,
+                        "error_message": error,
+                    }
+                    for row in retried
+                ])
+            self._dead_letter(session, exhausted, error, now)
+            session.commit()
+        logger.debug("scheduled_event_retries", retried=len(retried), dead_lettered=len(exhausted))
+
+    def dead_letter(self, claimed: List[ClaimedEvent], error: str) -> None:
+        """Give up on the rows without retrying them."""
+        with Session(self.engine) as session:
+            self._dead_letter(session, claimed, error, self.clock())
+            session.commit()
+
+    def pending_count(self) -> int:
+        """Number of rows still to be delivered."""
+        with Session(self.engine) as session:
+            return session.execute(
+                select(func.count()).select_from(Event).where(Event.status.in_(_UNDELIVERED))
+            ).scalar_one()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+        # Jitter spreads out the retries of batches that failed together
+        return delay * random.uniform(0.5, 1.0)
+
+    def _dead_letter(self, session: Session, claimed: List[ClaimedEvent], error: str, now: datetime) -> None:
+        if not claimed:
+            return
+        session.execute(
+            update(Event)
+            .where(Event.id.in_([row.outbox_id for row in claimed]))
+            .values(status=EventStatus.FAILED, processed_at=now, updated_at=now, error_message=error)
+        )
+        self._mark_log_events(session, claimed, "failed")
+        logger.warning("dead_lettered_events",
+                     count=len(claimed),
+                     error=error,
+                     outbox_ids=[row.outbox_id for row in claimed][:10])
+
+    @staticmethod
+    def _mark_log_events(session: Session, claimed: List[ClaimedEvent], status: str) -> None:
+        ids = [row.event.id for row in claimed if row.event is not None]
+        if ids:
+            session.execute(update(LogEvent).where(LogEvent.id.in_(ids)).values(status=status))
+
+
+class OutboxWorker:
+    """Claims pages of the outbox and delivers them as concurrent batches."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: Callable[[List[LogEvent], List[Optional[Dict[str, Any]]]], Awaitable[Optional[bool]]],
+        batch_events: int = 500,
+        max_in_flight: int = 4,
+    ):
+        """Initialize the worker.
+
+        Args:
+            outbox: Outbox to drain
+            send: Sends a batch of events and their plan trees; returns
+                whether it was acknowledged, or None if it should be retried
+            batch_events: Events per batch
+            max_in_flight: Batches sent concurrently
+        """
+        self.outbox = outbox
+        self.send = send
+        self.batch_events = batch_events
+        self.max_in_flight = max_in_flight
+
+    async def drain(self) -> int:
+        """Deliver due events until none are left or a batch has to be retried.
+
+        Each page holds a batch for every request that may be in flight.
+        Database access runs in a worker thread so the event loop keeps
+        serving other tasks.
+
+        Returns:
+            Number of events delivered
+        """
+        limit = self.batch_events * self.max_in_flight
+        delivered = 0
+        while True:
+            claimed = await asyncio.to_thread(self.outbox.claim, limit)
+            logger.debug("claimed_outbox_events", count=len(claimed))
+            if not claimed:
+                return delivered
+            results = await asyncio.gather(*(
+                self._deliver(claimed[start:start + self.batch_events])
+                for start in range(0, len(claimed), self.batch_events)
+            ))
+            delivered += sum(count for count in results if count is not None)
+            # Stop at the first failure so an outage does not use up attempts
+            if None in results or len(claimed) < limit:
+                return delivered
+
+    async def run(self, poll_interval: float) -> None:
+        """Drain the outbox every poll_interval seconds until cancelled."""
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("outbox_delivery_error", error=str(e), exc_info=True)
+            await asyncio.sleep(poll_interval)
+
+    async def _deliver(self, claimed: List[ClaimedEvent]) -> Optional[int]:
+        """Send a batch and record the outcome; None if it is to be retried."""
+        missing = [row for row in claimed if row.event is None]
+        if missing:
+            await asyncio.to_thread(self.outbox.dead_letter, missing, "log event no longer exists")
+            claimed = [row for row in claimed if row.event is not None]
+            if not claimed:
+                return 0
+        result = await self.send([row.event for row in claimed], [row.plan for row in claimed])
+        if result is None:
+            await asyncio.to_thread(self.outbox.retry, claimed, "delivery failed")
+            return None
+        if result:
+            await asyncio.to_thread(self.outbox.complete, claimed)
+            return len(claimed)
+        await asyncio.to_thread(self.outbox.dead_letter, claimed, "rejected by endpoint")
+        return 0
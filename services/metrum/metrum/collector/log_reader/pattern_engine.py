@@ -0,0 +1,211 @@
+import re
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+try:
+    import re._parser as sre_parse
+    from re._constants import BRANCH, LITERAL, MAX_REPEAT, MIN_REPEAT, POSSESSIVE_REPEAT, SUBPATTERN
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_constants import BRANCH, LITERAL, MAX_REPEAT, MIN_REPEAT, SUBPATTERN
+    POSSESSIVE_REPEAT = MAX_REPEAT
+
+from metrum.common.logger import logger
+
+# Literals shorter than this match too much text to be worth prefiltering on
+MIN_LITERAL_LENGTH = 3
+
+_REPEATS = (MAX_REPEAT, MIN_REPEAT, POSSESSIVE_REPEAT)
+
+
+def _best(options: Iterable[Optional[List[str]]]) -> Optional[List[str]]:
+    """The most selective of several literal sets that are each required."""
+    best = None
+    for option in options:
+        if option and (best is None or min(map(len, option)) > min(map(len, best))):
+            best = option
+    return best
+
+
+def required_literals(parsed) -> Optional[List[str]]:
+    """Lowercase literals of which every match of a parsed regex contains one.
+
+    Only ASCII literal runs are used, so lowercasing the text and the
+    literals cannot make the prefilter miss a match.
+
+    Args:
+        parsed: Parsed regex, or a sequence of its items
+
+    Returns:
+        Literals of at least MIN_LITERAL_LENGTH characters, or None if the
+        regex has no such required literals
+    """
+    options: List[Optional[List[str]]] = []
+    run: List[str] = []
+
+    def end_run() -> None:
+        if len(run) >= MIN_LITERAL_LENGTH:
+            options.append(["".join(run).lower()])
+        run.clear()
+
+    for op, av in parsed:
+        if op is LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        end_run()
+        if op is SUBPATTERN:
+            options.append(required_literals(av[-1]))
+        elif op in _REPEATS and av[0] >= 1:
+            options.append(required_literals(av[2]))
+        elif op is BRANCH:
+            branches = [required_literals(branch) for branch in av[1]]
+            if all(branches):
+                options.append(sorted({literal for branch in branches for literal in branch}))
+    end_run()
+    return _best(options)
+
+
+class _Automaton:
+    """Aho–Corasick automaton reporting which of a set of words occur in a text."""
+
+    def __init__(self, words: List[str]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Set[int]] = [set()]
+        for index, word in enumerate(words):
+            state = 0
+            for char in word:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto[state][char] = following
+                    goto.append({})
+                    outputs.append(set())
+                state = following
+            outputs[state].add(index)
+
+        # Breadth-first, so the failure state of a node is complete before
+        # its children's are computed
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, following in goto[state].items():
+                queue.append(following)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[following] = goto[fallback].get(char, 0)
+                outputs[following] |= outputs[fail[following]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs: List[Tuple[int, ...]] = [tuple(sorted(output)) for output in outputs]
+
+    def find(self, text: str) -> Set[int]:
+        """Indexes of the words found in text."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+
+class CompiledPattern(NamedTuple):
+    """A query pattern compiled for the engine.
+
+    Attributes:
+        source: Regular expression the pattern was compiled from
+        regex: Compiled regular expression
+        literals: Literals of which every match contains one, or None if the
+            pattern is always run
+    """
+    source: str
+    regex: re.Pattern
+    literals: Optional[List[str]]
+
+
+def compile_pattern(source: str) -> CompiledPattern:
+    """Compile a query pattern and find the literals its matches require.
+
+    Raises:
+        re.error: If source is not a valid regular expression
+    """
+    return CompiledPattern(source, re.compile(source), required_literals(sre_parse.parse(source)))
+
+
+class PatternEngine:
+    """Matches a text against every query pattern of a PatternConfig at once.
+
+    Each regex is compiled once. Literals that every match of a regex must
+    contain are loaded into one Aho–Corasick automaton, so a single pass
+    over the text selects the few patterns worth running; patterns without
+    such literals are always run. Matches are reported in configuration
+    order.
+
+    An engine is never modified once built. A new engine built with the
+    current one as previous reuses its compiled patterns, so an updated
+    configuration only compiles the patterns that changed.
+    """
+
+    def __init__(self, patterns: Mapping[str, Any], previous: Optional["PatternEngine"] = None):
+        """Compile the patterns.
+
+        Args:
+            patterns: Pattern objects or dicts with a query_pattern, by name.
+                Patterns that do not compile are logged and skipped
+            previous: Engine whose compiled patterns are reused for patterns
+                with the same name and query_pattern
+        """
+        self.names: List[str] = []
+        self.compiled: Dict[str, CompiledPattern] = {}
+        self._regexes: List[re.Pattern] = []
+        self._always: List[int] = []
+        reused = 0
+        literal_patterns: Dict[str, List[int]] = {}
+        for name, pattern in patterns.items():
+            source = pattern["query_pattern"] if isinstance(pattern, Mapping) else pattern.query_pattern
+            compiled = previous.compiled.get(name) if previous is not None else None
+            if compiled is not None and compiled.source == source:
+                reused += 1
+            else:
+                try:
+                    compiled = compile_pattern(source)
+                except re.error as e:
+                    logger.error("invalid_query_pattern", pattern_name=name, error=str(e))
+                    continue
+            index = len(self.names)
+            self.names.append(name)
+            self.compiled[name] = compiled
+            self._regexes.append(compiled.regex)
+            if compiled.literals is None:
+                self._always.append(index)
+            for literal in compiled.literals or ():
+                literal_patterns.setdefault(literal, []).append(index)
+
+        self._literals = list(literal_patterns)
+        self._literal_patterns = [literal_patterns[literal] for literal in self._literals]
+        self._automaton = _Automaton(self._literals)
+        logger.debug("compiled_pattern_engine",
+                   pattern_count=len(self.names),
+                   reused_count=reused,
+                   literal_count=len(self._literals),
+                   unfiltered_count=len(self._always))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def candidates(self, text: str) -> List[int]:
+        """Indexes of the patterns the prefilter cannot rule out, in order."""
+        selected = set(self._always)
+        literal_patterns = self._literal_patterns
+        for literal in self._automaton.find(text.lower()):
+            selected.update(literal_patterns[literal])
+        return sorted(selected)
+
+    def match(self, text: str) -> List[str]:
+        """Names of every pattern matching text, in configuration order."""
+        regexes = self._regexes
+        return [self.names[index] for index in self.candidates(text) if regexes[index].search(text)]
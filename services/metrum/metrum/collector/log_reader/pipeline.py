@@ -0,0 +1,192 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from metrum.common.logger import logger
+from .checkpoint import Checkpoint
+from .session_assembler import AssembledStatement
+
+if TYPE_CHECKING:
+    from .log_monitor import LogMonitor
+
+
+class StageBatch(NamedTuple):
+    """Unit of work passed between pipeline stages.
+
+    Attributes:
+        sequence: Position of the batch in file order, assigned once lines
+            are assembled
+        checkpoint: Where reading can resume once the batch is persisted
+        items: Lines, then statements, then events, depending on the stage
+        offset: File offset of the first line
+        replay: Whether the lines are below the committed offset of the
+            file's checkpoint, so the statements they complete were
+            committed before a restart
+        carry_over: For the first lines of a file the reader switched to,
+            whether statements open at the end of the previous file
+            continue in them; None for other batches
+    """
+    sequence: int
+    checkpoint: Optional[Checkpoint]
+    items: List[Any]
+    offset: int = 0
+    replay: bool = False
+    carry_over: Optional[bool] = None
+
+
+class IngestPipeline:
+    """Runs a LogMonitor as stages connected by bounded queues.
+
+    The stages are:
+
+    - read: reads bounded batches of lines in a worker thread, pausing while
+      too many events wait for delivery, and waits on the file watcher once
+      the backlog is drained
+    - assemble: classifies lines and assembles per-session statements in a
+      worker thread; classification is fused into the assembler's loop
+      because both walk the same lines in order
+    - match: builds events and matches patterns, with match_workers batches
+      in flight
+    - persist: group-commits batches' events with the last batch's
+      checkpoint, in file order, retrying until the commit succeeds
+    - deliver: sends stored events in batches through the monitor's
+      pooled sender
+
+    Blocking file, CPU and database work runs in the default executor, so
+    the event loop stays free for other services, and a full queue stops
+    the stages before it.
+    """
+
+    def __init__(
+        self,
+        monitor: "LogMonitor",
+        queue_size: int = 8,
+        match_workers: int = 1,
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            monitor: Monitor whose reader, assembler and database are used
+            queue_size: Batches buffered between two stages
+            match_workers: Batches matched concurrently
+        """
+        self.monitor = monitor
+        self.match_workers = match_workers
+        self.lines: "asyncio.Queue[StageBatch]" = asyncio.Queue(queue_size)
+        self.statements: "asyncio.Queue[StageBatch]" = asyncio.Queue(queue_size)
+        self.events: "asyncio.Queue[StageBatch]" = asyncio.Queue(queue_size)
+        self._persisted = asyncio.Event()
+        self._sequence = 0
+        self._next_sequence = 0
+        self._waiting: Dict[int, StageBatch] = {}
+        # Checkpoint of the last lines read, for statements flushed while
+        # idle; None while lines are replayed
+        self._read_checkpoint: Optional[Checkpoint] = Checkpoint(monitor.log_file_path, monitor.identity, 0, monitor.last_position)
+
+    async def run(self) -> None:
+        """Run every stage until cancelled."""
+        stages = [
+            self._stage("read", self._read),
+            self._stage("assemble", self._assemble),
+            *(self._stage("match", self._match) for _ in range(self.match_workers)),
+            self._stage("persist", self._persist),
+            self._stage("deliver", self._deliver),
+        ]
+        logger.info("starting_ingest_pipeline",
+                  match_workers=self.match_workers,
+                  delivery_concurrency=self.monitor.sender.max_in_flight,
+                  queue_size=self.lines.maxsize)
+        await asyncio.gather(*stages)
+
+    async def _stage(self, name: str, step: Callable[[], Awaitable[None]]) -> None:
+        """Run one step of a stage after another, surviving errors."""
+        while True:
+            try:
+                await step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("pipeline_stage_error", stage=name, error=str(e), exc_info=True)
+                await asyncio.sleep(self.monitor.poll_interval)
+
+    async def _read(self) -> None:
+        monitor = self.monitor
+        if monitor.max_pending_events is not None:
+            pending = await asyncio.to_thread(monitor._pending_event_count)
+            if pending >= monitor.max_pending_events:
+                logger.debug("paused_log_ingestion", pending_events=pending)
+                await self._wait_for_delivery()
+                return
+
+        batch = await asyncio.to_thread(self._read_batch)
+        if batch is not None:
+            await self.lines.put(batch)
+        if not monitor.follower.backlogged:
+            # The timeout lets the assembler flush idle sessions
+            await monitor.watcher.wait(monitor.assembler.idle_timeout)
+
+    def _read_batch(self) -> Optional[StageBatch]:
+        """Read the next lines with the checkpoint they end at."""
+        return self.monitor._next_batch()
+
+    async def _assemble(self) -> None:
+        try:
+            batch = await asyncio.wait_for(self.lines.get(), self.monitor.assembler.idle_timeout)
+        except asyncio.TimeoutError:
+            batch = None
+        statements, checkpoint = await asyncio.to_thread(self._assemble_batch, batch)
+        if statements or batch is not None:
+            await self.statements.put(StageBatch(self._sequence, checkpoint, statements))
+            self._sequence += 1
+
+    def _assemble_batch(
+        self,
+        batch: Optional[StageBatch],
+    ) -> Tuple[List[AssembledStatement], Optional[Checkpoint]]:
+        """Feed a batch of lines, or only flush idle sessions when there is none."""
+        statements = []
+        if batch is not None:
+            statements = self.monitor._assemble(batch)
+            self._read_checkpoint = batch.checkpoint
+        statements.extend(self.monitor.assembler.flush_idle())
+        if self._read_checkpoint is None:
+            return statements, None
+        committed_offset = self._read_checkpoint.committed_offset
+        return statements, self._read_checkpoint._replace(
+            resume_offset=self.monitor._resume_offset(committed_offset),
+        )
+
+    async def _match(self) -> None:
+        batch = await self.statements.get()
+        events = await asyncio.to_thread(self.monitor._build_events, batch.items)
+        await self.events.put(batch._replace(items=events))
+
+    async def _persist(self) -> None:
+        # Match workers may finish out of order; batches are added to the
+        # writer in sequence so checkpoints only move forward. The writer
+        # group-commits them once enough events are buffered or the oldest
+        # has waited long enough, and keeps them until the commit succeeds.
+        writer = self.monitor.writer
+        while self._next_sequence in self._waiting:
+            ready = self._waiting.pop(self._next_sequence)
+            writer.add(ready.items, ready.checkpoint)
+            self._next_sequence += 1
+        if writer.due():
+            if await asyncio.to_thread(writer.flush):
+                self._persisted.set()
+        try:
+            batch = await asyncio.wait_for(self.events.get(), writer.time_until_due())
+        except asyncio.TimeoutError:
+            return
+        self._waiting[batch.sequence] = batch
+
+    async def _deliver(self) -> None:
+        self._persisted.clear()
+        await self.monitor._process_events()
+        await self._wait_for_delivery()
+
+    async def _wait_for_delivery(self) -> None:
+        """Wait until new events are persisted, or for the poll interval."""
+        try:
+            await asyncio.wait_for(self._persisted.wait(), self.monitor.poll_interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,384 @@
+import hashlib
+import json
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from metrum.common.logger import debug_enabled, logger
+
+
+class PlanNode(NamedTuple):
+    """One node of an executed plan, reduced to the figures worth aggregating.
+
+    Times are in milliseconds and sizes in kB. Figures the plan does not
+    report, such as actual rows without ANALYZE or buffers without
+    BUFFERS, are None. The node's other properties, which describe what it
+    does rather than how it ran, are kept in attributes.
+
+    Attributes:
+        node_type: Node type as EXPLAIN names it, e.g. Seq Scan
+        relation: Relation scanned
+        index: Index scanned
+        plan_rows: Rows estimated by the planner
+        actual_rows: Rows returned per loop
+        loops: Times the node was executed
+        startup_ms: Time to the first row, per loop
+        total_ms: Time to the last row, per loop
+        shared_hit: Shared buffer hits
+        shared_read: Shared blocks read
+        shared_dirtied: Shared blocks dirtied
+        shared_written: Shared blocks written
+        temp_read: Temporary blocks read
+        temp_written: Temporary blocks written
+        sort_method: Sort method, e.g. quicksort or external merge
+        sort_space_kb: Memory or disk used by the sort
+        sort_space_type: Memory or Disk
+        hash_batches: Batches of a hash or hash aggregate
+        original_hash_batches: Batches planned before the hash table grew
+        peak_memory_kb: Memory used by a hash or hash aggregate
+        disk_kb: Disk used by a hash aggregate
+        attributes: Properties that are not figures, such as Join Type,
+            Hash Cond, Filter or Sort Key, by their EXPLAIN names
+        children: Child nodes, in plan order
+    """
+    node_type: str
+    relation: Optional[str] = None
+    index: Optional[str] = None
+    plan_rows: Optional[float] = None
+    actual_rows: Optional[float] = None
+    loops: Optional[int] = None
+    startup_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    shared_hit: Optional[int] = None
+    shared_read: Optional[int] = None
+    shared_dirtied: Optional[int] = None
+    shared_written: Optional[int] = None
+    temp_read: Optional[int] = None
+    temp_written: Optional[int] = None
+    sort_method: Optional[str] = None
+    sort_space_kb: Optional[int] = None
+    sort_space_type: Optional[str] = None
+    hash_batches: Optional[int] = None
+    original_hash_batches: Optional[int] = None
+    peak_memory_kb: Optional[int] = None
+    disk_kb: Optional[int] = None
+    attributes: Optional[Dict[str, Any]] = None
+    children: Tuple["PlanNode", ...] = ()
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the node's sort or hash did not fit in work_mem."""
+        return (
+            self.sort_space_type == "Disk"
+            or (self.hash_batches or 0) > 1
+            or bool(self.disk_kb)
+            or bool(self.temp_written)
+        )
+
+    def walk(self) -> Iterator["PlanNode"]:
+        """The node and its descendants, depth first."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The node as JSON values, leaving out the figures that are not reported."""
+        values = {field: value for field, value in zip(self._fields, self) if value is not None}
+        if self.children:
+            values["children"] = [child.to_dict() for child in self.children]
+        else:
+            del values["children"]
+        return values
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "PlanNode":
+        """Rebuild a node stored with to_dict."""
+        fields = {field: value for field, value in values.items() if field in cls._fields}
+        fields["children"] = tuple(cls.from_dict(child) for child in values.get("children", ()))
+        return cls(**fields)
+
+
+# Fields that identify a plan's shape; the rest are figures of one execution
+SHAPE_FIELDS = ("node_type", "relation", "index", "attributes")
+
+# Figures of a node, in the order plan_stats lists them
+STAT_FIELDS = tuple(field for field in PlanNode._fields if field not in SHAPE_FIELDS and field != "children")
+
+
+def plan_shape(tree: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape of a plan stored with PlanNode.to_dict: its nodes without their figures."""
+    shape = {field: tree[field] for field in SHAPE_FIELDS if field in tree}
+    if "children" in tree:
+        shape["children"] = [plan_shape(child) for child in tree["children"]]
+    return shape
+
+
+def plan_stats(tree: Dict[str, Any]) -> List[List[Any]]:
+    """Figures of every node of a plan stored with PlanNode.to_dict, depth first.
+
+    Each node's figures are listed in STAT_FIELDS order, without trailing
+    figures that are not reported, which keeps them a fraction of the size
+    of the plan.
+    """
+    stats = []
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        values = [node.get(field) for field in STAT_FIELDS]
+        while values and values[-1] is None:
+            values.pop()
+        stats.append(values)
+        pending.extend(reversed(node.get("children", ())))
+    return stats
+
+
+def join_plan(shape: Dict[str, Any], stats: List[List[Any]]) -> Dict[str, Any]:
+    """Rebuild the plan split by plan_shape and plan_stats."""
+    figures = iter(stats)
+
+    def node(shape_node: Dict[str, Any]) -> Dict[str, Any]:
+        tree = {field: shape_node[field] for field in SHAPE_FIELDS if field in shape_node}
+        tree.update((field, value) for field, value in zip(STAT_FIELDS, next(figures, ())) if value is not None)
+        if "children" in shape_node:
+            tree["children"] = [node(child) for child in shape_node["children"]]
+        return tree
+
+    return node(shape)
+
+
+def shape_hash(shape: Dict[str, Any]) -> str:
+    """Content address of a plan shape."""
+    return hashlib.sha256(json.dumps(shape, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class Plan(NamedTuple):
+    """A plan logged by auto_explain.
+
+    Attributes:
+        query_text: Statement the plan is for, if auto_explain logged it
+        root: Top node of the plan
+    """
+    query_text: Optional[str]
+    root: PlanNode
+
+
+# EXPLAIN JSON keys of the figures kept, by PlanNode field
+_JSON_FIELDS = (
+    ("relation", "Relation Name"),
+    ("index", "Index Name"),
+    ("plan_rows", "Plan Rows"),
+    ("actual_rows", "Actual Rows"),
+    ("loops", "Actual Loops"),
+    ("startup_ms", "Actual Startup Time"),
+    ("total_ms", "Actual Total Time"),
+    ("shared_hit", "Shared Hit Blocks"),
+    ("shared_read", "Shared Read Blocks"),
+    ("shared_dirtied", "Shared Dirtied Blocks"),
+    ("shared_written", "Shared Written Blocks"),
+    ("temp_read", "Temp Read Blocks"),
+    ("temp_written", "Temp Written Blocks"),
+    ("sort_method", "Sort Method"),
+    ("sort_space_kb", "Sort Space Used"),
+    ("sort_space_type", "Sort Space Type"),
+    ("hash_batches", "Hash Batches"),
+    ("original_hash_batches", "Original Hash Batches"),
+    ("peak_memory_kb", "Peak Memory Usage"),
+    ("disk_kb", "Disk Usage"),
+)
+
+
+# EXPLAIN JSON keys that are neither figures nor attributes
+_JSON_SKIPPED = frozenset(key for _, key in _JSON_FIELDS) | {"Node Type", "Plans", "Workers"}
+
+
+def _json_node(node: Dict[str, Any]) -> PlanNode:
+    """Reduce an EXPLAIN JSON plan node and its children.
+
+    Values that are not numbers, such as Join Type, Strategy, conditions
+    and keys, are the node's attributes. Numbers are costs, estimates or
+    figures of the execution.
+    """
+    fields = {field: node[key] for field, key in _JSON_FIELDS if key in node}
+    if "HashAgg Batches" in node:
+        fields["hash_batches"] = node["HashAgg Batches"]
+    attributes = {
+        key: value for key, value in node.items()
+        if key not in _JSON_SKIPPED and (isinstance(value, bool) or not isinstance(value, (int, float)))
+    }
+    if attributes:
+        fields["attributes"] = attributes
+    return PlanNode(
+        node.get("Node Type", "Unknown"),
+        children=tuple(_json_node(child) for child in node.get("Plans", ())),
+        **fields,
+    )
+
+
+def parse_json_plan(text: str) -> Optional[Plan]:
+    """Parse a plan logged with auto_explain.log_format = json.
+
+    Returns:
+        The plan, or None if text is not a complete JSON plan
+    """
+    try:
+        document = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(document, dict) or not isinstance(document.get("Plan"), dict):
+        return None
+    return Plan(document.get("Query Text"), _json_node(document["Plan"]))
+
+
+# A node line: optional arrow, label, the estimate, then the actuals under ANALYZE.
+# auto_explain always logs costs
+_NODE = re.compile(r" *(?:->  )?(?P<label>\S.*?)  \(cost=[^)]* rows=(?P<rows>\d+)[^)]*\)(?: \((?P<actual>[^)]*)\))?$")
+_LABEL = re.compile(r"(?P<type>.+?)(?: using (?P<index>\S+))?(?: on (?P<relation>\S+)(?: \S+)?)?")
+_ACTUAL = re.compile(r"actual time=([\d.]+)\.\.([\d.]+) rows=([\d.]+) loops=(\d+)|actual rows=([\d.]+) loops=(\d+)")
+_COUNTER = re.compile(r"(\w+)=(\d+)")
+_SORT = re.compile(r"Sort Method: (?P<method>.+?)  (?P<type>Memory|Disk): (?P<kb>\d+)kB")
+_BATCHES = re.compile(r"Batches: (\d+)(?: \(originally (\d+)\))?")
+_MEMORY = re.compile(r"Memory Usage: (\d+)kB")
+_DISK = re.compile(r"Disk Usage: (\d+)kB")
+# Property lines made of figures of the execution, by their start
+_TEXT_FIGURES = (
+    "Buffers: ", "Sort Method: ", "Buckets: ", "Batches: ", "Heap Blocks: ", "Worker ", "I/O Timings: ", "Hits: ",
+    "Full-sort Groups: ", "Pre-sorted Groups: ", "WAL: ", "Storage: ", "Memory: ", "Disk Usage: ",
+)
+_TEXT_ATTRIBUTE = re.compile(r"(?P<key>[A-Z][\w -]*): (?P<value>.+)")
+_FIGURE = re.compile(r"[\d.]+")
+
+
+def _number(value: str) -> float:
+    return float(value) if "." in value else int(value)
+
+
+def _text_node(match: "re.Match") -> Dict[str, Any]:
+    """Fields of a text plan node line."""
+    label = _LABEL.fullmatch(match["label"])
+    fields: Dict[str, Any] = {"node_type": label["type"], "plan_rows": int(match["rows"]), "children": []}
+    relation, index = label["relation"], label["index"]
+    if label["type"] == "Bitmap Index Scan":
+        # Bitmap index scans name their index after "on"
+        relation, index = None, relation
+    if relation:
+        fields["relation"] = relation
+    if index:
+        fields["index"] = index
+    actual = _ACTUAL.fullmatch(match["actual"] or "")
+    if actual and actual[1]:
+        fields.update(startup_ms=float(actual[1]), total_ms=float(actual[2]),
+                      actual_rows=_number(actual[3]), loops=int(actual[4]))
+    elif actual:
+        fields.update(actual_rows=_number(actual[5]), loops=int(actual[6]))
+    elif match["actual"] == "never executed":
+        fields["loops"] = 0
+    return fields
+
+
+def _text_property(fields: Dict[str, Any], text: str) -> None:
+    """Add the figures or the attribute of a text plan property line to its node."""
+    if text.startswith("Buffers: "):
+        for part in text[9:].split(", "):
+            scope, _, counters = part.partition(" ")
+            if scope in ("shared", "temp"):
+                for name, value in _COUNTER.findall(counters):
+                    fields[f"{scope}_{name}"] = int(value)
+    elif text.startswith("Sort Method: "):
+        sort = _SORT.match(text)
+        if sort:
+            fields.update(sort_method=sort["method"], sort_space_type=sort["type"], sort_space_kb=int(sort["kb"]))
+    elif text.startswith(("Buckets: ", "Batches: ")):
+        batches = _BATCHES.search(text)
+        if batches:
+            fields["hash_batches"] = int(batches[1])
+            if batches[2]:
+                fields["original_hash_batches"] = int(batches[2])
+        memory = _MEMORY.search(text)
+        if memory:
+            fields["peak_memory_kb"] = int(memory[1])
+        disk = _DISK.search(text)
+        if disk:
+            fields["disk_kb"] = int(disk[1])
+    elif not text.startswith(_TEXT_FIGURES):
+        attribute = _TEXT_ATTRIBUTE.fullmatch(text)
+        # Properties with a number for a value, such as Rows Removed by Filter, are figures
+        if attribute and not _FIGURE.fullmatch(attribute["value"]):
+            fields.setdefault("attributes", {})[attribute["key"]] = attribute["value"]
+
+
+def _build(fields: Dict[str, Any]) -> PlanNode:
+    children = tuple(_build(child) for child in fields.pop("children"))
+    return PlanNode(children=children, **fields)
+
+
+def parse_text_plan(lines: List[str]) -> Optional[Plan]:
+    """Parse a plan logged with auto_explain.log_format = text, one line at a time.
+
+    Node lines open a node under the closest less indented one, and the
+    lines after them add their buffer, sort and hash figures. Lines of the
+    query text come before the first node.
+
+    Returns:
+        The plan, or None if lines contain no plan nodes
+    """
+    query_lines: List[str] = []
+    root: Optional[Dict[str, Any]] = None
+    # Open nodes with the column their label starts at
+    stack: List[Tuple[int, Dict[str, Any]]] = []
+    for raw in lines:
+        line = raw[1:] if raw.startswith("\t") else raw
+        if not line.strip():
+            continue
+        match = _NODE.match(line) if "  (cost=" in line else None
+        if match is None:
+            if root is None:
+                query_lines.append(line)
+            elif stack and not line.startswith(" "):
+                # JIT and trigger sections follow the plan unindented
+                stack = []
+            elif stack:
+                _text_property(stack[-1][1], line.strip())
+            continue
+
+        column = match.start("label")
+        fields = _text_node(match)
+        while stack and stack[-1][0] >= column:
+            stack.pop()
+        if stack:
+            stack[-1][1]["children"].append(fields)
+        elif root is None:
+            root = fields
+        else:
+            # A second top-level node is not part of this plan
+            break
+        stack.append((column, fields))
+
+    if root is None:
+        return None
+    query_text = "\n".join(query_lines)
+    if query_text.startswith("Query Text: "):
+        query_text = query_text[12:]
+    return Plan(query_text or None, _build(root))
+
+
+def parse_plan(explain_lines: List[str]) -> Optional[Plan]:
+    """Parse an auto_explain plan in JSON or text format.
+
+    Args:
+        explain_lines: Plan text, one entry per log line
+
+    Returns:
+        The plan, or None if the lines do not hold a complete plan
+    """
+    for line in explain_lines:
+        stripped = line.strip()
+        if stripped:
+            break
+    else:
+        return None
+    if stripped.startswith("{"):
+        plan = parse_json_plan("\n".join(explain_lines))
+    else:
+        plan = parse_text_plan(explain_lines)
+    if plan is None and debug_enabled():
+        logger.debug("failed_to_parse_plan", line_count=len(explain_lines))
+    return plan
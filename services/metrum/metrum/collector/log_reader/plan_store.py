@@ -0,0 +1,81 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from metrum.db.models import ExplainPlan
+from .plan_parser import plan_shape, plan_stats, shape_hash
+
+
+def split_plan(tree: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    """Split a plan stored with PlanNode.to_dict into its shape hash, shape and figures."""
+    shape = plan_shape(tree)
+    return shape_hash(shape), shape, plan_stats(tree)
+
+
+class PlanStore:
+    """Content-addressed storage of plan shapes in the plans table.
+
+    Each shape is stored once, keyed by its hash. Ids of shapes that were
+    already committed are cached, so plans seen before cost no query.
+    """
+
+    def __init__(self, max_cached: int = 10_000):
+        """Initialize the store.
+
+        Args:
+            max_cached: Shape ids kept in memory; the cache is emptied when
+                it grows past this
+        """
+        self.max_cached = max_cached
+        self._ids: Dict[str, int] = {}
+
+    def resolve(self, session: Session, plans: Dict[str, Tuple[Dict[str, Any], Optional[str]]]) -> Dict[str, int]:
+        """Ids of plan shapes, storing the ones not stored yet in the session's transaction.
+
+        Args:
+            session: Session to query and insert in
+            plans: Shape and example explain text, by shape hash
+
+        Returns:
+            Plan ids by shape hash
+        """
+        ids = {digest: self._ids[digest] for digest in plans if digest in self._ids}
+        missing = [digest for digest in plans if digest not in ids]
+        if not missing:
+            return ids
+
+        found = self._lookup(session, missing)
+        # Only ids committed before this transaction are safe to keep if it
+        # is rolled back
+        if len(self._ids) + len(found) > self.max_cached:
+            self._ids.clear()
+        self._ids.update(found)
+        ids.update(found)
+
+        new = [digest for digest in missing if digest not in found]
+        if new:
+            session.execute(self._insert(session), [
+                {"shape_hash": digest, "shape": plans[digest][0], "explain_text": plans[digest][1]}
+                for digest in new
+            ])
+            # Shapes inserted concurrently by another writer are looked up too
+            ids.update(self._lookup(session, new))
+        return ids
+
+    @staticmethod
+    def _lookup(session: Session, digests: List[str]) -> Dict[str, int]:
+        return dict(session.execute(
+            select(ExplainPlan.shape_hash, ExplainPlan.id).where(ExplainPlan.shape_hash.in_(digests))
+        ).all())
+
+    @staticmethod
+    def _insert(session: Session):
+        """INSERT that skips shapes another writer stored first."""
+        dialect = session.connection().dialect.name
+        if dialect == "postgresql":
+            return postgresql.insert(ExplainPlan).on_conflict_do_nothing(index_elements=["shape_hash"])
+        if dialect == "sqlite":
+            return sqlite.insert(ExplainPlan).on_conflict_do_nothing(index_elements=["shape_hash"])
+        return insert(ExplainPlan)
@@ -0,0 +1,260 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple, Optional
+
+from metrum.common.logger import debug_enabled, logger
+from .line_classifier import LineClassifier, LineKind
+
+
+class AssembledStatement(NamedTuple):
+    """A statement reassembled from the log lines of a single backend.
+
+    Attributes:
+        session: Session key the statement was logged under
+        timestamp: Raw timestamp token of the statement's first line
+        query_lines: Statement text, one entry per log line
+        explain_lines: auto_explain plan text, one entry per log line
+        duration_ms: Duration reported with the plan
+        offset: Offset of the batch the statement started in
+        query_id: Query identifier computed by the server, if logged
+    """
+    session: Optional[str]
+    timestamp: Optional[str]
+    query_lines: List[str]
+    explain_lines: List[str]
+    duration_ms: Optional[float]
+    offset: int = 0
+    query_id: Optional[str] = None
+
+
+# Sentinel for "no session seen yet"; None is a valid session key
+_NO_SESSION = object()
+
+
+class _SessionBuffer:
+    """Query and explain buffers of one backend."""
+
+    __slots__ = ("query_lines", "explain_lines", "duration_ms", "timestamp", "last_seen", "offset", "query_id")
+
+    def __init__(self, now: float):
+        self.query_lines: List[str] = []
+        self.explain_lines: List[str] = []
+        self.duration_ms: Optional[float] = None
+        self.timestamp: Optional[str] = None
+        self.last_seen = now
+        # Offset of the batch the buffered statement started in
+        self.offset = 0
+        self.query_id: Optional[str] = None
+
+
+class SessionAssembler:
+    """Assembles statements per backend so interleaved sessions do not mix.
+
+    Lines are keyed by the session ID ("%c") or process ID ("%p") found in
+    their log_line_prefix; unprefixed continuation lines belong to the
+    session of the last prefixed line. Each session keeps its own bounded
+    query and explain buffers. Sessions are kept in LRU order and the least
+    recently active one is flushed once more than max_sessions are open, and
+    sessions that stay quiet for idle_timeout seconds are flushed by
+    flush_idle.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1024,
+        max_buffer_lines: int = 10_000,
+        idle_timeout: float = 30.0,
+        classifier: Optional[LineClassifier] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the assembler.
+
+        Args:
+            max_sessions: Number of sessions to buffer before evicting the
+                least recently active one
+            max_buffer_lines: Maximum lines kept per query or explain buffer;
+                further continuation lines are dropped
+            idle_timeout: Seconds without new lines after which a session
+                is flushed
+            classifier: Line classifier to use. Defaults to LineClassifier()
+            clock: Monotonic clock, in seconds
+        """
+        self.max_sessions = max_sessions
+        self.max_buffer_lines = max_buffer_lines
+        self.idle_timeout = idle_timeout
+        self.classifier = classifier or LineClassifier()
+        self.clock = clock
+        self.sessions: "OrderedDict[Optional[str], _SessionBuffer]" = OrderedDict()
+        self.dropped_lines = 0
+        # Buffer that unprefixed continuation lines belong to, if any
+        self._continuation: Optional[List[str]] = None
+
+    def feed(self, lines: Iterable[str], offset: int = 0) -> List[AssembledStatement]:
+        """Consume log lines and return the statements they complete.
+
+        Args:
+            lines: Raw log lines in file order
+            offset: File offset of the first line, reported by pending_offset
+                for statements that start in this batch
+
+        Returns:
+            Completed statements, in the order they were completed
+        """
+        completed: List[AssembledStatement] = []
+        classify = self.classifier.classify
+        sessions = self.sessions
+        limit = self.max_buffer_lines
+        now = self.clock()
+        query, explain, temp_file = LineKind.QUERY, LineKind.EXPLAIN, LineKind.TEMP_FILE
+        # Kept in locals while looping: continuation lines are the common case
+        # and consecutive lines usually come from the same session
+        continuation = self._continuation
+        last_key, last_buffer = _NO_SESSION, None
+        for line in lines:
+            parsed = classify(line)
+            if parsed is None:
+                if continuation is not None:
+                    if len(continuation) < limit:
+                        continuation.append(line.rstrip("\r\n"))
+                    else:
+                        self.dropped_lines += 1
+                continue
+
+            key = parsed.session_id or parsed.pid
+            if key == last_key:
+                buffer = last_buffer
+            else:
+                buffer = sessions.get(key)
+                if buffer is None:
+                    buffer = sessions[key] = _SessionBuffer(now)
+                    if len(sessions) > self.max_sessions:
+                        self._evict(completed)
+                else:
+                    sessions.move_to_end(key)
+                    buffer.last_seen = now
+                last_key, last_buffer = key, buffer
+
+            kind = parsed.kind
+            if kind is query:
+                # A new statement completes the previous one of this session
+                if buffer.query_lines:
+                    completed.append(self._complete(key, buffer))
+                elif buffer.explain_lines:
+                    # A plan whose statement was logged before reading started
+                    buffer.explain_lines = []
+                    buffer.duration_ms = None
+                buffer.query_lines = continuation = [parsed.payload]
+                buffer.timestamp = parsed.timestamp
+                buffer.offset = offset
+                buffer.query_id = parsed.query_id
+
+            elif kind is explain:
+                if not buffer.query_lines and not buffer.explain_lines:
+                    buffer.offset = offset
+                if parsed.payload:
+                    buffer.explain_lines.append(parsed.payload)
+                buffer.duration_ms = parsed.duration_ms
+                if parsed.query_id is not None:
+                    buffer.query_id = parsed.query_id
+                continuation = buffer.explain_lines
+
+            elif kind is temp_file:
+                # This is the end of an explain plan
+                if buffer.explain_lines:
+                    completed.append(self._complete(key, buffer))
+                continuation = None
+
+            elif parsed.payload.startswith("disconnection: "):
+                del sessions[key]
+                last_key = _NO_SESSION
+                if buffer.query_lines:
+                    completed.append(self._complete(key, buffer))
+                continuation = None
+
+            else:
+                continuation = None
+
+        self._continuation = continuation
+        return completed
+
+    def pending_offset(self) -> Optional[int]:
+        """Offset of the batch the oldest buffered statement started in, if any."""
+        offsets = [
+            buffer.offset
+            for buffer in self.sessions.values()
+            if buffer.query_lines or buffer.explain_lines
+        ]
+        return min(offsets) if offsets else None
+
+    def start_next_file(self, carry_over: bool = True) -> None:
+        """Move the statements still open at the end of a rotated file to the next one.
+
+        Their offsets are reset to the start of the next file, so
+        pending_offset stays an offset in the file being read.
+
+        Args:
+            carry_over: Whether to keep the open statements; they are
+                dropped when the next file's checkpoint shows that they were
+                already committed
+        """
+        if not carry_over:
+            self.sessions.clear()
+            self._continuation = None
+            return
+        for buffer in self.sessions.values():
+            buffer.offset = 0
+
+    def flush_idle(self) -> List[AssembledStatement]:
+        """Flush and forget sessions that have been idle for idle_timeout seconds."""
+        completed: List[AssembledStatement] = []
+        deadline = self.clock() - self.idle_timeout
+        sessions = self.sessions
+        # Sessions are in LRU order, so the idle ones are at the front
+        while sessions:
+            key, buffer = next(iter(sessions.items()))
+            if buffer.last_seen > deadline:
+                break
+            del sessions[key]
+            if buffer.query_lines:
+                completed.append(self._complete(key, buffer))
+        if completed:
+            self._continuation = None
+        return completed
+
+    def flush_all(self) -> List[AssembledStatement]:
+        """Flush every buffered statement, e.g. at end of input."""
+        completed = [
+            self._complete(key, buffer)
+            for key, buffer in self.sessions.items()
+            if buffer.query_lines
+        ]
+        self.sessions.clear()
+        self._continuation = None
+        return completed
+
+    def _evict(self, completed: List[AssembledStatement]) -> None:
+        """Flush the least recently active session to keep memory bounded."""
+        key, buffer = self.sessions.popitem(last=False)
+        if debug_enabled():
+            logger.debug("evicted_session_buffer", session=key, session_count=len(self.sessions))
+        if buffer.query_lines:
+            completed.append(self._complete(key, buffer))
+
+    @staticmethod
+    def _complete(key: Optional[str], buffer: _SessionBuffer) -> AssembledStatement:
+        """Build a statement from a session's buffers and reset them."""
+        statement = AssembledStatement(
+            key,
+            buffer.timestamp,
+            buffer.query_lines,
+            buffer.explain_lines,
+            buffer.duration_ms,
+            buffer.offset,
+            buffer.query_id,
+        )
+        buffer.query_lines = []
+        buffer.explain_lines = []
+        buffer.duration_ms = None
+        buffer.timestamp = None
+        buffer.query_id = None
+        return statement
@@ -0,0 +1,344 @@
+import csv
+import json
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, NamedTuple, Optional, Union
+
+from metrum.common.logger import debug_enabled, logger
+from .line_classifier import _parse_duration
+from .session_assembler import AssembledStatement
+
+LOG_FORMATS = ("stderr", "csvlog", "jsonlog")
+
+# Columns of a csvlog row; backend_type, leader_pid and query_id were added
+# in PostgreSQL 13 and 14
+_CSV_LOG_TIME = 0
+_CSV_USER = 1
+_CSV_DATABASE = 2
+_CSV_PID = 3
+_CSV_SESSION_ID = 5
+_CSV_SEVERITY = 11
+_CSV_MESSAGE = 13
+_CSV_APPLICATION = 22
+_CSV_QUERY_ID = 25
+_CSV_MIN_COLUMNS = _CSV_APPLICATION + 1
+
+
+class LogRecord(NamedTuple):
+    """A single message from a csvlog or jsonlog file.
+
+    Attributes:
+        timestamp: Raw log time, in the same format as a %m prefix
+        pid: Backend process ID
+        session_id: Session ID
+        user: User name
+        database: Database name
+        application: Application name
+        severity: Severity label (LOG, ERROR, ...)
+        message: Full message text, including embedded newlines
+        query_id: Query identifier computed by the server, if enabled
+    """
+    timestamp: Optional[str]
+    pid: Optional[str]
+    session_id: Optional[str]
+    user: Optional[str]
+    database: Optional[str]
+    application: Optional[str]
+    severity: str
+    message: str
+    query_id: Optional[str] = None
+
+
+class CsvLogParser:
+    """Streaming parser for csvlog files.
+
+    A record may span several lines when a quoted field contains newlines.
+    Records are framed by quote parity: a line that ends while an even
+    number of quotes has been seen completes the record. Incomplete records
+    at the end of a batch are kept until the next feed.
+    """
+
+    def __init__(self):
+        """Initialize the parser."""
+        self._pending: List[str] = []
+        self.skipped_records = 0
+
+    @property
+    def has_partial_record(self) -> bool:
+        """Whether the lines of a record still incomplete are kept for the next feed."""
+        return bool(self._pending)
+
+    def feed(self, lines: Iterable[str]) -> List[LogRecord]:
+        """Parse the records completed by a batch of lines.
+
+        Args:
+            lines: Raw lines in file order, including their newlines
+
+        Returns:
+            The completed records
+        """
+        buffer = self._pending + list(lines) if self._pending else list(lines)
+        quotes = 0
+        complete = 0
+        for index, line in enumerate(buffer):
+            quotes += line.count('"')
+            if not quotes & 1 and line.endswith("\n"):
+                complete = index + 1
+                quotes = 0
+        self._pending = buffer[complete:]
+
+        records: List[LogRecord] = []
+        for row in csv.reader(buffer[:complete]):
+            if len(row) < _CSV_MIN_COLUMNS:
+                self.skipped_records += 1
+                if debug_enabled():
+                    logger.debug("skipped_csvlog_record", column_count=len(row))
+                continue
+            records.append(LogRecord(
+                row[_CSV_LOG_TIME] or None,
+                row[_CSV_PID] or None,
+                row[_CSV_SESSION_ID] or None,
+                row[_CSV_USER] or None,
+                row[_CSV_DATABASE] or None,
+                row[_CSV_APPLICATION] or None,
+                row[_CSV_SEVERITY],
+                row[_CSV_MESSAGE],
+                row[_CSV_QUERY_ID] if len(row) > _CSV_QUERY_ID and row[_CSV_QUERY_ID] not in ("", "0") else None,
+            ))
+        return records
+
+
+class JsonLogParser:
+    """Streaming parser for jsonlog files.
+
+    Each record is a JSON object on its own line, with newlines in values
+    escaped, so a partial last line is the only framing concern.
+    """
+
+    def __init__(self):
+        """Initialize the parser."""
+        self._pending = ""
+        self.skipped_records = 0
+
+    @property
+    def has_partial_record(self) -> bool:
+        """Whether a partial last line is kept for the next feed."""
+        return bool(self._pending)
+
+    def feed(self, lines: Iterable[str]) -> List[LogRecord]:
+        """Parse the records completed by a batch of lines.
+
+        Args:
+            lines: Raw lines in file order, including their newlines
+
+        Returns:
+            The completed records
+        """
+        records: List[LogRecord] = []
+        loads = json.loads
+        for line in lines:
+            if self._pending:
+                line = self._pending + line
+                self._pending = ""
+            if not line.endswith("\n"):
+                self._pending = line
+                continue
+            try:
+                record = loads(line)
+            except ValueError:
+                self.skipped_records += 1
+                if debug_enabled():
+                    logger.debug("skipped_jsonlog_record", line_length=len(line))
+                continue
+            pid = record.get("pid")
+            query_id = record.get("query_id")
+            records.append(LogRecord(
+                record.get("timestamp"),
+                str(pid) if pid is not None else None,
+                record.get("session_id"),
+                record.get("user"),
+                record.get("dbname"),
+                record.get("application_name"),
+                record.get("error_severity", ""),
+                record.get("message", ""),
+                str(query_id) if query_id else None,
+            ))
+        return records
+
+
+RecordParser = Union[CsvLogParser, JsonLogParser]
+
+
+def create_record_parser(log_format: str) -> RecordParser:
+    """Create the record parser for a structured log format.
+
+    Args:
+        log_format: "csvlog" or "jsonlog"
+
+    Returns:
+        A streaming parser for the format
+
+    Raises:
+        ValueError: If the format is not a structured log format
+    """
+    if log_format == "csvlog":
+        return CsvLogParser()
+    if log_format == "jsonlog":
+        return JsonLogParser()
+    raise ValueError(f"Unsupported structured log format: {log_format}")
+
+
+class _PendingQuery:
+    """Statement of a session still waiting for its plan."""
+
+    __slots__ = ("statement", "timestamp", "last_seen", "offset", "query_id")
+
+    def __init__(self, statement: str, timestamp: Optional[str], now: float, offset: int, query_id: Optional[str]):
+        self.statement = statement
+        self.timestamp = timestamp
+        self.last_seen = now
+        self.offset = offset
+        self.query_id = query_id
+
+
+class RecordAssembler:
+    """Assembles statements from csvlog or jsonlog records.
+
+    Every record is one complete message with its session in a dedicated
+    field, so there are no continuation lines to buffer: a session only
+    remembers its last statement until the auto_explain plan for it
+    arrives. The interface matches SessionAssembler, so LogMonitor can use
+    either.
+    """
+
+    def __init__(
+        self,
+        parser: RecordParser,
+        max_sessions: int = 1024,
+        idle_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the assembler.
+
+        Args:
+            parser: Parser for the log format being read
+            max_sessions: Number of sessions with a pending statement to keep
+                before flushing the least recently active one
+            idle_timeout: Seconds after which a statement without a plan is
+                flushed
+            clock: Monotonic clock, in seconds
+        """
+        self.parser = parser
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.sessions: "OrderedDict[Optional[str], _PendingQuery]" = OrderedDict()
+        # Offset of the batch a record still incomplete in the parser started in
+        self._parser_offset: Optional[int] = None
+
+    def feed(self, lines: Iterable[str], offset: int = 0) -> List[AssembledStatement]:
+        """Consume log lines and return the statements they complete.
+
+        Args:
+            lines: Raw lines in file order, including their newlines
+            offset: File offset of the first line, reported by pending_offset
+                for statements that start in this batch
+
+        Returns:
+            Completed statements, in the order they were completed
+        """
+        completed: List[AssembledStatement] = []
+        sessions = self.sessions
+        now = self.clock()
+        records = self.parser.feed(lines)
+        if not self.parser.has_partial_record:
+            self._parser_offset = None
+        elif self._parser_offset is None or records:
+            self._parser_offset = offset
+        for record in records:
+            if record.severity != "LOG":
+                continue
+            message = record.message
+            key = record.session_id or record.pid
+
+            if message.startswith("execute "):
+                pending = sessions.pop(key, None)
+                if pending is not None:
+                    completed.append(_statement(key, pending))
+                statement_at = message.find(": ", 8)
+                statement = message[statement_at + 2:] if statement_at >= 0 else message
+                sessions[key] = _PendingQuery(statement, record.timestamp, now, offset, record.query_id)
+                if len(sessions) > self.max_sessions:
+                    evicted_key, evicted = sessions.popitem(last=False)
+                    if debug_enabled():
+                        logger.debug("evicted_session_buffer", session=evicted_key, session_count=len(sessions))
+                    completed.append(_statement(evicted_key, evicted))
+
+            elif message.startswith("duration: "):
+                plan_at = message.find("  plan:", 10)
+                if plan_at < 0:
+                    continue
+                pending = sessions.pop(key, None)
+                if pending is None:
+                    continue
+                completed.append(AssembledStatement(
+                    key,
+                    pending.timestamp,
+                    [pending.statement],
+                    [message[plan_at + 7:].lstrip()],
+                    _parse_duration(message, plan_at),
+                    pending.offset,
+                    record.query_id or pending.query_id,
+                ))
+
+            elif message.startswith("disconnection: "):
+                pending = sessions.pop(key, None)
+                if pending is not None:
+                    completed.append(_statement(key, pending))
+        return completed
+
+    def pending_offset(self) -> Optional[int]:
+        """Offset of the batch the oldest pending statement or record started in, if any."""
+        offsets = [pending.offset for pending in self.sessions.values()]
+        if self._parser_offset is not None:
+            offsets.append(self._parser_offset)
+        return min(offsets) if offsets else None
+
+    def start_next_file(self, carry_over: bool = True) -> None:
+        """Move the statements still open at the end of a rotated file to the next one.
+
+        Args:
+            carry_over: Whether to keep the open statements; they are
+                dropped when the next file's checkpoint shows that they were
+                already committed
+        """
+        if not carry_over:
+            self.sessions.clear()
+        for pending in self.sessions.values():
+            pending.offset = 0
+        if self._parser_offset is not None:
+            self._parser_offset = 0
+
+    def flush_idle(self) -> List[AssembledStatement]:
+        """Flush statements whose session has been idle for idle_timeout seconds."""
+        completed: List[AssembledStatement] = []
+        deadline = self.clock() - self.idle_timeout
+        sessions = self.sessions
+        while sessions:
+            key, pending = next(iter(sessions.items()))
+            if pending.last_seen > deadline:
+                break
+            del sessions[key]
+            completed.append(_statement(key, pending))
+        return completed
+
+    def flush_all(self) -> List[AssembledStatement]:
+        """Flush every pending statement, e.g. at end of input."""
+        completed = [_statement(key, pending) for key, pending in self.sessions.items()]
+        self.sessions.clear()
+        return completed
+
+
+def _statement(key: Optional[str], pending: _PendingQuery) -> AssembledStatement:
+    """Build a statement that completed without a plan."""
+    return AssembledStatement(key, pending.timestamp, [pending.statement], [], None, pending.offset, pending.query_id)
@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from .log_line_prefix import LogLinePrefix
+from .timestamp_decoder import TimestampDecoder
+
+# Bytes read from the end of a file to find its last timestamp
+TAIL_PROBE_BYTES = 64 * 1024
+
+# log_line_prefix equivalents of where the timestamp sits in structured logs
+STRUCTURED_TIMESTAMP_PREFIXES = {
+    "csvlog": "%m,",
+    "jsonlog": '{"timestamp":"%m"',
+}
+
+
+class LineTimestamps:
+    """Extracts the timestamp from the prefix of raw log lines."""
+
+    def __init__(self, prefix: LogLinePrefix, decoder: Optional[TimestampDecoder] = None):
+        """Initialize the extractor.
+
+        Args:
+            prefix: Parser for the log_line_prefix; it must contain %m, %t or %n
+            decoder: Timestamp decoder. Defaults to a new TimestampDecoder
+        """
+        self.parse = prefix.parse
+        self.decoder = decoder or TimestampDecoder()
+
+    def __call__(self, line: bytes) -> Optional[datetime]:
+        """Return the timestamp of a line, or None for continuation lines."""
+        fields = self.parse(line.decode("utf-8", errors="replace"))
+        if fields is None or fields.timestamp is None:
+            return None
+        return self.decoder.decode(fields.timestamp)
+
+
+def first_timestamp(
+    f: BinaryIO,
+    offset: int,
+    limit: int,
+    timestamp_of: Callable[[bytes], Optional[datetime]],
+) -> Tuple[Optional[datetime], int, int]:
+    """Find the first timestamped line that starts at or after an offset.
+
+    Args:
+        f: Log file opened in binary mode
+        offset: Offset to search from; a partial line there is skipped
+        limit: Offset at which to give up
+        timestamp_of: Extracts the timestamp of a line
+
+    Returns:
+        The timestamp and the start and end offsets of its line, or
+        (None, limit, limit) if no line before limit has a timestamp
+    """
+    f.seek(offset)
+    position = offset
+    if offset:
+        position += len(f.readline())
+    while position < limit:
+        line = f.readline()
+        if not line:
+            break
+        timestamp = timestamp_of(line)
+        if timestamp is not None:
+            return timestamp, position, position + len(line)
+        position += len(line)
+    return None, limit, limit
+
+
+def last_timestamp(
+    f: BinaryIO,
+    size: int,
+    timestamp_of: Callable[[bytes], Optional[datetime]],
+) -> Optional[datetime]:
+    """Find the timestamp of the last timestamped line in the final bytes of a file.
+
+    Args:
+        f: Log file opened in binary mode
+        size: Size of the file
+        timestamp_of: Extracts the timestamp of a line
+
+    Returns:
+        The timestamp, or None if the tail of the file has none
+    """
+    start = max(size - TAIL_PROBE_BYTES, 0)
+    f.seek(start)
+    lines = f.read(size - start).split(b"\n")
+    if start:
+        lines = lines[1:]
+    for line in reversed(lines):
+        timestamp = timestamp_of(line)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def seek_time(
+    f: BinaryIO,
+    size: int,
+    start_time: datetime,
+    timestamp_of: Callable[[bytes], Optional[datetime]],
+) -> int:
+    """Binary search for the first line logged at or after start_time.
+
+    Log lines are assumed to be in time order, which holds up to the small
+    reordering between concurrent backends.
+
+    Args:
+        f: Log file opened in binary mode
+        size: Size of the file
+        start_time: Time to seek to
+        timestamp_of: Extracts the timestamp of a line
+
+    Returns:
+        Offset of a line boundary such that every timestamped line before it
+        was logged before start_time
+    """
+    low, high = 0, size
+    while low < high:
+        middle = (low + high) // 2
+        timestamp, _, line_end = first_timestamp(f, middle, high, timestamp_of)
+        if timestamp is None or timestamp >= start_time:
+            high = middle
+        else:
+            low = line_end
+    return low
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from metrum.common.logger import debug_enabled, logger
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Zone abbreviations PostgreSQL prints for UTC log_timezone settings
+_UTC_ZONES = frozenset({"UTC", "GMT", "UCT", "UT", "Z", "Etc/UTC", "Etc/GMT"})
+
+
+def parse_zone_offset(zone: str) -> Optional[timedelta]:
+    """Parse the zone of a logged timestamp into an offset from UTC.
+
+    Args:
+        zone: Zone token such as "GMT", "+05", "-0330" or "+05:30"
+
+    Returns:
+        The offset, or None if the zone is an abbreviation whose offset
+        cannot be known without the server's time zone database
+    """
+    if zone in _UTC_ZONES:
+        return timedelta(0)
+    if len(zone) < 2 or zone[0] not in "+-":
+        return None
+    digits = zone[1:].replace(":", "")
+    if not digits.isdigit() or len(digits) not in (1, 2, 4):
+        return None
+    offset = timedelta(hours=int(digits[:2]), minutes=int(digits[2:] or 0))
+    return -offset if zone[0] == "-" else offset
+
+
+class TimestampDecoder:
+    """Decodes %m, %t and %n log_line_prefix timestamps with a per-second cache.
+
+    Consecutive log lines almost always share their second, so the costly
+    part of the work, parsing the date, time and zone, is done once per
+    distinct second and cached under the token text up to the seconds.
+    Decoding a line is then a dictionary lookup plus setting the
+    milliseconds on the cached value.
+
+    Timestamps logged in UTC or with a numeric offset are returned as naive
+    UTC datetimes. Zone abbreviations without a known offset (e.g. "CEST")
+    are returned as logged, in the server's local time.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        """Initialize the decoder.
+
+        Args:
+            max_entries: Number of distinct seconds to cache before the
+                cache is cleared
+        """
+        self.max_entries = max_entries
+        self._seconds: Dict[str, datetime] = {}
+
+    def decode(self, value: str) -> Optional[datetime]:
+        """Decode a timestamp token taken from a log line prefix.
+
+        Args:
+            value: Raw %m ("2025-03-08 17:06:20.123 GMT"), %t
+                ("2025-03-08 17:06:20 GMT") or %n ("1741453580.123") token
+
+        Returns:
+            The decoded timestamp, or None if the token is malformed
+        """
+        if value[19:20] == ".":
+            # %m: the milliseconds sit between the seconds and the zone
+            key = value[:19] + value[23:]
+            millis = value[20:23]
+        elif value[10:11] == ".":
+            # %n: seconds since the epoch, with milliseconds
+            key = value[:10]
+            millis = value[11:14]
+        else:
+            key = value
+            millis = None
+
+        base = self._seconds.get(key)
+        if base is None:
+            base = self._decode_second(key)
+            if base is None:
+                return None
+            if len(self._seconds) >= self.max_entries:
+                self._seconds.clear()
+            self._seconds[key] = base
+
+        if millis is None:
+            return base
+        if not millis.isdigit():
+            return None
+        return base.replace(microsecond=int(millis) * 1000)
+
+    @staticmethod
+    def _decode_second(key: str) -> Optional[datetime]:
+        """Parse a timestamp truncated to the second, normalizing its zone."""
+        try:
+            if key[4:5] != "-":
+                return _EPOCH + timedelta(seconds=int(key))
+            # Positional fields instead of strptime, which is far slower
+            moment = datetime(
+                int(key[0:4]), int(key[5:7]), int(key[8:10]),
+                int(key[11:13]), int(key[14:16]), int(key[17:19]),
+            )
+        except ValueError:
+            if debug_enabled():
+                logger.debug("failed_to_parse_timestamp", value=key)
+            return None
+
+        zone = key[20:]
+        if not zone:
+            return moment
+        offset = parse_zone_offset(zone)
+        if offset is None:
+            if debug_enabled():
+                logger.debug("unknown_timestamp_zone", zone=zone)
+            return moment
+        return moment - offset
@@ -68,7 +68,8 @@ class MetricsCollector:
         for collector in self.collectors:
             try:
                 collector.last_collection_time = collection_time
-                results[collector.table_name] = collector.collect()
+                # Collectors query the database synchronously
+                results[collector.table_name] = await asyncio.to_thread(collector.collect)
                 logger.debug(f"Collected metrics from {collector.table_name}")
             except Exception as e:
                 logger.error(f"Error collecting metrics from {collector.table_name}: {e}")
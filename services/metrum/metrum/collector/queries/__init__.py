@@ -1,7 +1,10 @@
 """Query pattern matching and configuration for Metrum."""
 
-from .patterns import Pattern, PatternConfig, PatternLoader
+from .patterns import Pattern, PatternConfig, PatternDiff, PatternLoader, PatternRefresher, diff_patterns
+from metrum.common.fingerprint import Fingerprint, fingerprint, normalize_query
+from .analysis_cache import QueryAnalysisCache, query_analysis_cache
 from .query import MetrumQuery, QueryType
+from .relations import RelationCatalog, extract_relations
 from .query_cache import MetrumQueryCache
 from .query_cache_db import MetrumQueryCacheDb
 from .log_monitor import LogMonitorService
@@ -9,9 +12,19 @@ from .log_monitor import LogMonitorService
 __all__ = [
     "Pattern", 
     "PatternConfig", 
+    "PatternDiff",
     "PatternLoader", 
+    "PatternRefresher",
+    "diff_patterns",
+    "Fingerprint",
+    "fingerprint",
+    "normalize_query",
     "MetrumQuery", 
     "QueryType",
+    "QueryAnalysisCache",
+    "query_analysis_cache",
+    "RelationCatalog",
+    "extract_relations",
     "MetrumQueryCache",
     "MetrumQueryCacheDb",
     "LogMonitorService"
@@ -0,0 +1,125 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from metrum.common.logger import debug_enabled, logger
+from metrum.settings import settings
+
+# Estimated bytes of an entry besides its strings: the analysis tuple, the
+# LRU links and the dict slot
+_ENTRY_OVERHEAD = 400
+
+# Estimated bytes per condition of a WHERE clause AST
+_CONDITION_BYTES = 300
+
+
+class QueryAnalysis(NamedTuple):
+    """The fields MetrumQuery.from_query derives from a query's text.
+
+    Attributes:
+        query_hash: Hash of the query's fingerprint
+        normalized_query: Query with its constants replaced by placeholders
+        query_type: QueryType of the query
+        relations: Tables and views referenced in the query, which are
+            told apart when a query is built, as views can be created
+            and dropped
+        where_clause_ast: WHERE clause AST, if the query has one
+    """
+    query_hash: str
+    normalized_query: str
+    query_type: Any
+    relations: Tuple[str, ...]
+    where_clause_ast: Optional[Dict[str, Any]]
+
+
+def _entry_bytes(query: str, analysis: QueryAnalysis) -> int:
+    """Estimated memory held by a cached analysis, including its key."""
+    size = _ENTRY_OVERHEAD + sys.getsizeof(query) + sys.getsizeof(analysis.normalized_query)
+    size += sys.getsizeof(analysis.query_hash)
+    size += sum(sys.getsizeof(name) for name in analysis.relations)
+    if analysis.where_clause_ast is not None:
+        size += _CONDITION_BYTES * (len(analysis.where_clause_ast.get("conditions", ())) + 1)
+    return size
+
+
+class QueryAnalysisCache:
+    """LRU cache of query analyses, bounded by an estimate of the memory it holds.
+
+    Entries are keyed by the raw query text. Python caches a string's hash
+    on the string, so a lookup for a statement read once and analysed many
+    times hashes it once and costs a dict probe: hits do no tokenizing or
+    parsing. Statements that differ in whitespace or constants are separate
+    entries.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            max_bytes: Estimated memory budget; the least recently used
+                entries are evicted beyond it, and 0 disables caching
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[QueryAnalysis, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, query: str) -> Optional[QueryAnalysis]:
+        """Return the cached analysis of a query and mark it recently used, if cached."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query: str, analysis: QueryAnalysis) -> None:
+        """Cache the analysis of a query, evicting the least recently used entries over budget."""
+        size = _entry_bytes(query, analysis)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(query, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[query] = (analysis, size)
+            self.bytes += size
+            evicted = 0
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                evicted += 1
+            self.evictions += evicted
+        if evicted and debug_enabled():
+            logger.debug("evicted_query_analyses", evicted_count=evicted, cached_bytes=self.bytes)
+
+    def clear(self) -> None:
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and size of the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+query_analysis_cache = QueryAnalysisCache(settings.query_analysis_cache_mb * 1024 * 1024)
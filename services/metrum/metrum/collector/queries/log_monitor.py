@@ -1,7 +1,24 @@
+import asyncio
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import create_engine
+
 from metrum.common.logger import logger
-from metrum.collector.log_reader import LogMonitor, create_log_reader
+from metrum.collector.log_reader import (
+    Backfill,
+    BackfillOptions,
+    CheckpointStore,
+    EventSender,
+    LogLinePrefix,
+    LogMonitor,
+    Outbox,
+    OutboxWorker,
+    create_log_reader,
+)
+from metrum.db import get_connection
 from metrum.settings import settings
-from metrum.collector.queries import PatternLoader
+from metrum.collector.queries import PatternConfig, PatternLoader, PatternRefresher
 
 class LogMonitorService:
     """Service for monitoring PostgreSQL logs and processing patterns."""
@@ -11,13 +28,51 @@ class LogMonitorService:
         self.logs_directory = settings.logs_dir
         self.reader = create_log_reader(logs_dir=self.logs_directory)
         self.pattern_loader = PatternLoader()
+        # csvlog and jsonlog records do not carry a log_line_prefix
+        self.log_line_prefix = self._resolve_log_line_prefix() if settings.log_format == "stderr" else None
+
+    def _resolve_log_line_prefix(self) -> LogLinePrefix:
+        """Build the log line parser for the monitored server's log_line_prefix.
+
+        The prefix is taken from the log_line_prefix setting, then from the
+        configured postgresql.conf, then from the server itself. PostgreSQL's
+        default prefix is assumed if none of them is available.
+        """
+        if settings.log_line_prefix is not None:
+            logger.debug("using_configured_log_line_prefix", prefix=settings.log_line_prefix)
+            return LogLinePrefix(settings.log_line_prefix)
+
+        if settings.postgres_config_file is not None:
+            try:
+                prefix = LogLinePrefix.from_config_file(settings.postgres_config_file)
+                logger.debug("read_log_line_prefix_from_config",
+                           file=str(settings.postgres_config_file),
+                           prefix=prefix.prefix)
+                return prefix
+            except OSError as e:
+                logger.warning("failed_to_read_postgres_config",
+                             file=str(settings.postgres_config_file),
+                             error=str(e))
+
+        try:
+            with get_connection() as conn:
+                prefix = LogLinePrefix.from_connection(conn)
+            logger.debug("read_log_line_prefix_from_server", prefix=prefix.prefix)
+            return prefix
+        except Exception as e:
+            logger.warning("failed_to_read_log_line_prefix", error=str(e))
+
+        prefix = LogLinePrefix()
+        logger.warning("using_default_log_line_prefix", prefix=prefix.prefix)
+        return prefix
     
     async def run(self):
         """Run the log monitoring service."""
         logger.info("starting_log_monitor_service")
         logger.debug("using_logs_directory", directory=str(self.logs_directory))
         
-        log_files = self.reader.get_log_files()
+        # Compressed rotated files cannot be followed; backfill imports them
+        log_files = self.reader.get_log_files(include_compressed=False)
         if not log_files:
             error_msg = f"Error: No log files found in {self.logs_directory}"
             logger.error("no_log_files_found", directory=str(self.logs_directory))
@@ -34,41 +89,147 @@ class LogMonitorService:
             await self._process_latest_log(log_files, pattern_config)
     
     async def _process_all_logs(self, log_files, pattern_config):
-        """Process all log files from the beginning."""
+        """Process all log files from the beginning, then keep following new ones.
+
+        After a restart, processing starts at the oldest file that was not
+        read to its end; each later file resumes from its own checkpoint.
+        """
         logger.info("processing_all_log_files", count=len(log_files))
+        checkpoints = CheckpointStore(create_engine(settings.database_url))
+        first_log = checkpoints.first_unfinished(log_files) or log_files[-1]
+        monitor = self._create_monitor(first_log, pattern_config)
         
-        for log_file in log_files:
-            logger.info("processing_log_file", file=str(log_file))
-            
-            monitor = LogMonitor(
-                log_file_path=str(log_file),
-                patterns=pattern_config.patterns,
-                http_endpoint=settings.http_endpoint,
-                db_url=settings.database_url,
-                poll_interval=settings.poll_interval,
-            )
-            
-            try:
-                await monitor.run()
-            except Exception as e:
-                logger.error("file_processing_error", file=str(log_file), error=str(e), exc_info=True)
-                raise
+        try:
+            await self._run_monitor(monitor, pattern_config)
+        except Exception as e:
+            logger.error("file_processing_error", file=str(monitor.log_file_path), error=str(e), exc_info=True)
+            raise
     
     async def _process_latest_log(self, log_files, pattern_config):
         """Process only the latest log file."""
         latest_log = log_files[-1]
         logger.info("monitoring_log_file", file=str(latest_log))
         
-        monitor = LogMonitor(
-            log_file_path=str(latest_log),
+        monitor = self._create_monitor(latest_log, pattern_config)
+        
+        try:
+            await self._run_monitor(monitor, pattern_config)
+        except Exception as e:
+            logger.error("service_error", error=str(e), exc_info=True)
+            raise
+
+    def _create_monitor(self, log_file: Path, pattern_config: PatternConfig) -> LogMonitor:
+        """Create a monitor for a log file, configured from settings.
+
+        The monitor moves on to the next file matching the reader's pattern
+        once it has drained the current one.
+        """
+        return LogMonitor(
+            log_file_path=str(log_file),
             patterns=pattern_config.patterns,
             http_endpoint=settings.http_endpoint,
             db_url=settings.database_url,
             poll_interval=settings.poll_interval,
+            max_sessions=settings.log_session_max_count,
+            max_session_lines=settings.log_session_max_lines,
+            session_idle_timeout=settings.log_session_idle_timeout,
+            log_line_prefix=self.log_line_prefix,
+            log_format=settings.log_format,
+            follow_pattern=self.reader.pattern,
+            read_batch_bytes=settings.log_read_batch_bytes,
+            read_batch_lines=settings.log_read_batch_lines,
+            max_pending_events=settings.log_max_pending_events,
+            pipeline_queue_size=settings.log_pipeline_queue_size,
+            match_workers=settings.log_match_workers,
+            delivery_concurrency=settings.log_delivery_concurrency,
+            write_batch_events=settings.log_write_batch_events,
+            write_batch_delay=settings.log_write_batch_delay,
+            delivery_batch_events=settings.log_delivery_batch_events,
+            delivery_gzip=settings.log_delivery_gzip,
+            delivery_http2=settings.log_delivery_http2,
+            delivery_max_attempts=settings.log_delivery_max_attempts,
+            delivery_backoff=settings.log_delivery_backoff,
+            delivery_max_backoff=settings.log_delivery_max_backoff,
+            delivery_lease=settings.log_delivery_lease,
         )
-        
+
+    async def _run_monitor(self, monitor: LogMonitor, pattern_config: PatternConfig) -> None:
+        """Run a monitor, swapping in pattern updates from the source as they appear."""
+        if not settings.patterns_source or settings.patterns_refresh_interval <= 0:
+            await monitor.run()
+            return
+
+        refresher = PatternRefresher(
+            self.pattern_loader,
+            pattern_config,
+            lambda config, diff: monitor.update_patterns(config.patterns),
+            interval=settings.patterns_refresh_interval,
+        )
+        refreshing = asyncio.create_task(refresher.run())
         try:
             await monitor.run()
-        except Exception as e:
-            logger.error("service_error", error=str(e), exc_info=True)
-            raise 
\ No newline at end of file
+        finally:
+            refreshing.cancel()
+
+    def backfill(self, workers: Optional[int] = None, shard_mb: Optional[int] = None) -> int:
+        """Import every existing log file to EOF in parallel.
+
+        Args:
+            workers: Worker processes. Defaults to the log_backfill_workers setting
+            shard_mb: Shard size in MB. Defaults to the log_backfill_shard_mb setting
+
+        Returns:
+            Number of events loaded
+        """
+        log_files = self.reader.get_log_files()
+        if not log_files:
+            logger.error("no_log_files_found", directory=str(self.logs_directory))
+            raise RuntimeError(f"Error: No log files found in {self.logs_directory}")
+
+        pattern_config = self.pattern_loader.load_patterns()
+        options = BackfillOptions(
+            patterns=pattern_config.patterns,
+            log_format=settings.log_format,
+            max_sessions=settings.log_session_max_count,
+            max_session_lines=settings.log_session_max_lines,
+        )
+        if self.log_line_prefix is not None:
+            options = options._replace(log_line_prefix=self.log_line_prefix.prefix)
+        backfill = Backfill(
+            settings.database_url,
+            options,
+            workers=workers or settings.log_backfill_workers,
+            shard_bytes=(shard_mb or settings.log_backfill_shard_mb) * 1024 * 1024,
+        )
+        return backfill.run(log_files)
+
+    async def deliver(self) -> None:
+        """Deliver queued events until cancelled, without reading logs.
+
+        Any number of these can run beside the log monitor, in one process
+        or several, to drain the outbox in parallel.
+        """
+        sender = EventSender(
+            settings.http_endpoint,
+            max_in_flight=settings.log_delivery_concurrency,
+            compress=settings.log_delivery_gzip,
+            http2=settings.log_delivery_http2,
+        )
+        outbox = Outbox(
+            create_engine(settings.database_url),
+            max_attempts=settings.log_delivery_max_attempts,
+            backoff=settings.log_delivery_backoff,
+            max_backoff=settings.log_delivery_max_backoff,
+            lease=settings.log_delivery_lease,
+        )
+        worker = OutboxWorker(
+            outbox,
+            sender.send,
+            batch_events=settings.log_delivery_batch_events,
+            max_in_flight=settings.log_delivery_concurrency,
+        )
+        logger.info("starting_outbox_worker", endpoint=settings.http_endpoint)
+        try:
+            await worker.run(settings.poll_interval)
+        finally:
+            await sender.aclose()
@@ -1,11 +1,14 @@
+import asyncio
 import json
+import os
 import time
 from pathlib import Path
-from typing import Dict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 import hashlib
 import requests
 from pydantic import BaseModel, Field
 
+from metrum.common.logger import logger
 from metrum.settings import settings
 
 class Pattern(BaseModel):
@@ -31,6 +34,26 @@ class PatternConfig(BaseModel):
             )
         })
 
+class PatternDiff(NamedTuple):
+    """Pattern names that differ between two pattern configurations."""
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def diff_patterns(old: PatternConfig, new: PatternConfig) -> PatternDiff:
+    """Compare two pattern configurations by pattern name."""
+    return PatternDiff(
+        added=[name for name in new.patterns if name not in old.patterns],
+        changed=[name for name, pattern in new.patterns.items()
+                 if name in old.patterns and old.patterns[name] != pattern],
+        removed=[name for name in old.patterns if name not in new.patterns],
+    )
+
+
 class PatternLoader:
     """Loads and caches pattern configurations."""
     
@@ -43,6 +66,25 @@ class PatternLoader:
         # Create a hash of the source URL/path to use as the cache file name
         source_hash = hashlib.sha256(source.encode()).hexdigest()[:16]
         return self.cache_dir / f"patterns_{source_hash}.json"
+
+    def _get_validators_path(self, cache_path: Path) -> Path:
+        """Get the path of the ETag and Last-Modified stored beside a cache file."""
+        return cache_path.with_suffix(".validators.json")
+
+    def _load_validators(self, cache_path: Path) -> Dict[str, str]:
+        """Validators of the cached copy, or none if it has no cache or none were sent."""
+        if not cache_path.exists():
+            return {}
+        try:
+            with open(self._get_validators_path(cache_path), 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+
+    def _save_validators(self, validators: Dict[str, str], cache_path: Path) -> None:
+        """Store the validators of the cached copy for the next conditional request."""
+        with open(self._get_validators_path(cache_path), 'w') as f:
+            json.dump(validators, f)
     
     def _is_cache_valid(self, cache_path: Path) -> bool:
         """Check if the cache file is still valid based on TTL."""
@@ -57,6 +99,40 @@ class PatternLoader:
         response = requests.get(url, timeout=settings.http_timeout)
         response.raise_for_status()
         return PatternConfig.model_validate(response.json())
+
+    def _fetch_if_modified(
+        self, url: str, validators: Dict[str, str]
+    ) -> Tuple[Optional[PatternConfig], Dict[str, str]]:
+        """Load patterns from a URL unless they match the validators of the cached copy.
+
+        Args:
+            url: URL of the pattern configuration
+            validators: ETag and Last-Modified of the cached copy
+
+        Returns:
+            The patterns, or None if the server reports them unmodified, and
+            the validators to send next time
+        """
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        response = requests.get(url, headers=headers, timeout=settings.http_timeout)
+        if response.status_code == 304:
+            return None, validators
+        response.raise_for_status()
+        received = {}
+        if response.headers.get("ETag"):
+            received["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            received["last_modified"] = response.headers["Last-Modified"]
+        return PatternConfig.model_validate(response.json()), received
+
+    def _file_validators(self, file_path: str) -> Dict[str, str]:
+        """Validators of a local file: it is unmodified while its mtime and size are."""
+        stat = os.stat(file_path)
+        return {"etag": f"{stat.st_mtime_ns}-{stat.st_size}"}
     
     def _load_from_file(self, file_path: str) -> PatternConfig:
         """Load patterns from a local file."""
@@ -81,18 +157,16 @@ class PatternLoader:
             try:
                 return self._load_from_file(str(cache_path))
             except (json.JSONDecodeError, IOError):
-                # If cache is corrupted, ignore it and continue with source
-                pass
+                # If cache is corrupted, ignore it and continue with source,
+                # which must not answer that the corrupted copy is current
+                self._get_validators_path(cache_path).unlink(missing_ok=True)
         
-        # Load from source
+        # Load from source, revalidating a stale cached copy rather than
+        # downloading it again
         try:
-            if source.startswith(('http://', 'https://')):
-                config = self._load_from_url(source)
-            else:
-                config = self._load_from_file(source)
-            
-            # Cache the result
-            self._save_to_cache(config, cache_path)
+            config = self.refresh(force=True)
+            if config is None:
+                return self._load_from_file(str(cache_path))
             return config
             
         except Exception as e:
@@ -100,4 +174,115 @@ class PatternLoader:
             if cache_path.exists():
                 return self._load_from_file(str(cache_path))
             # If no cache exists, return default patterns
-            return PatternConfig.get_default_patterns() 
\ No newline at end of file
+            return PatternConfig.get_default_patterns()
+
+    def refresh(self, force: bool = False) -> Optional[PatternConfig]:
+        """Load the patterns again if the source changed since they were cached.
+
+        URLs are requested with the ETag and Last-Modified of the cached
+        copy, so an unchanged configuration costs a 304 response instead of
+        a download. Local files are only read if their mtime or size changed.
+
+        Args:
+            force: Load the source even if the source sent no validators
+                and the cached copy is within its TTL
+
+        Returns:
+            The new patterns, which are cached, or None if the source is
+            unchanged
+
+        Raises:
+            Exception: If the source cannot be loaded
+        """
+        if not settings.patterns_source:
+            return None
+
+        source = settings.patterns_source
+        cache_path = self._get_cache_path(source)
+        validators = self._load_validators(cache_path)
+        if not validators and not force:
+            # Without validators there is nothing to revalidate against; only
+            # a forced load or the TTL reloads the source
+            if self._is_cache_valid(cache_path):
+                return None
+
+        if source.startswith(('http://', 'https://')):
+            config, validators = self._fetch_if_modified(source, validators)
+        else:
+            current = self._file_validators(source)
+            if current == validators:
+                config = None
+            else:
+                config, validators = self._load_from_file(source), current
+
+        if config is None:
+            # Still fresh: restart the TTL of the cached copy
+            cache_path.touch()
+            logger.debug("pattern_source_not_modified", source=source)
+            return None
+
+        self._save_to_cache(config, cache_path)
+        self._save_validators(validators, cache_path)
+        return config
+
+
+class PatternRefresher:
+    """Keeps a pattern configuration current by revalidating its source in the background.
+
+    Every interval the source is checked with a conditional request. When
+    it has changed, the new configuration is compared with the current one
+    and, if any pattern differs, handed to on_change in a worker thread, so
+    compiling the changed patterns does not block the event loop.
+    """
+
+    def __init__(
+        self,
+        loader: PatternLoader,
+        config: PatternConfig,
+        on_change: Callable[[PatternConfig, PatternDiff], None],
+        interval: float = 300.0,
+    ):
+        """Initialize the refresher.
+
+        Args:
+            loader: Loader of the configured pattern source
+            config: Configuration currently in use
+            on_change: Called with the new configuration and how it differs
+                from the previous one
+            interval: Seconds between checks of the source
+        """
+        self.loader = loader
+        self.config = config
+        self.on_change = on_change
+        self.interval = interval
+
+    async def refresh(self) -> Optional[PatternDiff]:
+        """Check the source once and apply a changed configuration.
+
+        Returns:
+            How the patterns changed, or None if they did not
+        """
+        config = await asyncio.to_thread(self.loader.refresh)
+        if config is None:
+            return None
+        diff = diff_patterns(self.config, config)
+        if not diff:
+            self.config = config
+            return None
+        await asyncio.to_thread(self.on_change, config, diff)
+        self.config = config
+        logger.info("refreshed_patterns",
+                  added=diff.added,
+                  changed=diff.changed,
+                  removed=diff.removed)
+        return diff
+
+    async def run(self) -> None:
+        """Refresh the patterns every interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep matching with the current patterns until the source recovers
+                logger.warning("failed_to_refresh_patterns", error=str(e))
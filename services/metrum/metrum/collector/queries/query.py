@@ -1,11 +1,15 @@
-import hashlib
+from copy import deepcopy
 from enum import Enum
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Sequence, Tuple
 from pydantic import BaseModel, Field
 import sqlparse
-from sqlparse.sql import Identifier, IdentifierList, Where, Statement
+from sqlparse.sql import Where, Statement
 from sqlparse.tokens import DML, Name, Operator, Comparison, Number, String
 
+from metrum.common.fingerprint import fingerprint
+from .analysis_cache import QueryAnalysis, query_analysis_cache
+from .relations import RelationCatalog, extract_relations
+
 
 class QueryType(str, Enum):
     """Enum for supported query types."""
@@ -21,7 +25,12 @@ class MetrumQuery(BaseModel):
     
     Attributes:
         query: The original SQL query string
-        query_hash: Hash of the query for identification
+        query_hash: Hash of the query's fingerprint, shared by every
+            execution of the same statement with different constants
+        normalized_query: The query with its constants replaced by
+            placeholders
+        query_id: Query identifier computed by the server, which
+            pg_stat_statements.queryid can be joined on, if known
         query_type: Type of query (SELECT, UPDATE, DELETE, MERGE)
         parameters: Parameters used in the query
         explain: Query execution plan
@@ -31,6 +40,8 @@ class MetrumQuery(BaseModel):
     """
     query: str = Field(..., description="Original SQL query string")
     query_hash: str = Field(..., description="Hash of the query for identification")
+    normalized_query: Optional[str] = Field(None, description="Query with its constants replaced by placeholders")
+    query_id: Optional[int] = Field(None, description="Query identifier computed by the server")
     query_type: QueryType = Field(..., description="Type of query (SELECT, UPDATE, DELETE, MERGE)")
     parameters: Dict[str, Any] = Field(default_factory=dict, description="Parameters used in the query")
     explain: Optional[Dict[str, Any]] = Field(None, description="Query execution plan")
@@ -39,39 +50,74 @@ class MetrumQuery(BaseModel):
     where_clause_ast: Optional[Dict[str, Any]] = Field(None, description="Abstract syntax tree of the WHERE clause")
     
     @classmethod
-    def from_query(cls, query: str, parameters: Optional[Dict[str, Any]] = None) -> "MetrumQuery":
+    def from_query(
+        cls,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        query_id: Optional[int] = None,
+        catalog: Optional[RelationCatalog] = None,
+    ) -> "MetrumQuery":
         """
         Create a MetrumQuery instance from a query string.
+
+        The analysis of the text is cached in query_analysis_cache, so
+        statements seen before are neither fingerprinted nor parsed again.
         
         Args:
             query: SQL query string
             parameters: Optional parameters used in the query
+            query_id: Query identifier logged by the server, if any
+            catalog: Catalog of the database the query runs on, which tells
+                views from tables. Without one, every relation is listed
+                as a table
             
         Returns:
             MetrumQuery instance
         """
-        # Normalize query for hashing (remove whitespace, convert to uppercase)
-        normalized_query = " ".join(query.split()).upper()
-        query_hash = hashlib.sha256(normalized_query.encode()).hexdigest()
+        analysis = query_analysis_cache.get(query)
+        if analysis is None:
+            analysis = cls._analyze(query)
+            query_analysis_cache.put(query, analysis)
+
+        tables, views = cls._split_relations(analysis.relations, catalog)
+        # Only the analysis is cached: every instance is validated, with the
+        # parameters it is given, and the AST is copied so instances never
+        # share it
+        return cls(
+            query=query,
+            query_hash=analysis.query_hash,
+            normalized_query=analysis.normalized_query,
+            query_id=query_id,
+            query_type=analysis.query_type,
+            parameters=parameters or {},
+            tables=tables,
+            views=views,
+            where_clause_ast=deepcopy(analysis.where_clause_ast),
+        )
+
+    @classmethod
+    def _analyze(cls, query: str) -> QueryAnalysis:
+        """Fingerprint and parse a query's text."""
+        # Hash the statement's shape, so executions that only differ in
+        # their constants share an entry
+        shape = fingerprint(query)
         
         # Parse the query to determine type and extract information
         parsed = sqlparse.parse(query)[0]
         query_type = cls._determine_query_type(parsed)
         
         # Extract tables and views
-        tables, views = cls._extract_tables_and_views(parsed)
+        relations = extract_relations(query)
         
         # Extract WHERE clause AST
         where_clause_ast = cls._extract_where_clause_ast(parsed)
         
-        return cls(
-            query=query,
-            query_hash=query_hash,
-            query_type=query_type,
-            parameters=parameters or {},
-            tables=tables,
-            views=views,
-            where_clause_ast=where_clause_ast
+        return QueryAnalysis(
+            shape.digest,
+            shape.normalized,
+            query_type,
+            tuple(relations),
+            where_clause_ast,
         )
     
     @staticmethod
@@ -91,26 +137,13 @@ class MetrumQuery(BaseModel):
         raise ValueError(f"Unsupported query type: {parsed.value}")
     
     @staticmethod
-    def _extract_tables_and_views(parsed: Statement) -> tuple[List[str], List[str]]:
-        """Extract tables and views from the parsed SQL."""
-        tables = []
-        views = []
-        
-        # This is a simplified implementation
-        # In a real-world scenario, you would need more sophisticated parsing
-        # to correctly identify tables vs views
-        
-        for token in parsed.tokens:
-            if isinstance(token, Identifier):
-                # Check if this is a table reference
-                if token.get_name():
-                    tables.append(token.get_name())
-            elif isinstance(token, IdentifierList):
-                for identifier in token.get_identifiers():
-                    if identifier.get_name():
-                        tables.append(identifier.get_name())
-        
-        return tables, views
+    def _split_relations(
+        relations: Sequence[str], catalog: Optional[RelationCatalog]
+    ) -> Tuple[List[str], List[str]]:
+        """Split relations into tables and views, using the catalog if there is one."""
+        if catalog is None:
+            return list(relations), []
+        return catalog.split(relations)
     
     @staticmethod
     def _extract_where_clause_ast(parsed: Statement) -> Optional[Dict[str, Any]]:
@@ -2,6 +2,7 @@ from datetime import datetime
 from sqlalchemy import Column, Integer, String, DateTime, Boolean
 
 from metrum.db.base import Base
+from metrum.db.text_codec import CompressedText
 
 
 class MetrumQueryCache(Base):
@@ -11,7 +12,7 @@ class MetrumQueryCache(Base):
     Attributes:
         id: Primary key
         query_hash: Hash of the query for identification
-        query: The original SQL query string
+        query: The original SQL query string, stored compressed
         query_type: Type of query (SELECT, UPDATE, DELETE, MERGE)
         sent_to_server: Whether the query was sent to the server
         created_at: When the cache entry was created
@@ -21,7 +22,7 @@ class MetrumQueryCache(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     query_hash = Column(String, unique=True, index=True, nullable=False)
-    query = Column(String, nullable=False)
+    query = Column(CompressedText, nullable=False)
     query_type = Column(String, nullable=False)
     sent_to_server = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
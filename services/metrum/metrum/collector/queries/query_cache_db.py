@@ -1,6 +1,7 @@
 from typing import List, Optional
 
 from metrum.db.base import Base, get_db, engine
+from metrum.db.text_codec import text_codec
 from metrum.collector.queries.query import MetrumQuery, QueryType
 from metrum.collector.queries.query_cache import MetrumQueryCache
 
@@ -10,6 +11,8 @@ class MetrumQueryCacheDb:
     Class for interacting with the MetrumQueryCache database.
     
     This class provides methods for storing, retrieving, and updating query cache information.
+    Each session loads the database's text dictionaries, which queries are
+    compressed with.
     """
     
     @staticmethod
@@ -31,6 +34,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             cache_entry = MetrumQueryCache(
                 query_hash=query.query_hash,
                 query=query.query,
@@ -57,6 +61,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             return db.query(MetrumQueryCache).filter(MetrumQueryCache.query_hash == query_hash).first()
         finally:
             db.close()
@@ -75,6 +80,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             cache_entry = db.query(MetrumQueryCache).filter(MetrumQueryCache.query_hash == query_hash).first()
             if cache_entry:
                 cache_entry.sent_to_server = sent_to_server
@@ -98,6 +104,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             return db.query(MetrumQueryCache).order_by(MetrumQueryCache.created_at.desc()).offset(offset).limit(limit).all()
         finally:
             db.close()
@@ -117,6 +124,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             return db.query(MetrumQueryCache).filter(
                 MetrumQueryCache.query_type == query_type.value
             ).order_by(MetrumQueryCache.created_at.desc()).offset(offset).limit(limit).all()
@@ -136,6 +144,7 @@ class MetrumQueryCacheDb:
         """
         db = next(get_db())
         try:
+            text_codec.load(db)
             result = db.query(MetrumQueryCache).filter(MetrumQueryCache.query_hash == query_hash).delete()
             db.commit()
             return result > 0
@@ -0,0 +1,216 @@
+import time
+from typing import Callable, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from metrum.common.fingerprint import KEYWORDS, tokenize
+from metrum.common.logger import logger
+
+# Keywords that end a FROM list, after which a comma no longer separates relations
+_FROM_LIST_END = frozenset(
+    "EXCEPT FETCH FOR GROUP HAVING INTERSECT LIMIT OFFSET ORDER RETURNING SELECT SET UNION VALUES WHERE WINDOW".split()
+)
+
+# UPDATE after these is a row lock, an upsert or a MERGE action, not a target
+_NOT_UPDATE_TARGET = frozenset(("FOR", "KEY", "DO", "THEN"))
+
+# Skipped between a keyword and the relation it introduces
+_RELATION_MODIFIERS = frozenset(("ONLY", "LATERAL"))
+
+_VIEWS_SQL = text("""
+    SELECT n.nspname, c.relname
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('v', 'm') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+""")
+
+
+class _Scope:
+    """What the tokens inside one pair of parentheses are."""
+
+    __slots__ = ("call", "cte_body", "from_list", "with_state")
+
+    def __init__(self, call: bool = False, cte_body: bool = False):
+        # Arguments of a function call, where FROM is part of the syntax
+        # (EXTRACT, SUBSTRING, TRIM) or a column list
+        self.call = call
+        self.cte_body = cte_body
+        # A comma separates relations
+        self.from_list = False
+        # Position in a WITH clause: expecting a name, in the definition of
+        # the last name, or after a definition
+        self.with_state: Optional[str] = None
+
+
+def _name(kind: str, value: str) -> str:
+    """An identifier as the server resolves it: quoted names as written, others folded to lower case."""
+    if kind == "quoted":
+        return value[1:-1].replace('""', '"')
+    return value.lower()
+
+
+def extract_relations(query: str) -> List[str]:
+    """Tables and views a statement reads or writes, in order of first reference.
+
+    Relations are found in a single pass over the statement's tokens: those
+    following FROM, JOIN, UPDATE, INTO and USING and the rest of a FROM
+    list, at any depth of subqueries. Names defined by WITH are left out,
+    as are functions in FROM. Schema-qualified names are returned as
+    "schema.name".
+
+    Args:
+        query: SQL statement
+
+    Returns:
+        Relation names, each once
+    """
+    tokens = tokenize(query)
+    count = len(tokens)
+    relations: List[str] = []
+    ctes: Set[str] = set()
+    scopes = [_Scope()]
+    previous_word: Optional[str] = None
+
+    def read_relation(index: int, calls: bool) -> int:
+        """Record the relation named at index, if any, and return the index after it."""
+        while index < count and tokens[index][0] == "word" and tokens[index][1].upper() in _RELATION_MODIFIERS:
+            index += 1
+        if index >= count:
+            return index
+        kind, value = tokens[index]
+        if kind == "quoted" or kind == "word" and value.upper() not in KEYWORDS:
+            parts = [_name(kind, value)]
+            index += 1
+            while (
+                index + 1 < count
+                and tokens[index][1] == "."
+                and tokens[index + 1][0] in ("word", "quoted")
+            ):
+                parts.append(_name(*tokens[index + 1]))
+                index += 2
+            if calls or index >= count or tokens[index][1] != "(":
+                relations.append(".".join(parts))
+            # A function in FROM; its arguments are read as usual
+        return index
+
+    index = 0
+    while index < count:
+        kind, value = tokens[index]
+        word = value.upper() if kind == "word" else None
+        scope = scopes[-1]
+        next_index = index + 1
+
+        if scope.with_state == "after":
+            if value == ",":
+                scope.with_state = "name"
+                previous_word, index = None, next_index
+                continue
+            scope.with_state = None
+
+        if kind == "punct" and value == "(":
+            scopes.append(_Scope(
+                call=previous_word is not None and previous_word not in KEYWORDS,
+                cte_body=scope.with_state == "definition" and previous_word in ("AS", "MATERIALIZED"),
+            ))
+        elif kind == "punct" and value == ")":
+            if len(scopes) > 1:
+                if scopes.pop().cte_body:
+                    scopes[-1].with_state = "after"
+        elif scope.with_state == "name" and word != "RECURSIVE":
+            if kind == "quoted" or word is not None:
+                ctes.add(_name(kind, value))
+            scope.with_state = "definition"
+        elif word == "WITH":
+            scope.with_state = "name"
+        elif word in ("FROM", "JOIN") and not scope.call and previous_word != "DISTINCT":
+            scope.from_list = True
+            next_index = read_relation(next_index, calls=False)
+        elif word == "UPDATE" and previous_word not in _NOT_UPDATE_TARGET or word == "INTO":
+            next_index = read_relation(next_index, calls=True)
+        elif word == "USING" and next_index < count and tokens[next_index][1] != "(":
+            # MERGE and DELETE sources; JOIN ... USING is followed by columns
+            scope.from_list = True
+            next_index = read_relation(next_index, calls=False)
+        elif value == "," and scope.from_list:
+            next_index = read_relation(next_index, calls=False)
+        elif word in _FROM_LIST_END:
+            scope.from_list = False
+
+        last_kind, last_value = tokens[next_index - 1]
+        previous_word = last_value.upper() if last_kind == "word" else None
+        index = next_index
+
+    found: List[str] = []
+    seen: Set[str] = set()
+    for relation in relations:
+        if relation not in seen and relation not in ctes:
+            seen.add(relation)
+            found.append(relation)
+    return found
+
+
+class RelationCatalog:
+    """Names of the views and materialized views of a database.
+
+    The names are looked up at most every refresh_interval seconds. Each
+    view is known both by its schema-qualified name and by its bare name,
+    so unqualified references found on the search path match too.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        refresh_interval: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the catalog.
+
+        Args:
+            engine: Engine of the database the queries run on
+            refresh_interval: Seconds between lookups of the views
+            clock: Monotonic clock, in seconds
+        """
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._views: FrozenSet[str] = frozenset()
+        self._loaded_at: Optional[float] = None
+
+    def views(self) -> FrozenSet[str]:
+        """Names of the database's views, looked up again once refresh_interval has passed."""
+        now = self.clock()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+            return self._views
+        # Failed lookups are retried after refresh_interval too
+        self._loaded_at = now
+        try:
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    rows: List[Tuple[Optional[str], str]] = list(conn.execute(_VIEWS_SQL).all())
+                else:
+                    rows = [(None, name) for name in inspect(conn).get_view_names()]
+        except SQLAlchemyError as e:
+            logger.warning("failed_to_load_views", error=str(e))
+            return self._views
+        views = set()
+        for schema, name in rows:
+            views.add(name)
+            if schema is not None:
+                views.add(f"{schema}.{name}")
+        self._views = frozenset(views)
+        logger.info("loaded_views", view_count=len(rows))
+        return self._views
+
+    def split(self, relations: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Split relation names into tables and views.
+
+        Returns:
+            The tables and the views, each in the order given
+        """
+        views = self.views()
+        tables: List[str] = []
+        found: List[str] = []
+        for relation in relations:
+            (found if relation in views else tables).append(relation)
+        return tables, found
@@ -0,0 +1,228 @@
+import hashlib
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# One alternative per token kind; comments and whitespace are skipped
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<string>[eE]'(?:[^'\\]|\\.|'')*'
+        |[bBxXnN]?'(?:[^']|'')*'
+        |\$(?P<tag>[A-Za-z_][A-Za-z_0-9]*|)\$.*?\$(?P=tag)\$)
+  | (?P<param>\$\d+)
+  | (?P<number>0[xXoObB][0-9a-fA-F_]+|(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_\x80-\uffff][\w$\x80-\uffff]*)
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<op>::|[+\-*/<>=~!@#%^&|`?:]+)
+  | (?P<punct>[()\[\],;.])
+  | (?P<other>.)
+""", re.S | re.X)
+
+# Operators may only end in + or - if they contain one of these, as in
+# PostgreSQL's lexer, so "=-1" is "=" followed by "-1"
+_OPERATOR_SIGN_CHARS = frozenset("~!@#%^&|`?")
+
+# Words shown in upper case in normalized text; every other unquoted word
+# is an identifier and shown folded to lower case, as the server folds it
+KEYWORDS = frozenset("""
+    ALL AND ANY ARRAY AS ASC BETWEEN BY CASE CAST CONFLICT CROSS CURRENT_DATE
+    CURRENT_TIMESTAMP DEFAULT DELETE DESC DISTINCT DO ELSE END EXCEPT EXISTS
+    FALSE FETCH FIRST FOR FROM FULL GROUP HAVING ILIKE IN INNER INSERT
+    INTERSECT INTERVAL INTO IS JOIN LATERAL LEFT LIKE LIMIT MATCHED MERGE
+    NATURAL NOT NOTHING NULL NULLS OFFSET ON ONLY OR ORDER OUTER OVER
+    PARTITION RECURSIVE RETURNING RIGHT ROW ROWS SELECT SET SIMILAR SOME TABLE
+    THEN TO TRUE UNION UPDATE USING VALUES WHEN WHERE WINDOW WITH
+""".split())
+
+# Keywords after which a "-" starts a negative constant rather than subtracting
+_EXPRESSION_START = frozenset(
+    "AND BETWEEN BY CASE ELSE IN IS LIMIT NOT OFFSET ON OR RETURNING SELECT SET THEN WHEN WHERE".split()
+)
+
+# Stands for every constant and parameter until placeholders are numbered;
+# no token can be a NUL
+_CONSTANT = "\0"
+
+# Appended to a list of constants or VALUES rows that was collapsed,
+# as pg_stat_statements shows squashed lists
+SQUASHED = "/*, ... */"
+
+_NO_SPACE_BEFORE = frozenset((")", "]", ",", ";", ".", "::", "["))
+_NO_SPACE_AFTER = frozenset(("(", "[", ".", "::"))
+
+
+class Fingerprint(NamedTuple):
+    """The shape of a statement, with its constants replaced by placeholders.
+
+    Attributes:
+        normalized: Statement text with constants and parameters replaced by
+            $1, $2, ..., lists of constants and repeated VALUES rows collapsed,
+            keywords in upper case and identifiers folded to lower case
+        digest: sha256 hex digest of the normalized text
+        query_id: The first 8 bytes of the digest as a signed 64-bit integer,
+            the type of pg_stat_statements.queryid
+    """
+    normalized: str
+    digest: str
+    query_id: int
+
+
+def tokenize(query: str) -> List[Tuple[str, str]]:
+    """Split a statement into (kind, text) tokens, without whitespace and comments.
+
+    Kinds are string, param, number, word, quoted, op, punct and other.
+    """
+    tokens: List[Tuple[str, str]] = []
+    append = tokens.append
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        value = match.group()
+        if kind == "op" and len(value) > 1 and value[-1] in "+-" and not _OPERATOR_SIGN_CHARS.intersection(value):
+            # Split trailing signs off, as the server's lexer does
+            stripped = value.rstrip("+-")
+            append(("op", stripped))
+            for sign in value[len(stripped):]:
+                append(("op", sign))
+            continue
+        append((kind, value))
+    return tokens
+
+
+def _canonical_tokens(query: str) -> List[str]:
+    """Tokens of a statement with every constant and parameter replaced by _CONSTANT."""
+    out: List[str] = []
+    previous_kind: Optional[str] = None
+    for kind, value in tokenize(query):
+        if kind in ("string", "number", "param"):
+            if out and out[-1] == "-" and previous_kind == "sign":
+                # A negative constant
+                out.pop()
+            out.append(_CONSTANT)
+        elif kind == "word":
+            upper = value.upper()
+            out.append(upper if upper in KEYWORDS else value.lower())
+        elif kind == "op" and value == "-" and (
+            not out
+            or previous_kind in ("op", "sign")
+            or out[-1] in ("(", "[", ",")
+            or out[-1] in _EXPRESSION_START
+        ):
+            out.append(value)
+            previous_kind = "sign"
+            continue
+        else:
+            out.append(value)
+        previous_kind = kind
+    return out
+
+
+def _squash(tokens: List[str]) -> List[str]:
+    """Collapse IN lists and arrays of constants, and VALUES rows of the same shape as the first."""
+    out: List[str] = []
+    # (index of the opening bracket, what the brackets hold)
+    stack: List[Tuple[int, Optional[str]]] = []
+    # Shape of the first row of the VALUES list being read and where it ends
+    values_row: Optional[Tuple[str, ...]] = None
+    values_end = -1
+    for token in tokens:
+        if token in ("(", "["):
+            previous = out[-1] if out else None
+            if token == "(" and previous == "IN" or token == "[" and previous == "ARRAY":
+                context = "list"
+            elif token == "(" and previous == "VALUES":
+                context = "values"
+            elif token == "(" and previous == "," and len(out) - 1 == values_end:
+                context = "next_row"
+            else:
+                context = None
+            stack.append((len(out), context))
+            out.append(token)
+            continue
+
+        if token in (")", "]") and stack:
+            start, context = stack.pop()
+            content = out[start + 1:]
+            if context == "list" and content and all(
+                value == (_CONSTANT if index % 2 == 0 else ",") for index, value in enumerate(content)
+            ):
+                del out[start + 1:]
+                out.extend((_CONSTANT, SQUASHED))
+            elif context == "values":
+                values_row = tuple(content)
+                out.append(token)
+                values_end = len(out)
+                continue
+            elif context == "next_row":
+                if tuple(content) == values_row:
+                    # Drop the row and its comma
+                    del out[start - 1:]
+                    if out[-1] != SQUASHED:
+                        out.append(SQUASHED)
+                else:
+                    out.append(token)
+                values_end = len(out)
+                continue
+            out.append(token)
+            continue
+
+        out.append(token)
+    return out
+
+
+def _render(tokens: List[str]) -> str:
+    """Join tokens into statement text, numbering the placeholders."""
+    parts: List[str] = []
+    number = 0
+    previous = None
+    for token in tokens:
+        if token == _CONSTANT:
+            number += 1
+            token = f"${number}"
+        if (
+            previous is not None
+            and previous not in _NO_SPACE_AFTER
+            and token not in _NO_SPACE_BEFORE
+            # Function calls
+            and not (token == "(" and previous not in KEYWORDS and (previous[0].isalpha() or previous[0] in '_"'))
+        ):
+            parts.append(" ")
+        parts.append(token)
+        previous = token
+    return "".join(parts)
+
+
+def normalize_query(query: str) -> str:
+    """Replace the constants of a statement with placeholders.
+
+    Statements that differ only in their constants, parameters, the length
+    of IN lists and arrays of constants, the number of VALUES rows, case,
+    whitespace or comments normalize to the same text.
+
+    Args:
+        query: SQL statement
+
+    Returns:
+        The normalized statement, e.g. "SELECT * FROM users WHERE id = $1"
+    """
+    return _render(_squash(_canonical_tokens(query)))
+
+
+def fingerprint(query: str) -> Fingerprint:
+    """Fingerprint a statement by its normalized token stream.
+
+    The query_id has the type of pg_stat_statements.queryid, but it is
+    computed from the statement text: the server's queryid is computed from
+    the parsed statement and can only be taken from the server, e.g. from
+    the query_id field of csvlog and jsonlog records or %Q in
+    log_line_prefix.
+
+    Args:
+        query: SQL statement
+
+    Returns:
+        The statement's fingerprint
+    """
+    normalized = normalize_query(query)
+    digest = hashlib.sha256(normalized.encode())
+    return Fingerprint(normalized, digest.hexdigest(), int.from_bytes(digest.digest()[:8], "big", signed=True))
@@ -1,44 +1,123 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import structlog
 import os
-from typing import Any
+import sys
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional, install metrum[speedups]
+    orjson = None
+
+_debug_enabled = False
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def debug_enabled() -> bool:
+    """Whether debug events are logged.
+
+    Hot paths check this before calling logger.debug, so a disabled debug
+    event does not even build its keyword arguments.
+    """
+    return _debug_enabled
+
+
+def json_serializer() -> Callable[..., str]:
+    """The fastest available JSON serializer for rendered events.
+
+    orjson is used when installed; it returns bytes, which are decoded
+    because the stdlib handlers write text.
+    """
+    if orjson is None:
+        return json.dumps
+
+    def dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=default).decode()
+
+    return dumps
+
+
+def _stop_listener() -> None:
+    """Write out queued events and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def _configure_handler(level: int, asynchronous: bool) -> None:
+    """Write rendered events to stderr, from a background thread if asynchronous."""
+    global _listener
+    root = logging.getLogger()
+    _stop_listener()
+    for handler in [h for h in root.handlers if getattr(h, "_metrum", False)]:
+        root.removeHandler(handler)
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter("%(message)s"))
+    if asynchronous:
+        handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=False)
+        _listener.start()
+    else:
+        handler = stream
+    handler._metrum = True
+    root.addHandler(handler)
+    root.setLevel(level)
+
 
 def configure_logger() -> None:
     """Configure structlog with standard processors and settings.
-    
+
     The log level can be set using the LOG_LEVEL environment variable.
     Valid values are: DEBUG, INFO, WARNING, ERROR, CRITICAL
     Defaults to INFO if not set or invalid.
+
+    Events are written by a background thread unless LOG_ASYNC is set to
+    false, so a slow stderr does not stall the event loop.
     """
+    global _debug_enabled
     # Get log level from environment variable
     log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
     valid_levels = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
     if log_level not in valid_levels:
         log_level = "INFO"
-    
+    level = logging.getLevelName(log_level)
+    _debug_enabled = level <= logging.DEBUG
+    asynchronous = os.environ.get("LOG_ASYNC", "true").lower() not in {"0", "false", "no"}
+    _configure_handler(level, asynchronous)
 
     structlog.configure(
+        # The filtering bound logger drops events below the level before any
+        # processor runs, so the processors only see events that are written
         processors=[
-            structlog.stdlib.filter_by_level,  # Add level filtering
             structlog.stdlib.add_log_level,
             structlog.stdlib.add_logger_name,
             structlog.processors.TimeStamper(fmt="iso"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer()
+            structlog.processors.JSONRenderer(serializer=json_serializer())
         ],
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
-        wrapper_class=structlog.make_filtering_bound_logger(log_level),
+        wrapper_class=structlog.make_filtering_bound_logger(level),
         cache_logger_on_first_use=True,
     )
 
 # Configure the logger when this module is imported
 configure_logger()
 
-# Create a logger instance
-logger = structlog.get_logger()
+# Create a logger instance, bound now rather than on every call through
+# a lazy proxy, so disabled levels are plain no-op methods
+logger = structlog.get_logger().bind()
 logger.info('initialized logger')
 
-__all__ = ["logger"] 
+__all__ = ["logger", "debug_enabled"]
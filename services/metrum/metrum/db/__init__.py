@@ -1,6 +1,6 @@
 """Database models and utilities for Metrum."""
 
-from metrum.db.base import Base, get_db, get_connection
+from metrum.db.base import Base, EventQueue, get_db, get_connection
 from metrum.db.models import Event, EventStatus
 
-__all__ = ["Base", "get_db", "get_connection", "Event", "EventStatus"] 
\ No newline at end of file
+__all__ = ["Base", "EventQueue", "get_db", "get_connection", "Event", "EventStatus"] 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Enum
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Enum, Index, text
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 import enum
@@ -32,6 +32,17 @@ class EventQueue(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     processed_at = Column(DateTime, nullable=True)
     error_message = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_event_queue_due",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("status IN ('PENDING', 'PROCESSING')"),
+        ),
+    )
 
 
 def get_db():
@@ -46,6 +57,12 @@ def get_db():
 def get_connection(db_name: str | None = None):
     """Get raw connection for operations that need it."""
     if db_name:
+        db_engine = create_engine(engine.url.set(database=db_name))
+        try:
+            with db_engine.connect() as conn:
+                yield conn
+        finally:
+            db_engine.dispose()
     else:
         with engine.connect() as conn:
             yield conn 
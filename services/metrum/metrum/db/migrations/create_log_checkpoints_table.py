@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Create the log_checkpoints table."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if table exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'log_checkpoints'
+            );
+        """))
+        table_exists = result.scalar()
+        
+        if not table_exists:
+            # Create the log_checkpoints table
+            conn.execute(text("""
+                CREATE TABLE log_checkpoints (
+                    id SERIAL PRIMARY KEY,
+                    file_path TEXT NOT NULL UNIQUE,
+                    inode BIGINT NOT NULL,
+                    device BIGINT NOT NULL,
+                    size BIGINT NOT NULL,
+                    first_line_hash VARCHAR(64) NOT NULL,
+                    resume_offset BIGINT NOT NULL DEFAULT 0,
+                    committed_offset BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            conn.commit()
+            print("Created log_checkpoints table")
+        else:
+            print("log_checkpoints table already exists")
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Create the plans table."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if table exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'plans'
+            );
+        """))
+        table_exists = result.scalar()
+        
+        if not table_exists:
+            # One row per plan shape, which events reference by id
+            conn.execute(text("""
+                CREATE TABLE plans (
+                    id SERIAL PRIMARY KEY,
+                    shape_hash VARCHAR(64) NOT NULL UNIQUE,
+                    shape JSON NOT NULL,
+                    explain_text TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            conn.commit()
+            print("Created plans table")
+        else:
+            print("plans table already exists")
+
+if __name__ == "__main__":
+    run_migration()
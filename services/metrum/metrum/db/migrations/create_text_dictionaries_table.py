@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Create the text_dictionaries table."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if table exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables 
+                WHERE table_name = 'text_dictionaries'
+            );
+        """))
+        table_exists = result.scalar()
+        
+        if not table_exists:
+            # Compression dictionaries, one row per trained version
+            conn.execute(text("""
+                CREATE TABLE text_dictionaries (
+                    version SERIAL PRIMARY KEY,
+                    dictionary_id BIGINT NOT NULL UNIQUE,
+                    codec VARCHAR NOT NULL,
+                    dictionary BYTEA NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                );
+            """))
+            conn.commit()
+            print("Created text_dictionaries table")
+        else:
+            print("text_dictionaries table already exists")
+
+if __name__ == "__main__":
+    run_migration()
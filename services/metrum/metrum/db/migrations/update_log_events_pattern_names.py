@@ -0,0 +1,31 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Add the pattern_names column to the log_events table."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if column exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns 
+                WHERE table_name = 'log_events' AND column_name = 'pattern_names'
+            );
+        """))
+        column_exists = result.scalar()
+        
+        if not column_exists:
+            # Every matching pattern; pattern_name keeps the first one
+            conn.execute(text("""
+                ALTER TABLE log_events ADD COLUMN pattern_names JSON;
+                UPDATE log_events SET pattern_names = json_build_array(pattern_name)
+                WHERE pattern_name IS NOT NULL;
+            """))
+            conn.commit()
+            print("Added pattern_names column to log_events")
+        else:
+            print("log_events.pattern_names column already exists")
+
+if __name__ == "__main__":
+    run_migration()
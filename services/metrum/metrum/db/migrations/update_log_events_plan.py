@@ -0,0 +1,29 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Add the plan column to the log_events table."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if column exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns 
+                WHERE table_name = 'log_events' AND column_name = 'plan'
+            );
+        """))
+        column_exists = result.scalar()
+        
+        if not column_exists:
+            # Plan node tree parsed from explain_text; earlier events keep only the text
+            conn.execute(text("""
+                ALTER TABLE log_events ADD COLUMN plan JSON;
+            """))
+            conn.commit()
+            print("Added plan column to log_events")
+        else:
+            print("log_events.plan column already exists")
+
+if __name__ == "__main__":
+    run_migration()
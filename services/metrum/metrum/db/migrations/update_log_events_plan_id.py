@@ -0,0 +1,34 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Reference plans from log_events by id instead of storing each plan."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if column exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns 
+                WHERE table_name = 'log_events' AND column_name = 'plan_id'
+            );
+        """))
+        column_exists = result.scalar()
+        
+        if not column_exists:
+            # New events keep only their plan's figures; the plan column held
+            # whole trees and is replaced by plan_id and plan_stats. Events
+            # stored before keep their explain_text
+            conn.execute(text("""
+                ALTER TABLE log_events ADD COLUMN plan_id INTEGER REFERENCES plans (id);
+                ALTER TABLE log_events ADD COLUMN plan_stats JSON;
+                ALTER TABLE log_events DROP COLUMN IF EXISTS plan;
+                CREATE INDEX ix_log_events_plan_id ON log_events (plan_id);
+            """))
+            conn.commit()
+            print("Added plan_id and plan_stats columns to log_events")
+        else:
+            print("log_events.plan_id column already exists")
+
+if __name__ == "__main__":
+    run_migration()
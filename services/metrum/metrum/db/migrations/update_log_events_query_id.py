@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+def run_migration():
+    """Add the statement fingerprint and server query identifier to log_events."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        # Check if column exists
+        result = conn.execute(text("""
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns 
+                WHERE table_name = 'log_events' AND column_name = 'fingerprint'
+            );
+        """))
+        column_exists = result.scalar()
+        
+        if not column_exists:
+            # Events stored before have neither; they are not backfilled
+            conn.execute(text("""
+                ALTER TABLE log_events ADD COLUMN fingerprint BIGINT;
+                ALTER TABLE log_events ADD COLUMN query_id BIGINT;
+                CREATE INDEX ix_log_events_fingerprint ON log_events (fingerprint);
+                CREATE INDEX ix_log_events_query_id ON log_events (query_id);
+            """))
+            conn.commit()
+            print("Added fingerprint and query_id columns to log_events")
+        else:
+            print("log_events.fingerprint column already exists")
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine, text
+from metrum.settings import settings
+
+# Text columns stored compressed, by table
+COMPRESSED_COLUMNS = (
+    ("log_events", "query_text"),
+    ("log_events", "explain_text"),
+    ("plans", "explain_text"),
+    ("metrum_query_cache", "query"),
+)
+
+def run_migration():
+    """Convert query and plan text columns to the compressed storage format."""
+    engine = create_engine(settings.database_url)
+    
+    with engine.connect() as conn:
+        for table, column in COMPRESSED_COLUMNS:
+            # Check the column's current type
+            result = conn.execute(text("""
+                SELECT data_type FROM information_schema.columns 
+                WHERE table_name = :table AND column_name = :column;
+            """), {"table": table, "column": column})
+            data_type = result.scalar()
+            
+            if data_type is None:
+                print(f"{table}.{column} does not exist")
+            elif data_type != "bytea":
+                # Existing text is kept uncompressed, behind the marker byte
+                # of uncompressed values
+                conn.execute(text(f"""
+                    ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA
+                    USING '\\x00'::bytea || convert_to({column}, 'UTF8');
+                """))
+                conn.commit()
+                print(f"Converted {table}.{column} to compressed storage")
+            else:
+                print(f"{table}.{column} is already compressed")
+
+if __name__ == "__main__":
+    run_migration()
@@ -2,9 +2,11 @@ from datetime import datetime
 from typing import Optional
 from enum import Enum
 
-from sqlalchemy import DateTime, Integer, String, JSON, Enum as SQLEnum, Float
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, LargeBinary, String, JSON, Enum as SQLEnum, Float, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
+from metrum.db.text_codec import CompressedText
+
 
 class Base(DeclarativeBase):
     pass
@@ -28,6 +30,34 @@ class Event(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     error_message: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Delivery is due from this time on; while PROCESSING, the claim expires then
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Only rows still to be delivered are indexed, in the order they are claimed
+        Index(
+            "ix_event_queue_due",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("status IN ('PENDING', 'PROCESSING')"),
+            sqlite_where=text("status IN ('PENDING', 'PROCESSING')"),
+        ),
+    )
+
+
+class ExplainPlan(Base):
+    """A plan shape, stored once however many events were executed with it."""
+    __tablename__ = "plans"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # sha256 of the shape, which events are matched to plans by
+    shape_hash: Mapped[str] = mapped_column(String(64), nullable=False, unique=True)
+    # Node tree without rows, timings or buffers
+    shape: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # Plan of the first event with this shape
+    explain_text: Mapped[str] = mapped_column(CompressedText, nullable=True, deferred=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
 
 
 class LogEvent(Base):
@@ -35,10 +65,50 @@ class LogEvent(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     timestamp: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    query_text: Mapped[str] = mapped_column(String, nullable=True)
-    explain_text: Mapped[str] = mapped_column(String, nullable=True)
+    # Compressed, and only loaded and decompressed when read
+    query_text: Mapped[str] = mapped_column(CompressedText, nullable=True, deferred=True)
+    explain_text: Mapped[str] = mapped_column(CompressedText, nullable=True, deferred=True)
     duration_ms: Mapped[float] = mapped_column(Float, nullable=True)
+    # Shared by executions of a statement that differ only in their constants
+    fingerprint: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True, index=True)
+    # Computed by the server when compute_query_id is on; pg_stat_statements.queryid
+    query_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True, index=True)
     pattern_name: Mapped[str] = mapped_column(String, nullable=True)
+    # Every matching pattern, in configuration order; pattern_name is the first
+    pattern_names: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    # Events with a parsed plan keep only its figures: per-node rows, loops,
+    # timing, buffers and spills, depth first. The shape is in plans
+    plan_id: Mapped[Optional[int]] = mapped_column(ForeignKey("plans.id"), nullable=True, index=True)
+    plan_stats: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
     status: Mapped[str] = mapped_column(String, nullable=False, default="pending")
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
-    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow) 
\ No newline at end of file
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TextDictionary(Base):
+    """A compression dictionary for stored query and plan text."""
+    __tablename__ = "text_dictionaries"
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # Id stored with each value compressed with the dictionary
+    dictionary_id: Mapped[int] = mapped_column(BigInteger, nullable=False, unique=True)
+    codec: Mapped[str] = mapped_column(String, nullable=False)
+    dictionary: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    sample_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class LogCheckpoint(Base):
+    __tablename__ = "log_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    file_path: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    inode: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    device: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    first_line_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Reading resumes here: the start of the oldest statement still being assembled
+    resume_offset: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # Events completed by lines before this offset are committed
+    committed_offset: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,262 @@
+import hashlib
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Union
+
+from sqlalchemy import LargeBinary, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # optional, install metrum[compression]
+    zstandard = None
+
+from metrum.common.logger import logger
+from metrum.settings import settings
+
+# Values shorter than this gain nothing from compression
+MIN_COMPRESS_BYTES = 64
+
+# zlib only looks back 32 kB, so a longer preset dictionary is wasted
+ZLIB_DICTIONARY_BYTES = 32 * 1024
+
+# First byte of a stored value: how the rest of it is encoded
+_PLAIN = 0
+_CODECS = {"zstd": 1, "zlib": 2}
+
+# zlib dictionaries are built from the most frequent runs of this many tokens
+_NGRAM_TOKENS = 4
+_TOKEN = re.compile(r"\s*\S+")
+
+
+def dictionary_id(dictionary: bytes) -> int:
+    """Content address of a dictionary, stored with every value compressed with it."""
+    return int.from_bytes(hashlib.sha256(dictionary).digest()[:4], "big") or 1
+
+
+def _zlib_dictionary(samples: List[str], size: int) -> bytes:
+    """A zlib preset dictionary of the token runs most frequent across samples.
+
+    zlib finds matches closer to the data more cheaply, so the most valuable
+    runs are placed at the end.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        tokens = _TOKEN.findall(sample)
+        counts.update({"".join(tokens[i:i + _NGRAM_TOKENS]) for i in range(max(len(tokens) - _NGRAM_TOKENS + 1, 1))})
+    chosen: List[bytes] = []
+    total = 0
+    for run, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        encoded = run.encode()
+        if total + len(encoded) <= size:
+            chosen.append(encoded)
+            total += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class TextCodec:
+    """Compresses query and plan text for storage, with a dictionary trained on past values.
+
+    A stored value is one byte naming its codec, then for compressed values
+    the 4-byte id of the dictionary it was compressed with (0 for none) and
+    the compressed text. Dictionaries are kept in the text_dictionaries
+    table; each training adds a version, which new values are compressed
+    with, while older values keep naming the dictionary they need.
+
+    zstd is used when the zstandard package is installed; otherwise zlib
+    with a preset dictionary.
+    """
+
+    def __init__(
+        self,
+        compression: str = "zstd",
+        min_bytes: int = MIN_COMPRESS_BYTES,
+        reload_interval: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the codec.
+
+        Args:
+            compression: zstd, zlib or none
+            min_bytes: Shorter values are stored uncompressed
+            reload_interval: Seconds between checks for newly trained
+                dictionaries
+            clock: Monotonic clock, in seconds
+        """
+        if compression == "zstd" and zstandard is None:
+            logger.info("zstandard_not_installed", fallback="zlib")
+            compression = "zlib"
+        self.compression = compression
+        self.min_bytes = min_bytes
+        self.reload_interval = reload_interval
+        self.clock = clock
+        # Id of the dictionary new values are compressed with
+        self.current: Optional[int] = None
+        self._dictionaries: Dict[int, bytes] = {}
+        self._compressors: Dict[int, object] = {}
+        self._decompressors: Dict[int, object] = {}
+        self._loaded_url: Optional[str] = None
+        self._loaded_at = 0.0
+        # Database the dictionaries were last loaded from, to load one that
+        # another process trained since from
+        self._bind = None
+
+    def load(self, session: Session, force: bool = False) -> Optional[int]:
+        """Load the dictionaries stored in a database, at most every reload_interval.
+
+        Args:
+            session: Session to read the dictionaries with
+            force: Load them even if reload_interval has not passed
+
+        Returns:
+            Id of the dictionary new values are compressed with, if any
+        """
+        bind = session.get_bind()
+        url = str(bind.url)
+        if not force and url == self._loaded_url and self.clock() - self._loaded_at < self.reload_interval:
+            return self.current
+        from metrum.db.models import TextDictionary
+
+        self._loaded_url, self._loaded_at, self._bind = url, self.clock(), bind
+        if not inspect(session.connection()).has_table(TextDictionary.__tablename__):
+            self.current = None
+            return None
+        current = None
+        for stored_id, codec, dictionary in session.execute(
+            select(TextDictionary.dictionary_id, TextDictionary.codec, TextDictionary.dictionary)
+            .order_by(TextDictionary.version)
+        ):
+            self._dictionaries[stored_id] = dictionary
+            if codec == self.compression:
+                current = stored_id
+        self.current = current
+        return current
+
+    def train(self, session: Session, samples: List[str], size: int = 64 * 1024) -> int:
+        """Train a dictionary on sample values and compress new values with it.
+
+        The dictionary is added to the session; it is stored when the session
+        commits.
+
+        Args:
+            session: Session to store the dictionary in
+            samples: Typical query and plan text
+            size: Largest dictionary size in bytes
+
+        Returns:
+            Id of the new dictionary
+        """
+        from metrum.db.models import TextDictionary
+
+        if self.compression == "zstd":
+            dictionary = zstandard.train_dictionary(size, [sample.encode() for sample in samples]).as_bytes()
+        else:
+            dictionary = _zlib_dictionary(samples, min(size, ZLIB_DICTIONARY_BYTES))
+        new_id = dictionary_id(dictionary)
+        session.add(TextDictionary(
+            dictionary_id=new_id,
+            codec=self.compression,
+            dictionary=dictionary,
+            sample_count=len(samples),
+        ))
+        session.flush()
+        self._dictionaries[new_id] = dictionary
+        self.current = new_id
+        logger.info("trained_text_dictionary",
+                  codec=self.compression,
+                  dictionary_id=new_id,
+                  dictionary_bytes=len(dictionary),
+                  sample_count=len(samples))
+        return new_id
+
+    def encode(self, text: str) -> bytes:
+        """Compress a value with the current dictionary."""
+        data = text.encode()
+        if self.compression == "none" or len(data) < self.min_bytes:
+            return bytes((_PLAIN,)) + data
+        current = self.current or 0
+        if self.compression == "zstd":
+            compressor = self._compressors.get(current)
+            if compressor is None:
+                dictionary = zstandard.ZstdCompressionDict(self._dictionaries[current]) if current else None
+                compressor = self._compressors[current] = zstandard.ZstdCompressor(dict_data=dictionary)
+            compressed = compressor.compress(data)
+        else:
+            compressor = zlib.compressobj(6, zdict=self._dictionaries[current]) if current else zlib.compressobj(6)
+            compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) + 4 >= len(data):
+            return bytes((_PLAIN,)) + data
+        return bytes((_CODECS[self.compression],)) + current.to_bytes(4, "big") + compressed
+
+    def decode(self, value: Union[bytes, memoryview, str]) -> str:
+        """Decompress a stored value.
+
+        A value naming a dictionary that is not loaded, such as one another
+        process trained since the last load, loads the dictionaries again
+        first.
+
+        Raises:
+            LookupError: If the value's dictionary is not in the database
+                the dictionaries were loaded from
+            ImportError: If the value was compressed with zstd and the
+                zstandard package is not installed
+        """
+        if isinstance(value, str):
+            # Stored before the column was compressed
+            return value
+        value = bytes(value)
+        codec = value[0]
+        if codec == _PLAIN:
+            return value[1:].decode()
+        used = int.from_bytes(value[1:5], "big")
+        if used and used not in self._dictionaries:
+            self._reload()
+            if used not in self._dictionaries:
+                raise LookupError(f"Text dictionary {used} is not loaded")
+        if codec == _CODECS["zstd"]:
+            if zstandard is None:
+                raise ImportError("Reading zstd-compressed text requires the zstandard package")
+            decompressor = self._decompressors.get(used)
+            if decompressor is None:
+                dictionary = zstandard.ZstdCompressionDict(self._dictionaries[used]) if used else None
+                decompressor = self._decompressors[used] = zstandard.ZstdDecompressor(dict_data=dictionary)
+            return decompressor.decompress(value[5:]).decode()
+        decompressor = zlib.decompressobj(zdict=self._dictionaries[used]) if used else zlib.decompressobj()
+        return (decompressor.decompress(value[5:]) + decompressor.flush()).decode()
+
+
+    def _reload(self) -> None:
+        """Load the dictionaries again from the database they were last loaded from."""
+        if self._bind is None:
+            return
+        with Session(self._bind) as session:
+            self.load(session, force=True)
+
+
+text_codec = TextCodec(settings.text_compression, settings.text_compression_min_bytes)
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored compressed by text_codec.
+
+    Values that are already encoded, such as the ones COPY writes, are
+    stored as they are.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        return text_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return text_codec.decode(value)
@@ -104,9 +104,14 @@ class Settings(BaseSettings):
         description="Directory containing PostgreSQL log files",
         env="METRUM_LOGS_DIR"
     )
-    log_pattern: str = Field(
-        default="*.log",
-        description="Pattern to match log files",
+    log_format: str = Field(
+        default="stderr",
+        description="Format of the PostgreSQL log files (options: stderr, csvlog, jsonlog)",
+        env="METRUM_LOG_FORMAT"
+    )
+    log_pattern: str | None = Field(
+        default=None,
+        description="Pattern to match log files; defaults to *.log, *.csv or *.json depending on log_format",
         env="METRUM_LOG_PATTERN"
     )
     poll_interval: int = Field(
@@ -114,6 +119,132 @@ class Settings(BaseSettings):
         description="Interval between log file checks in seconds",
         env="METRUM_POLL_INTERVAL"
     )
+    log_session_max_count: int = Field(
+        default=1024,
+        description="Maximum number of backend sessions buffered at once before the least recently active one is flushed",
+        env="METRUM_LOG_SESSION_MAX_COUNT"
+    )
+    log_session_max_lines: int = Field(
+        default=10000,
+        description="Maximum number of lines buffered per session for a single query or explain plan",
+        env="METRUM_LOG_SESSION_MAX_LINES"
+    )
+    log_session_idle_timeout: float = Field(
+        default=30.0,
+        description="Seconds without new lines after which a session's buffered statement is flushed",
+        env="METRUM_LOG_SESSION_IDLE_TIMEOUT"
+    )
+    log_read_batch_bytes: int = Field(
+        default=8 * 1024 * 1024,
+        description="Maximum bytes read from a log file before the lines read so far are processed and checkpointed",
+        env="METRUM_LOG_READ_BATCH_BYTES"
+    )
+    log_read_batch_lines: int = Field(
+        default=100000,
+        description="Maximum lines read from a log file before the lines read so far are processed and checkpointed",
+        env="METRUM_LOG_READ_BATCH_LINES"
+    )
+    log_max_pending_events: int = Field(
+        default=10000,
+        description="Number of unsent events at which reading new log lines pauses",
+        env="METRUM_LOG_MAX_PENDING_EVENTS"
+    )
+    log_pipeline_queue_size: int = Field(
+        default=8,
+        description="Batches buffered between two stages of the log ingestion pipeline",
+        env="METRUM_LOG_PIPELINE_QUEUE_SIZE"
+    )
+    log_match_workers: int = Field(
+        default=1,
+        description="Batches of statements matched against patterns concurrently",
+        env="METRUM_LOG_MATCH_WORKERS"
+    )
+    log_delivery_concurrency: int = Field(
+        default=4,
+        description="Batches of events sent to the HTTP endpoint concurrently",
+        env="METRUM_LOG_DELIVERY_CONCURRENCY"
+    )
+    log_write_batch_events: int = Field(
+        default=500,
+        description="Events written to the database in one transaction",
+        env="METRUM_LOG_WRITE_BATCH_EVENTS"
+    )
+    log_write_batch_delay: float = Field(
+        default=0.5,
+        description="Seconds events wait to be grouped into one transaction before they are written anyway",
+        env="METRUM_LOG_WRITE_BATCH_DELAY"
+    )
+    log_delivery_batch_events: int = Field(
+        default=500,
+        description="Events posted to the HTTP endpoint in one request",
+        env="METRUM_LOG_DELIVERY_BATCH_EVENTS"
+    )
+    log_delivery_gzip: bool = Field(
+        default=False,
+        description="Whether to gzip the event batches posted to the HTTP endpoint",
+        env="METRUM_LOG_DELIVERY_GZIP"
+    )
+    log_delivery_http2: bool = Field(
+        default=True,
+        description="Whether to use HTTP/2 for event delivery when the h2 package is installed",
+        env="METRUM_LOG_DELIVERY_HTTP2"
+    )
+    log_delivery_max_attempts: int = Field(
+        default=8,
+        description="Delivery attempts after which an event is dead-lettered",
+        env="METRUM_LOG_DELIVERY_MAX_ATTEMPTS"
+    )
+    log_delivery_backoff: float = Field(
+        default=1.0,
+        description="Seconds before the first retry of an undelivered event, doubled for each further retry",
+        env="METRUM_LOG_DELIVERY_BACKOFF"
+    )
+    log_delivery_max_backoff: float = Field(
+        default=300.0,
+        description="Longest wait in seconds between two delivery attempts of an event",
+        env="METRUM_LOG_DELIVERY_MAX_BACKOFF"
+    )
+    log_delivery_lease: float = Field(
+        default=60.0,
+        description="Seconds an event claimed for delivery stays claimed before another worker may take it",
+        env="METRUM_LOG_DELIVERY_LEASE"
+    )
+    log_line_prefix: str | None = Field(
+        default=None,
+        description="PostgreSQL log_line_prefix of the monitored server; read from postgres_config_file or the server when unset",
+        env="METRUM_LOG_LINE_PREFIX"
+    )
+    postgres_config_file: Path | None = Field(
+        default=None,
+        description="postgresql.conf of the monitored server, used to look up log_line_prefix",
+        env="METRUM_POSTGRES_CONFIG_FILE"
+    )
+    log_backfill_workers: int | None = Field(
+        default=None,
+        description="Worker processes used to backfill historical log files; defaults to the number of CPUs",
+        env="METRUM_LOG_BACKFILL_WORKERS"
+    )
+    log_backfill_shard_mb: int = Field(
+        default=256,
+        description="Size in MB of the pieces large log files are split into for backfilling",
+        env="METRUM_LOG_BACKFILL_SHARD_MB"
+    )
+
+    text_compression: str = Field(
+        default="zstd",
+        description="Compression of stored query and plan text (zstd, zlib or none); zstd needs metrum[compression] and falls back to zlib",
+        env="METRUM_TEXT_COMPRESSION"
+    )
+    text_compression_min_bytes: int = Field(
+        default=64,
+        description="Query and plan text shorter than this many bytes is stored uncompressed",
+        env="METRUM_TEXT_COMPRESSION_MIN_BYTES"
+    )
+    query_analysis_cache_mb: int = Field(
+        default=64,
+        description="Estimated memory in MB for caching query analyses by query text; 0 disables the cache",
+        env="METRUM_QUERY_ANALYSIS_CACHE_MB"
+    )
 
     # Pattern configuration
     patterns_source: str = Field(
@@ -131,6 +262,11 @@ class Settings(BaseSettings):
         description="Time in seconds to cache pattern configurations before redownloading",
         env="METRUM_PATTERNS_CACHE_TTL"
     )
+    patterns_refresh_interval: float = Field(
+        default=300.0,
+        description="Seconds between conditional checks of the pattern source while monitoring; 0 disables them",
+        env="METRUM_PATTERNS_REFRESH_INTERVAL"
+    )
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -165,11 +301,38 @@ class Settings(BaseSettings):
             ws_ping_interval=self.ws_ping_interval,
             log_mode=self.log_mode,
             logs_dir=str(self.logs_dir),
+            log_format=self.log_format,
             log_pattern=self.log_pattern,
             poll_interval=self.poll_interval,
+            log_session_max_count=self.log_session_max_count,
+            log_session_max_lines=self.log_session_max_lines,
+            log_session_idle_timeout=self.log_session_idle_timeout,
+            log_read_batch_bytes=self.log_read_batch_bytes,
+            log_read_batch_lines=self.log_read_batch_lines,
+            log_max_pending_events=self.log_max_pending_events,
+            log_pipeline_queue_size=self.log_pipeline_queue_size,
+            log_match_workers=self.log_match_workers,
+            log_delivery_concurrency=self.log_delivery_concurrency,
+            log_write_batch_events=self.log_write_batch_events,
+            log_write_batch_delay=self.log_write_batch_delay,
+            log_delivery_batch_events=self.log_delivery_batch_events,
+            log_delivery_gzip=self.log_delivery_gzip,
+            log_delivery_http2=self.log_delivery_http2,
+            log_delivery_max_attempts=self.log_delivery_max_attempts,
+            log_delivery_backoff=self.log_delivery_backoff,
+            log_delivery_max_backoff=self.log_delivery_max_backoff,
+            log_delivery_lease=self.log_delivery_lease,
+            log_line_prefix=self.log_line_prefix,
+            postgres_config_file=str(self.postgres_config_file) if self.postgres_config_file else None,
+            log_backfill_workers=self.log_backfill_workers,
+            log_backfill_shard_mb=self.log_backfill_shard_mb,
+            text_compression=self.text_compression,
+            text_compression_min_bytes=self.text_compression_min_bytes,
+            query_analysis_cache_mb=self.query_analysis_cache_mb,
             patterns_source=self.patterns_source,
             patterns_cache_dir=str(self.patterns_cache_dir),
-            patterns_cache_ttl=self.patterns_cache_ttl
+            patterns_cache_ttl=self.patterns_cache_ttl,
+            patterns_refresh_interval=self.patterns_refresh_interval
         )
 
 settings = Settings()
@@ -0,0 +1,122 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader import LogMonitor
+from metrum.collector.log_reader import backfill as backfill_module
+from metrum.collector.log_reader.backfill import Backfill, BackfillOptions, parse_shard, plan_shards
+from metrum.collector.log_reader.pipeline import IngestPipeline
+from metrum.db.models import Base, LogCheckpoint, LogEvent
+
+
+def _write_log(path, count, hour=17):
+    """Write a log of interleaved sessions with multi-line statements and plans."""
+    lines = []
+    for i in range(count):
+        timestamp = f"2025-03-08 {hour}:{i // 60:02d}:{i % 60:02d}.000 GMT"
+        pid = 100 + i % 3
+        lines.append(f"{timestamp} [{pid}] LOG:  execute <unnamed>: SELECT {i}\n")
+        lines.append(f"\tFROM t{i}\n")
+        if i % 2:
+            lines.append(f"{timestamp} [{pid}] LOG:  duration: {i}.5 ms  plan:\n")
+            lines.append('\t{"Plan": {"Node Type": "Seq Scan"}}\n')
+    path.write_text("".join(lines))
+
+
+def _queries(result):
+    return [(row["query_text"], row["explain_text"]) for row in result.rows]
+
+
+def test_plan_shards_cuts_at_line_boundaries(tmp_path):
+    """Test that shards cover the file exactly and start on new lines."""
+    log_file = tmp_path / "postgresql.log"
+    _write_log(log_file, 50)
+    data = log_file.read_bytes()
+
+    shards = plan_shards([log_file], 300)
+
+    assert len(shards) > 1
+    assert shards[0].start == 0 and shards[-1].end == len(data)
+    for previous, shard in zip(shards, shards[1:]):
+        assert previous.end == shard.start
+        assert data[shard.start - 1:shard.start] == b"\n"
+
+
+def test_sharded_parse_matches_single_pass(tmp_path):
+    """Test that parsing shards yields each statement exactly once."""
+    log_file = tmp_path / "postgresql.log"
+    _write_log(log_file, 200)
+    options = BackfillOptions(patterns={})
+
+    whole = parse_shard(plan_shards([log_file], 1 << 30)[0], options)
+    sharded = []
+    for shard in plan_shards([log_file], 500):
+        sharded.extend(_queries(parse_shard(shard, options)))
+
+    assert len(whole.rows) == 200
+    assert sorted(sharded) == sorted(_queries(whole))
+
+
+def test_backfill_loads_events_and_checkpoints(tmp_path):
+    """Test that a backfill stores every event in time order and checkpoints each file."""
+    db_url = f"sqlite:///{tmp_path / 'metrum.db'}"
+    Base.metadata.create_all(create_engine(db_url))
+    files = [tmp_path / "postgresql-1.log", tmp_path / "postgresql-2.log"]
+    _write_log(files[0], 40, hour=17)
+    _write_log(files[1], 40, hour=18)
+
+    backfill = Backfill(db_url, BackfillOptions(patterns={}), workers=2, shard_bytes=400)
+
+    assert backfill.run(files) == 80
+    with Session(create_engine(db_url)) as session:
+        timestamps = list(session.execute(select(LogEvent.timestamp).order_by(LogEvent.id)).scalars())
+        checkpoints = session.execute(select(LogCheckpoint)).scalars().all()
+        assert timestamps == sorted(timestamps)
+        assert sorted(checkpoint.committed_offset for checkpoint in checkpoints) == sorted(
+            log_file.stat().st_size for log_file in files
+        )
+
+
+def test_follow_after_backfill_does_not_reload_files(tmp_path, monkeypatch):
+    """Test that following from the first file after a backfill only loads lines written since."""
+    db_url = f"sqlite:///{tmp_path / 'metrum.db'}"
+    Base.metadata.create_all(create_engine(db_url))
+    files = [tmp_path / "postgresql-1.log", tmp_path / "postgresql-2.log"]
+    _write_log(files[0], 40, hour=17)
+    _write_log(files[1], 40, hour=18)
+
+    def append(timestamp, message):
+        with files[1].open("a") as f:
+            f.write(f"2025-03-08 {timestamp} GMT [100] LOG:  {message}\n")
+
+    def plan_growing_shards(paths, shard_bytes):
+        # The live log is written to while the backfill starts
+        append("18:59:00.000", "execute <unnamed>: SELECT 40")
+        return plan_shards(paths, shard_bytes)
+
+    monkeypatch.setattr(backfill_module, "plan_shards", plan_growing_shards)
+    assert Backfill(db_url, BackfillOptions(patterns={}), workers=2, shard_bytes=400).run(files) == 81
+
+    append("19:00:00.000", "execute <unnamed>: SELECT 41")
+    append("19:00:01.000", "disconnection: session time: 0:00:01.000")
+    monitor = LogMonitor(
+        log_file_path=str(files[0]),
+        patterns={},
+        http_endpoint="http://localhost",
+        db_url=db_url,
+        follow_pattern="*.log",
+    )
+    monitor._restore_checkpoint()
+    # The pipeline's read, assemble, match and persist steps, until every line is read
+    pipeline = IngestPipeline(monitor)
+    batch = pipeline._read_batch()
+    while batch is not None:
+        statements, checkpoint = pipeline._assemble_batch(batch)
+        monitor.writer.add(monitor._build_events(statements), checkpoint)
+        batch = pipeline._read_batch()
+    monitor.writer.flush()
+
+    with Session(create_engine(db_url)) as session:
+        events = session.execute(select(LogEvent.timestamp, LogEvent.query_text)).all()
+    assert monitor.log_file_path == files[1]
+    assert len(events) == 82
+    assert len(set(events)) == 82
@@ -0,0 +1,121 @@
+import asyncio
+import gzip
+from datetime import datetime
+
+import pytest
+
+from metrum.collector.log_reader.backfill import BackfillOptions, parse_shard, plan_shards
+from metrum.collector.log_reader.compressed_log import detect_compression, open_log_file
+from metrum.collector.log_reader.file_follower import LogFileFollower
+from metrum.collector.log_reader.file_log_reader import FileLogReader
+from metrum.collector.log_reader.log_scanner import StreamScanner, open_scanner
+
+
+def _log_text(count=300):
+    lines = []
+    for i in range(count):
+        lines.append(f"2025-03-08 17:{i // 60:02d}:{i % 60:02d}.000 GMT [{i % 3}] LOG:  execute <unnamed>: SELECT {i}\n")
+        lines.append("\tFROM t\n")
+    return "".join(lines)
+
+
+def _read(reader, **kwargs):
+    async def collect():
+        return [line async for line in reader.read_logs(**kwargs)]
+    return asyncio.run(collect())
+
+
+def test_detects_compression_by_magic_bytes(tmp_path):
+    """Test that the container format is taken from the content, not the file name."""
+    plain = tmp_path / "postgresql.log"
+    plain.write_text(_log_text(2))
+    disguised = tmp_path / "postgresql-1.log"
+    disguised.write_bytes(gzip.compress(plain.read_bytes()))
+
+    assert detect_compression(plain) is None
+    assert detect_compression(disguised) == "gzip"
+    with open_log_file(disguised) as f:
+        assert f.read() == plain.read_bytes()
+
+
+def test_stream_scanner_matches_mmap_scanner(tmp_path):
+    """Test that compressed and plain files scan into the same batches of lines."""
+    plain = tmp_path / "postgresql.log"
+    plain.write_text(_log_text())
+    compressed = tmp_path / "postgresql.log.gz"
+    compressed.write_bytes(gzip.compress(plain.read_bytes()))
+
+    with open_scanner(plain) as scanner:
+        expected = [line for _, lines in scanner.line_batches(chunk_bytes=1000) for line in lines]
+    with open_scanner(compressed) as scanner:
+        assert isinstance(scanner, StreamScanner)
+        batches = list(scanner.line_batches(chunk_bytes=1000))
+
+    assert [line for _, lines in batches for line in lines] == expected
+    assert batches[1][0] == sum(len(line) + 1 for line in batches[0][1])
+
+
+def test_reads_compressed_rotated_logs(tmp_path):
+    """Test that compressed archives are listed and read, including time ranges."""
+    (tmp_path / "postgresql-1.log.gz").write_bytes(gzip.compress(_log_text(120).encode()))
+    (tmp_path / "postgresql-2.log").write_text("2025-03-08 18:00:00.000 GMT [1] LOG:  execute <unnamed>: SELECT 1\n")
+    reader = FileLogReader(logs_dir=tmp_path, pattern="*.log", log_format="stderr")
+
+    assert [path.name for path in reader.get_log_files()] == ["postgresql-1.log.gz", "postgresql-2.log"]
+    assert len(_read(reader)) == 241
+    ranged = _read(
+        reader,
+        start_time=datetime(2025, 3, 8, 17, 0, 30),
+        end_time=datetime(2025, 3, 8, 17, 0, 31),
+    )
+    assert ranged == [
+        "2025-03-08 17:00:30.000 GMT [0] LOG:  execute <unnamed>: SELECT 30",
+        "\tFROM t",
+        "2025-03-08 17:00:31.000 GMT [1] LOG:  execute <unnamed>: SELECT 31",
+        "\tFROM t",
+    ]
+
+
+
+def test_compressed_files_are_not_followed(tmp_path):
+    """Test that a compressed rotated file next to the live log is neither tailed nor switched to."""
+    line = "2025-03-08 18:00:00.000 GMT [1] LOG:  execute <unnamed>: SELECT 1\n"
+    live = tmp_path / "postgresql.log"
+    live.write_text(line)
+    (tmp_path / "postgresql.log.gz").write_bytes(gzip.compress(_log_text(2).encode()))
+    reader = FileLogReader(logs_dir=tmp_path, pattern="*.log", log_format="stderr")
+
+    assert [path.name for path in reader.get_log_files()] == ["postgresql.log", "postgresql.log.gz"]
+    assert reader.get_log_files(include_compressed=False) == [live]
+    follower = LogFileFollower(live, pattern="postgresql*")
+    assert follower.read_lines() == [line]
+    assert follower.read_lines() == []
+    assert follower.path == live
+
+def test_backfill_parses_compressed_file_whole(tmp_path):
+    """Test that a compressed file becomes a single shard with the same events as the plain file."""
+    plain = tmp_path / "postgresql.log"
+    plain.write_text(_log_text())
+    compressed = tmp_path / "postgresql.log.gz"
+    compressed.write_bytes(gzip.compress(plain.read_bytes()))
+    options = BackfillOptions(patterns={})
+
+    shards = plan_shards([compressed], 100)
+    plain_rows = parse_shard(plan_shards([plain], 1 << 30)[0], options).rows
+
+    assert len(shards) == 1
+    assert parse_shard(shards[0], options).rows == plain_rows
+
+
+def test_missing_decompressor_is_reported(tmp_path):
+    """Test that zstd files without the zstandard package fail with an ImportError."""
+    try:
+        import zstandard  # noqa: F401
+        pytest.skip("zstandard is installed")
+    except ImportError:
+        pass
+    log_file = tmp_path / "postgresql.log.zst"
+    log_file.write_bytes(b"\x28\xb5\x2f\xfd" + b"\x00" * 8)
+
+    with pytest.raises(ImportError, match="zstandard"):
+        open_log_file(log_file)
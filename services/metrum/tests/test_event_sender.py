@@ -0,0 +1,92 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime
+
+import httpx
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader import LogMonitor
+from metrum.collector.log_reader.event_sender import EventSender
+from metrum.collector.log_reader.event_writer import event_row, insert_events
+from metrum.db.models import Base, LogEvent
+
+
+def _event(i: int) -> LogEvent:
+    return LogEvent(
+        id=i,
+        timestamp=datetime(2025, 3, 8, 17, 0, i % 60),
+        query_text=f"SELECT {i} FROM accounts",
+        explain_text="{}",
+        duration_ms=1.0,
+        pattern_name="test",
+    )
+
+
+def test_sends_gzipped_batches_with_bounded_concurrency():
+    """Test that batches share one client, are gzipped and never exceed max_in_flight."""
+    in_flight, peak, received = 0, 0, []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        assert request.headers["Content-Encoding"] == "gzip"
+        received.append(json.loads(gzip.decompress(request.content))["events"])
+        return httpx.Response(200)
+
+    sender = EventSender("http://collector/events", max_in_flight=2, compress=True,
+                         transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        results = await asyncio.gather(*(
+            sender.send([_event(i * 50 + j) for j in range(50)]) for i in range(6)
+        ))
+        client = sender._client
+        await sender.aclose()
+        return results, client
+
+    results, client = asyncio.run(scenario())
+
+    assert results == [True] * 6
+    assert client is not None and client.is_closed
+    assert peak == 2
+    assert sorted(event["id"] for batch in received for event in batch) == list(range(300))
+
+
+def test_acknowledged_batches_are_marked_sent(tmp_path):
+    """Test that acked batches are sent, rejected ones failed, and unavailable ones stay pending."""
+    db_url = f"sqlite:///{tmp_path / 'metrum.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        insert_events(session, [event_row(_event(i)) for i in range(1, 31)])
+        session.commit()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ids = [event["id"] for event in json.loads(request.content)["events"]]
+        if 11 in ids:
+            return httpx.Response(422)
+        if 21 in ids:
+            return httpx.Response(503)
+        return httpx.Response(200)
+
+    monitor = LogMonitor(
+        log_file_path=str(tmp_path / "postgresql.log"),
+        patterns={},
+        http_endpoint="http://collector/events",
+        db_url=db_url,
+        delivery_batch_events=10,
+    )
+    monitor.sender = EventSender("http://collector/events", transport=httpx.MockTransport(handler))
+
+    asyncio.run(monitor._process_events())
+
+    with Session(engine) as session:
+        statuses = dict(session.execute(select(LogEvent.id, LogEvent.status)).all())
+    assert {statuses[i] for i in range(1, 11)} == {"sent"}
+    assert {statuses[i] for i in range(11, 21)} == {"failed"}
+    assert {statuses[i] for i in range(21, 31)} == {"pending"}
@@ -0,0 +1,91 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader.checkpoint import Checkpoint, CheckpointStore, FileIdentity
+from metrum.collector.log_reader.event_writer import EventWriter, event_row
+from metrum.db.models import Base, LogCheckpoint, LogEvent
+
+IDENTITY = FileIdentity(1, 1, 100, "hash")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Create a database with the log tables."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _event(i: int) -> Dict[str, Any]:
+    return event_row(LogEvent(
+        timestamp=datetime(2025, 3, 8, 17, 0, i),
+        query_text=f"SELECT {i}",
+        explain_text="{}",
+        duration_ms=1.0,
+        pattern_name="test",
+    ))
+
+
+def _checkpoint(offset: int) -> Checkpoint:
+    return Checkpoint(Path("/var/log/postgresql.log"), IDENTITY, offset, offset)
+
+
+def _stored(engine):
+    with Session(engine) as session:
+        count = session.execute(select(func.count()).select_from(LogEvent)).scalar_one()
+        offset = session.execute(select(LogCheckpoint.committed_offset)).scalar_one_or_none()
+    return count, offset
+
+
+def test_flushes_by_count_and_by_delay(engine):
+    """Test that buffered events are due once enough are waiting or the oldest is old enough."""
+    clock = FakeClock()
+    writer = EventWriter(engine, CheckpointStore(engine), max_events=3, max_delay=0.5, clock=clock)
+
+    assert not writer.due() and writer.time_until_due() is None
+    writer.add([_event(0), _event(1)], _checkpoint(10))
+    assert not writer.due()
+    writer.add([_event(2)], _checkpoint(20))
+    assert writer.due()
+    assert writer.flush() == 3
+    assert _stored(engine) == (3, 20)
+
+    writer.add([_event(3)], _checkpoint(30))
+    clock.now = 0.4
+    assert not writer.due()
+    assert writer.time_until_due() == pytest.approx(0.1)
+    clock.now = 0.5
+    assert writer.due()
+    writer.flush()
+    assert _stored(engine) == (4, 30)
+
+
+def test_checkpoint_is_written_with_its_events(engine):
+    """Test that a failed flush stores neither events nor checkpoint, and can be retried."""
+    writer = EventWriter(engine, CheckpointStore(engine))
+    writer.add([_event(0)], _checkpoint(10))
+    writer.add([event_row(LogEvent(timestamp=None, query_text="SELECT broken"))], _checkpoint(20))
+
+    with pytest.raises(Exception):
+        writer.flush()
+    assert _stored(engine) == (0, None)
+    assert writer.buffered
+
+    writer._rows[1]["timestamp"] = datetime(2025, 3, 8, 17, 0, 1)
+    writer.flush()
+    assert _stored(engine) == (2, 20)
+    with Session(engine) as session:
+        assert set(session.execute(select(LogEvent.status)).scalars()) == {"pending"}
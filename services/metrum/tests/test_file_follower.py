@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from metrum.collector.log_reader.file_follower import FileWatcher, LogFileFollower
+
+
+def test_follower_keeps_partial_lines(tmp_path):
+    """Test that a line still being written is read once it is complete."""
+    log_file = tmp_path / "postgresql-01.log"
+    log_file.write_text("first\nsec")
+    follower = LogFileFollower(log_file)
+
+    assert follower.read_lines() == ["first\n"]
+    with log_file.open("a") as f:
+        f.write("ond\n")
+    assert follower.read_lines() == ["second\n"]
+
+
+def test_follower_drains_before_rotating(tmp_path):
+    """Test that the current file is read to EOF before the next file is opened."""
+    first = tmp_path / "postgresql-01.log"
+    first.write_text("a\n")
+    follower = LogFileFollower(first, pattern="*.log")
+    assert follower.read_lines() == ["a\n"]
+
+    with first.open("a") as f:
+        f.write("b\n")
+    (tmp_path / "postgresql-03.log").write_text("d\n")
+    (tmp_path / "postgresql-02.log").write_text("c\n")
+
+    assert follower.read_lines() == ["b\n"]
+    assert follower.read_lines() == ["c\n"]
+    assert follower.read_lines() == ["d\n"]
+    assert follower.path.name == "postgresql-03.log"
+    assert follower.rotations == 2
+
+
+def test_follower_handles_truncation_and_replacement(tmp_path):
+    """Test that truncated and replaced files are read from the start."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("one\ntwo\n")
+    follower = LogFileFollower(log_file)
+    follower.read_lines()
+
+    log_file.write_text("3\n")
+    assert follower.read_lines() == ["3\n"]
+
+    log_file.rename(tmp_path / "postgresql.log.1")
+    log_file.write_text("four\n")
+    assert follower.read_lines() == ["four\n"]
+    assert follower.rotations == 2
+
+
+def test_watcher_wakes_on_write(tmp_path):
+    """Test that waiting returns as soon as a file in the directory changes."""
+    watcher = FileWatcher(tmp_path, poll_interval=1.0)
+    uses_inotify = watcher.uses_inotify
+
+    async def wait_for_write():
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, (tmp_path / "postgresql.log").write_text, "line\n")
+        started = time.monotonic()
+        await watcher.wait(5.0)
+        return time.monotonic() - started
+
+    try:
+        elapsed = asyncio.run(wait_for_write())
+    finally:
+        watcher.close()
+
+    # Polling wakes up after poll_interval at the latest
+    assert elapsed < (0.5 if uses_inotify else 2.0)
+
+
+def test_watcher_polls_without_inotify(tmp_path):
+    """Test the polling fallback."""
+    watcher = FileWatcher(tmp_path, poll_interval=0.01, use_inotify=False)
+
+    assert not watcher.uses_inotify
+    asyncio.run(watcher.wait(5.0))
+
+
+def test_follower_reads_in_bounded_batches(tmp_path):
+    """Test that reads stop at the byte and line budget and long lines stay whole."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("aaaa\nbbbb\n" + "c" * 20 + "\nd\ne\nf\n")
+    follower = LogFileFollower(log_file, max_bytes=12, max_lines=2)
+
+    assert follower.read_lines() == ["aaaa\n", "bbbb\n"]
+    assert follower.backlogged
+    assert follower.read_lines() == ["c" * 20 + "\n"]
+    assert follower.read_lines() == ["d\n", "e\n"]
+    assert follower.backlogged
+    assert follower.read_lines() == ["f\n"]
+    assert not follower.backlogged
+    assert follower.position == log_file.stat().st_size
@@ -0,0 +1,53 @@
+from metrum.collector.log_reader.event_builder import EventBuilder
+from metrum.collector.log_reader.line_classifier import LineClassifier
+from metrum.collector.log_reader.log_line_prefix import LogLinePrefix
+from metrum.collector.log_reader.session_assembler import SessionAssembler
+from metrum.collector.queries import MetrumQuery
+from metrum.common.fingerprint import fingerprint, normalize_query
+
+
+def test_statements_differing_in_constants_share_a_fingerprint():
+    """Test that literals, parameters, IN lists and VALUES rows are replaced by placeholders."""
+    same = [
+        "SELECT * FROM orders WHERE id = 1 AND status IN ('new', 'paid') LIMIT 10",
+        "select *\n  from Orders  -- recent\n where id = -2 and status in ('new') limit 50",
+        "SELECT * FROM orders WHERE id = $1 AND status IN ($2, $3, $4) LIMIT $5",
+    ]
+    assert normalize_query(same[0]) == "SELECT * FROM orders WHERE id = $1 AND status IN ($2 /*, ... */) LIMIT $3"
+    assert len({fingerprint(query) for query in same}) == 1
+    assert fingerprint(same[0]) != fingerprint("SELECT * FROM orders WHERE customer_id = 1")
+
+    assert normalize_query(
+        "INSERT INTO t (a, b) VALUES (1, 'x'), (2, E'it\\'s'), (3, $$z$$) RETURNING a"
+    ) == "INSERT INTO t(a, b) VALUES ($1, $2) /*, ... */ RETURNING a"
+    assert normalize_query("SELECT a - 1, x::text FROM t WHERE ts > now() - interval '1 day'") == (
+        "SELECT a - $1, x::text FROM t WHERE ts > now() - INTERVAL $2"
+    )
+
+    first, second = (MetrumQuery.from_query(query) for query in same[:2])
+    assert first.query_hash == second.query_hash
+    assert first.normalized_query == second.normalized_query
+
+
+def test_events_carry_fingerprint_and_server_query_id():
+    """Test that the %Q query identifier of the plan line reaches the event."""
+    prefix = "%m [%p] %Q "
+    assembler = SessionAssembler(classifier=LineClassifier(LogLinePrefix(prefix)))
+    statements = assembler.feed([
+        "2025-03-08 17:06:20.123 GMT [42] 0 LOG:  execute <unnamed>: SELECT * FROM accounts WHERE id = 7",
+        "2025-03-08 17:06:20.125 GMT [42] -5174210982012345678 LOG:  duration: 1.500 ms  plan:",
+        '\t{"Plan": {"Node Type": "Seq Scan"}}',
+        "2025-03-08 17:06:21.000 GMT [42] 0 LOG:  execute <unnamed>: SELECT 1",
+    ])
+    assert [statement.query_id for statement in statements] == ["-5174210982012345678"]
+
+    statement = statements[0]
+    fields = EventBuilder({}).build(
+        statement.query_lines,
+        statement.explain_lines,
+        statement.duration_ms,
+        statement.timestamp,
+        statement.query_id,
+    )
+    assert fields["query_id"] == -5174210982012345678
+    assert fields["fingerprint"] == fingerprint("SELECT * FROM accounts WHERE id = 8").query_id
@@ -0,0 +1,72 @@
+import pytest
+
+from metrum.collector.log_reader.line_classifier import LineClassifier, LineKind
+from metrum.collector.log_reader.log_line_prefix import LogLinePrefix
+
+
+PREFIX = "2025-03-08 17:06:20.123 GMT [4242] "
+
+
+@pytest.fixture
+def classifier():
+    """Create a line classifier."""
+    return LineClassifier()
+
+
+def test_classify_query_line(classifier):
+    """Test that execute lines yield the statement text."""
+    line = classifier.classify(f"{PREFIX}LOG:  execute <unnamed>: SELECT * FROM accounts\n")
+
+    assert line.kind == LineKind.QUERY
+    assert line.timestamp == "2025-03-08 17:06:20.123 GMT"
+    assert line.prefix == PREFIX
+    assert line.severity == "LOG"
+    assert line.payload == "SELECT * FROM accounts"
+    assert line.pid == "4242"
+
+
+def test_classify_explain_line(classifier):
+    """Test that auto_explain headers carry their duration."""
+    line = classifier.classify(f"{PREFIX}LOG:  duration: 12.345 ms  plan:")
+
+    assert line.kind == LineKind.EXPLAIN
+    assert line.duration_ms == 12.345
+    assert line.payload == ""
+
+
+def test_classify_other_lines(classifier):
+    """Test temporary file, plain messages and continuation lines."""
+    temp_file = classifier.classify(f'{PREFIX}LOG:  temporary file: path "base/pgsql_tmp/1", size 8192')
+    duration = classifier.classify(f"{PREFIX}LOG:  duration: 0.512 ms")
+    error = classifier.classify(f"{PREFIX}ERROR:  relation \"missing\" does not exist")
+
+    assert temp_file.kind == LineKind.TEMP_FILE
+    assert duration.kind == LineKind.MESSAGE
+    assert error.kind == LineKind.MESSAGE
+    assert error.severity == "ERROR"
+    assert classifier.classify('\t  "Plan": {') is None
+    assert classifier.classify("\tFROM accounts") is None
+    assert classifier.classify("2025-03-08 is not a log line") is None
+
+
+def test_classify_pid_with_line_number():
+    """Test that "[%p-%l]" prefixes yield the process ID."""
+    classifier = LineClassifier(LogLinePrefix("%m [%p-%l] "))
+    line = classifier.classify("2025-03-08 17:06:20.123 UTC [4242-17] LOG:  duration: 1.0 ms")
+
+    assert line.pid == "4242"
+
+
+def test_classify_fields_from_custom_prefix():
+    """Test that user, database and application come from the configured prefix."""
+    classifier = LineClassifier(LogLinePrefix("%t [%p]: user=%u,db=%d,app=%a "))
+    line = classifier.classify(
+        "2025-03-08 17:06:20 UTC [4242]: user=metrum,db=orders,app=psql LOG:  execute S_1: SELECT 1"
+    )
+
+    assert line.kind == LineKind.QUERY
+    assert line.timestamp == "2025-03-08 17:06:20 UTC"
+    assert (line.pid, line.user, line.database, line.application) == ("4242", "metrum", "orders", "psql")
+    assert line.payload == "SELECT 1"
+    # Lines written with the default prefix do not match
+    assert classifier.classify(f"{PREFIX}LOG:  execute S_1: SELECT 1") is None
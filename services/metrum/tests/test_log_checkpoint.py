@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader import CheckpointStore, LogMonitor
+from metrum.collector.log_reader.pipeline import IngestPipeline
+from metrum.db.models import Base, LogCheckpoint, LogEvent
+
+PREFIX = "2025-03-08 17:06:20.123 GMT"
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    """Create a database with the log tables."""
+    url = f"sqlite:///{tmp_path / 'metrum.db'}"
+    Base.metadata.create_all(create_engine(url))
+    return url
+
+
+def _pipeline(log_file, db_url, **kwargs):
+    """Create the pipeline of a monitor for a log file, as if the service had just started."""
+    monitor = LogMonitor(
+        log_file_path=str(log_file),
+        patterns={},
+        http_endpoint="http://localhost",
+        db_url=db_url,
+        **kwargs,
+    )
+    monitor._restore_checkpoint()
+    return IngestPipeline(monitor)
+
+
+def _persist(pipeline, batch):
+    """Assemble, match and commit a batch of lines as the pipeline's stages do."""
+    monitor = pipeline.monitor
+    statements, checkpoint = pipeline._assemble_batch(batch)
+    monitor.writer.add(monitor._build_events(statements), checkpoint)
+    monitor.writer.flush()
+
+
+def _ingest(pipeline):
+    """Read every new line, following rotation, and commit the events they complete."""
+    batch = pipeline._read_batch()
+    while batch is not None:
+        _persist(pipeline, batch)
+        batch = pipeline._read_batch()
+    # As the pipeline does once it is idle
+    _persist(pipeline, None)
+
+
+def _query_texts(db_url):
+    """Return the query text of every stored event."""
+    with Session(create_engine(db_url)) as session:
+        return [event.query_text for event in session.execute(select(LogEvent).order_by(LogEvent.id)).scalars()]
+
+
+def test_restart_resumes_without_duplicates(tmp_path, db_url):
+    """Test that a restarted monitor neither re-emits nor loses statements."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text(
+        f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 1\n"
+        f"{PREFIX} [2] LOG:  execute <unnamed>: SELECT 2\n"
+        f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 3\n"
+        f"{PREFIX} [2] LOG:  execute <unnamed>: SELECT\n"
+    )
+    _ingest(_pipeline(log_file, db_url))
+    assert _query_texts(db_url) == ["SELECT 1", "SELECT 2"]
+
+    # Session 2's statement continues after the restart, and a line is half written
+    with log_file.open("a") as f:
+        f.write("\t4\n")
+        f.write(f"{PREFIX} [2] LOG:  disconnection: session time: 0:00:01.000\n")
+        f.write(f"{PREFIX} [1] LOG:  execute <unnamed>: SEL")
+    _ingest(_pipeline(log_file, db_url))
+
+    assert _query_texts(db_url) == ["SELECT 1", "SELECT 2", "SELECT\n\t4"]
+    with Session(create_engine(db_url)) as session:
+        checkpoint = session.execute(select(LogCheckpoint)).scalar_one()
+    assert checkpoint.committed_offset == log_file.stat().st_size - len(f"{PREFIX} [1] LOG:  execute <unnamed>: SEL")
+    # Session 1's "SELECT 3" is still open, so a restart has to replay from its batch
+    assert checkpoint.resume_offset == 0
+
+
+def test_replaced_file_is_read_from_the_start(tmp_path, db_url):
+    """Test that a checkpoint is ignored once the file at its path changes."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text(
+        f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 1\n"
+        f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 2\n"
+    )
+    _ingest(_pipeline(log_file, db_url))
+
+    log_file.write_text(
+        f"2025-03-09 00:00:00.000 GMT [7] LOG:  execute <unnamed>: SELECT 3\n"
+        f"2025-03-09 00:00:00.000 GMT [7] LOG:  execute <unnamed>: SELECT 4\n"
+    )
+    pipeline = _pipeline(log_file, db_url)
+
+    assert pipeline.monitor.last_position == 0
+    _ingest(pipeline)
+    assert _query_texts(db_url) == ["SELECT 1", "SELECT 3"]
+
+
+def test_monitor_follows_rotation(tmp_path, db_url):
+    """Test that the monitor switches to the next log file and checkpoints it."""
+    first = tmp_path / "postgresql-01.log"
+    first.write_text(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 1\n")
+    pipeline = _pipeline(first, db_url, follow_pattern="*.log")
+    _ingest(pipeline)
+
+    second = tmp_path / "postgresql-02.log"
+    second.write_text(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 2\n")
+    _ingest(pipeline)
+
+    assert pipeline.monitor.log_file_path == second
+    assert _query_texts(db_url) == ["SELECT 1"]
+    with Session(create_engine(db_url)) as session:
+        paths = session.execute(select(LogCheckpoint.file_path)).scalars().all()
+    assert sorted(paths) == [str(first), str(second)]
+
+
+def test_restart_across_rotation_resumes_each_file_from_its_checkpoint(tmp_path, db_url):
+    """Test that files after the first are not re-read, and a statement spanning two files is emitted once."""
+    first = tmp_path / "postgresql-01.log"
+    second = tmp_path / "postgresql-02.log"
+    first.write_text(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 1\n")
+
+    pipeline = _pipeline(first, db_url, follow_pattern="*.log")
+    _ingest(pipeline)
+    # Session 1's statement is still open when the log rotates
+    second.write_text(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 2\n")
+    _ingest(pipeline)
+    assert _query_texts(db_url) == ["SELECT 1"]
+
+    checkpoints = CheckpointStore(create_engine(db_url))
+    assert checkpoints.first_unfinished([first, second]) == first
+    # As after a restart of "metrum run", which starts at the oldest unfinished file
+    pipeline = _pipeline(first, db_url, follow_pattern="*.log")
+    _ingest(pipeline)
+    with second.open("a") as f:
+        f.write(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT 3\n")
+    _ingest(pipeline)
+
+    assert pipeline.monitor.log_file_path == second
+    assert _query_texts(db_url) == ["SELECT 1", "SELECT 2"]
+    # The statement carried over completed, so only the second file is left to resume
+    assert checkpoints.first_unfinished([first, second]) == second
+
+
+def test_backlog_is_ingested_in_batches_with_backpressure(tmp_path, db_url):
+    """Test that each batch is checkpointed and the read stage pauses while events are unsent."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("".join(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT {i}\n" for i in range(6)))
+    pipeline = _pipeline(log_file, db_url, poll_interval=0.01, read_batch_lines=2, max_pending_events=3)
+    monitor = pipeline.monitor
+
+    async def scenario():
+        await pipeline._read()
+        _persist(pipeline, pipeline.lines.get_nowait())
+        assert _query_texts(db_url) == ["SELECT 0"]
+        with Session(create_engine(db_url)) as session:
+            assert session.execute(select(LogCheckpoint.committed_offset)).scalar_one() == monitor.last_position
+        await pipeline._read()
+        _persist(pipeline, pipeline.lines.get_nowait())
+        assert _query_texts(db_url) == ["SELECT 0", "SELECT 1", "SELECT 2"]
+
+        # Three events are waiting to be sent, so nothing more is read
+        position = monitor.last_position
+        await pipeline._read()
+        assert pipeline.lines.empty()
+        assert monitor.last_position == position
+
+    asyncio.run(scenario())
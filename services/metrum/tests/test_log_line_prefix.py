@@ -0,0 +1,89 @@
+import pytest
+
+from metrum.collector.log_reader.log_line_prefix import (
+    DEFAULT_LOG_LINE_PREFIX,
+    LogLinePrefix,
+    read_config_setting,
+)
+
+
+def test_default_prefix_is_parsed_positionally():
+    """Test that the default prefix compiles to a positional parser."""
+    prefix = LogLinePrefix()
+    fields = prefix.parse("2025-03-08 17:06:20.123 GMT [4242] LOG:  execute S_1: SELECT 1")
+
+    assert prefix.source is not None
+    assert prefix.has_timestamp
+    assert fields.timestamp == "2025-03-08 17:06:20.123 GMT"
+    assert fields.pid == "4242"
+    assert fields.end == len("2025-03-08 17:06:20.123 GMT [4242] ")
+    assert prefix.parse('\t  "Plan": {') is None
+    assert prefix.parse("2025-03-08 is not a log line") is None
+
+
+def test_prefix_with_session_fields():
+    """Test that %q stops the prefix for processes without a session."""
+    prefix = LogLinePrefix("%m [%p] %q%u@%d/%a ")
+    session = prefix.parse("2025-03-08 17:06:20.123 UTC [42] postgres@metrum/psql LOG:  x")
+    background = prefix.parse("2025-03-08 17:06:20.123 UTC [7] LOG:  checkpoint starting: time")
+
+    assert (session.user, session.database, session.application) == ("postgres", "metrum", "psql")
+    assert background.pid == "7"
+    assert background.user is None
+    assert background.end == len("2025-03-08 17:06:20.123 UTC [7] ")
+
+
+@pytest.mark.parametrize("value, line, expected", [
+    ("%m %c ", "2025-03-08 17:06:20.123 UTC 65f1.2a LOG:  x", "65f1.2a"),
+    ("%n|%c|", "1700000000.123|65f1.2a|LOG:  x", "65f1.2a"),
+    ("%c%%", "65f1.2a%LOG:  x", "65f1.2a"),
+])
+def test_session_id_from_prefix(value, line, expected):
+    """Test session IDs from positional and regex-backed prefixes."""
+    assert LogLinePrefix(value).parse(line).session_id == expected
+
+
+def test_adjacent_fields_fall_back_to_regex():
+    """Test that fields without a literal delimiter use the regex parser."""
+    prefix = LogLinePrefix("%a%p ")
+    fields = prefix.parse("psql42 ERROR:  boom")
+
+    assert prefix.source is None
+    assert (fields.application, fields.pid) == ("psql", "42")
+    assert fields.end == len("psql42 ")
+
+
+
+@pytest.mark.parametrize("value, line, expected", [
+    ("%m%p ", "2025-03-08 17:06:20.123 UTC424 LOG:  x", ("2025-03-08 17:06:20.123 UTC", "424")),
+    ("%t%p ", "2025-03-08 17:06:20 +03424 LOG:  x", ("2025-03-08 17:06:20 +03", "424")),
+    ("%m%p ", "2025-03-08 17:06:20.123 +05:30424 LOG:  x", ("2025-03-08 17:06:20.123 +05:30", "424")),
+    ("%m %p%a ", "2025-03-08 17:06:20.123 +0530 424psql LOG:  x", ("2025-03-08 17:06:20.123 +0530", "424")),
+])
+def test_adjacent_escapes_after_a_timestamp(value, line, expected):
+    """Test that a timestamp's zone stops where the next field's digits start."""
+    fields = LogLinePrefix(value).parse(line)
+
+    assert (fields.timestamp, fields.pid) == expected
+
+def test_read_config_setting(tmp_path):
+    """Test postgresql.conf parsing, including quotes and overrides."""
+    config = tmp_path / "postgresql.conf"
+    config.write_text(
+        "#log_line_prefix = '%m [%p] '\t\t# commented out\n"
+        "log_line_prefix = '%t [%p]: '  # first\n"
+        "log_line_prefix='%m [%p] user=%u,app=''%a'' '\n"
+        "log_destination = stderr\n"
+    )
+
+    assert read_config_setting(config, "log_line_prefix") == "%m [%p] user=%u,app='%a' "
+    assert read_config_setting(config, "log_destination") == "stderr"
+    assert read_config_setting(config, "log_timezone") is None
+
+
+def test_from_config_file_defaults(tmp_path):
+    """Test that a config file without log_line_prefix yields the server default."""
+    config = tmp_path / "postgresql.conf"
+    config.write_text("#log_line_prefix = '%t '\n")
+
+    assert LogLinePrefix.from_config_file(config).prefix == DEFAULT_LOG_LINE_PREFIX
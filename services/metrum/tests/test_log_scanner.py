@@ -0,0 +1,68 @@
+from metrum.collector.log_reader.log_scanner import LogScanner
+from metrum.collector.log_reader.session_assembler import SessionAssembler
+
+PREFIX = "2025-03-08 17:06:20.123 GMT [1] "
+
+
+def test_chunks_end_on_line_boundaries(tmp_path):
+    """Test that windows cover the file and never split a line."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("".join(f"{PREFIX}LOG:  line {i}\n" for i in range(100)))
+
+    with LogScanner(log_file) as scanner:
+        chunks = [(offset, bytes(chunk)) for offset, chunk in scanner.chunks(chunk_bytes=100)]
+        lines = [line for _, batch in scanner.line_batches(chunk_bytes=100) for line in batch]
+
+    assert b"".join(chunk for _, chunk in chunks) == log_file.read_bytes()
+    assert all(chunk.endswith(b"\n") for _, chunk in chunks)
+    assert chunks[1][0] == len(chunks[0][1])
+    assert lines == log_file.read_text().splitlines()
+
+
+def test_message_batches_skip_windows_without_statements(tmp_path):
+    """Test that windows without statements are skipped except for their first lines."""
+    log_file = tmp_path / "postgresql.log"
+    statement = f"{PREFIX}LOG:  execute <unnamed>: SELECT 1\n"
+    continuation = "\tFROM t\n"
+    chatter = f"{PREFIX}LOG:  checkpoint starting: time\n"
+    log_file.write_text(statement + continuation + chatter * 5)
+
+    with LogScanner(log_file) as scanner:
+        batches = list(scanner.message_batches(chunk_bytes=len(statement)))
+
+    assert batches[0] == (0, [statement.rstrip("\n")])
+    assert batches[1] == (len(statement), ["\tFROM t"])
+    # Only the first message of each skipped window is decoded
+    assert [lines for _, lines in batches[2:]] == [[chatter.rstrip("\n")]] * 5
+
+
+def test_skipped_window_ends_the_open_message(tmp_path):
+    """Test that continuation lines after a skipped window are not added to a statement before it."""
+    log_file = tmp_path / "postgresql.log"
+    first = f"{PREFIX}LOG:  execute <unnamed>: SELECT 1\n"
+    chatter = f"{PREFIX}LOG:  checkpoint starting: time\n"
+    detail = f"{PREFIX}ERROR:  syntax error\n\tFROM secret_table\n"
+    second = f"{PREFIX}LOG:  execute <unnamed>: SELECT 2\n"
+    log_file.write_text(first + chatter + detail + second)
+    assembler = SessionAssembler()
+
+    with LogScanner(log_file) as scanner:
+        # One message per window: the chatter and the error are skipped
+        statements = [
+            statement
+            for offset, lines in scanner.message_batches(chunk_bytes=1)
+            for statement in assembler.feed(lines, offset)
+        ]
+    statements.extend(assembler.flush_all())
+
+    assert ["\n".join(statement.query_lines) for statement in statements] == ["SELECT 1", "SELECT 2"]
+
+
+def test_empty_file(tmp_path):
+    """Test that an empty file yields nothing."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("")
+
+    with LogScanner(log_file) as scanner:
+        assert scanner.size == 0
+        assert list(scanner.line_batches()) == []
@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+
+from metrum.common.logger import configure_logger, debug_enabled, json_serializer
+
+
+def test_serializer_output_matches_json():
+    """Test that the fast serializer renders events like the stdlib one."""
+    event = {"event": "read_lines", "count": 3, "offset": 1.5, "file": "pg.log", "ok": True, "none": None}
+
+    rendered = json_serializer()(event, default=str)
+
+    assert json.loads(rendered) == event
+    assert isinstance(rendered, str)
+    assert json.loads(json_serializer()({"at": datetime(2025, 3, 8)}, default=str)) == {
+        "at": "2025-03-08T00:00:00"
+    }
+
+
+def test_debug_guard_follows_log_level(monkeypatch):
+    """Test that debug_enabled reflects LOG_LEVEL after configuration."""
+    monkeypatch.setenv("LOG_ASYNC", "false")
+    try:
+        monkeypatch.setenv("LOG_LEVEL", "DEBUG")
+        configure_logger()
+        assert debug_enabled()
+
+        monkeypatch.setenv("LOG_LEVEL", "INFO")
+        configure_logger()
+        assert not debug_enabled()
+    finally:
+        monkeypatch.delenv("LOG_LEVEL")
+        monkeypatch.delenv("LOG_ASYNC")
+        configure_logger()
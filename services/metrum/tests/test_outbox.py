@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader.event_writer import insert_events
+from metrum.collector.log_reader.outbox import Outbox
+from metrum.db.models import Base, Event, EventStatus, LogEvent
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2025, 3, 8, 17, 0, 0)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Create a database with ten queued log events."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        insert_events(session, [
+            {
+                "timestamp": datetime(2025, 3, 8, 17, 0, i),
+                "query_text": f"SELECT {i}",
+                "explain_text": "{}",
+                "duration_ms": 1.0,
+                "pattern_name": "test",
+            }
+            for i in range(10)
+        ])
+        # Queued earlier than the fake clock, so they are due
+        session.execute(Event.__table__.update().values(next_attempt_at=datetime(2025, 3, 8, 16, 0, 0)))
+        session.commit()
+    return engine
+
+
+def _statuses(engine):
+    with Session(engine) as session:
+        return session.execute(select(Event.status, LogEvent.status).join(
+            LogEvent, LogEvent.id == Event.id
+        ).order_by(Event.id)).all()
+
+
+def test_claims_do_not_overlap_until_the_lease_expires(engine):
+    """Test that concurrent claims get disjoint rows and abandoned rows are claimed again."""
+    clock = FakeClock()
+    outbox = Outbox(engine, lease=30.0, clock=clock)
+
+    first = outbox.claim(6)
+    second = outbox.claim(6)
+    clock.advance(10)
+    assert outbox.claim(6) == []
+
+    assert [row.event.query_text for row in first] == [f"SELECT {i}" for i in range(6)]
+    assert [row.event.query_text for row in second] == [f"SELECT {i}" for i in range(6, 10)]
+    assert outbox.pending_count() == 10
+
+    outbox.complete(second)
+    clock.advance(30)
+    reclaimed = outbox.claim(10)
+    assert [row.outbox_id for row in reclaimed] == [row.outbox_id for row in first]
+    assert {row.attempts for row in reclaimed} == {2}
+    assert outbox.pending_count() == 6
+
+
+def test_retries_with_backoff_then_dead_letters(engine):
+    """Test that failed rows wait exponentially longer and are dead-lettered after max_attempts."""
+    clock = FakeClock()
+    outbox = Outbox(engine, max_attempts=3, backoff=10.0, clock=clock)
+
+    outbox.retry(outbox.claim(10), "delivery failed")
+    assert outbox.claim(10) == []
+    clock.advance(10)
+    outbox.retry(outbox.claim(10), "delivery failed")
+    clock.advance(10)
+    assert outbox.claim(10) == []
+    clock.advance(10)
+    claimed = outbox.claim(10)
+    assert {row.attempts for row in claimed} == {3}
+    outbox.retry(claimed[:5], "delivery failed")
+    outbox.complete(claimed[5:])
+
+    assert _statuses(engine) == (
+        [(EventStatus.FAILED, "failed")] * 5 + [(EventStatus.COMPLETED, "sent")] * 5
+    )
+    assert outbox.pending_count() == 0
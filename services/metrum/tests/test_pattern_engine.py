@@ -0,0 +1,35 @@
+from metrum.collector.log_reader.event_builder import EventBuilder
+from metrum.collector.log_reader.pattern_engine import PatternEngine
+from metrum.collector.queries.patterns import Pattern
+
+
+def test_reports_every_match_in_configuration_order():
+    """Test that all matching patterns are found, given as Pattern objects or dicts."""
+    engine = PatternEngine({
+        "orders_scan": Pattern(query_pattern=r"FROM\s+orders\b", description=""),
+        "any_select": {"query_pattern": r"(?i)^select\b"},
+        "join": {"query_pattern": r"JOIN\s+(customers|items)\b"},
+        "no_literal": {"query_pattern": r"\d{4,}"},
+        "broken": {"query_pattern": r"FROM ("},
+    })
+
+    assert len(engine) == 4
+    assert engine.match("select * FROM orders JOIN items ON true WHERE id = 12345") == [
+        "orders_scan", "any_select", "join", "no_literal",
+    ]
+    assert engine.match("UPDATE invoices SET total = 0") == []
+    # Only the pattern without a required literal is left to run
+    assert [engine.names[i] for i in engine.candidates("UPDATE invoices SET total = 0")] == ["no_literal"]
+
+
+def test_event_builder_tags_events_with_every_match():
+    """Test that events keep the first match as pattern_name and all of them as pattern_names."""
+    builder = EventBuilder({
+        "select_statement": Pattern(query_pattern=r"SELECT.*FROM", description=""),
+        "accounts": Pattern(query_pattern=r"\baccounts\b", description=""),
+    })
+
+    fields = builder.build(["SELECT id FROM accounts"], [], 1.0, "2025-03-08 17:06:20.123 GMT")
+
+    assert fields["pattern_name"] == "select_statement"
+    assert fields["pattern_names"] == ["select_statement", "accounts"]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from metrum.collector.log_reader.event_builder import EventBuilder
+from metrum.collector.queries import patterns as patterns_module
+from metrum.collector.queries.patterns import PatternConfig, PatternLoader, PatternRefresher
+from metrum.settings import settings
+
+URL = "https://patterns.example.com/patterns.json"
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeServer:
+    """Serves a pattern document with an ETag, answering 304 while it is unchanged."""
+
+    def __init__(self, body):
+        self.body = body
+        self.version = 1
+        self.requests = []
+
+    def publish(self, body):
+        self.body = body
+        self.version += 1
+
+    def get(self, url, headers=None, timeout=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        etag = f'"v{self.version}"'
+        if headers.get("If-None-Match") == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, {"patterns": self.body}, {"ETag": etag})
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = FakeServer({
+        "selects": {"query_pattern": r"SELECT.*FROM", "description": ""},
+        "orders": {"query_pattern": r"\borders\b", "description": ""},
+    })
+    monkeypatch.setattr(settings, "patterns_source", URL)
+    monkeypatch.setattr(settings, "patterns_cache_dir", tmp_path)
+    monkeypatch.setattr(patterns_module.requests, "get", server.get)
+    return server
+
+
+def test_refresh_revalidates_with_etag(server):
+    """Test that an unchanged source is not downloaded again and a changed one is."""
+    loader = PatternLoader()
+    assert set(loader.load_patterns().patterns) == {"selects", "orders"}
+
+    assert loader.refresh() is None
+    assert server.requests[-1] == {"If-None-Match": '"v1"'}
+
+    server.publish({"selects": {"query_pattern": r"SELECT.*FROM", "description": ""}})
+    assert set(loader.refresh().patterns) == {"selects"}
+    # The new version is cached with its ETag
+    assert loader.refresh() is None
+    assert server.requests[-1] == {"If-None-Match": '"v2"'}
+
+
+def test_refresher_recompiles_only_changed_patterns(server):
+    """Test that a refresh swaps in a new engine that reuses unchanged compiled patterns."""
+    loader = PatternLoader()
+    config = loader.load_patterns()
+    builder = EventBuilder(config.patterns)
+    previous = builder.pattern_engine
+    refresher = PatternRefresher(loader, config, lambda new, diff: builder.update_patterns(new.patterns))
+
+    assert asyncio.run(refresher.refresh()) is None
+    server.publish({
+        "selects": {"query_pattern": r"SELECT.*FROM", "description": ""},
+        "orders": {"query_pattern": r"\binvoices\b", "description": ""},
+        "deletes": {"query_pattern": r"DELETE\s+FROM", "description": ""},
+    })
+    diff = asyncio.run(refresher.refresh())
+
+    assert (diff.added, diff.changed, diff.removed) == (["deletes"], ["orders"], [])
+    engine = builder.pattern_engine
+    assert engine is not previous
+    assert engine.compiled["selects"] is previous.compiled["selects"]
+    assert engine.compiled["orders"] is not previous.compiled["orders"]
+    assert engine.match("SELECT * FROM invoices") == ["selects", "orders"]
+    assert refresher.config == PatternConfig.model_validate({"patterns": server.body})
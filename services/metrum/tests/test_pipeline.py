@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader import CheckpointStore, LogMonitor
+from metrum.db.models import Base, LogCheckpoint, LogEvent
+
+PREFIX = "2025-03-08 17:06:20.123 GMT"
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    """Create a database with the log tables."""
+    url = f"sqlite:///{tmp_path / 'metrum.db'}"
+    Base.metadata.create_all(create_engine(url))
+    return url
+
+
+class RecordingMonitor(LogMonitor):
+    """LogMonitor that records deliveries instead of posting them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delivered = []
+
+    async def _send_batch(self, events, plans=None) -> bool:
+        self.delivered.extend(event.query_text for event in events)
+        return True
+
+
+def _query_texts(db_url):
+    """Return the query text of every stored event."""
+    with Session(create_engine(db_url)) as session:
+        return [event.query_text for event in session.execute(select(LogEvent).order_by(LogEvent.id)).scalars()]
+
+
+def test_pipeline_ingests_and_delivers_without_blocking_the_loop(tmp_path, db_url):
+    """Test that events flow through every stage while other tasks keep running."""
+    log_file = tmp_path / "postgresql.log"
+    log_file.write_text("".join(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT {i}\n" for i in range(50)))
+    monitor = RecordingMonitor(
+        log_file_path=str(log_file),
+        patterns={},
+        http_endpoint="http://localhost",
+        db_url=db_url,
+        poll_interval=0.05,
+        read_batch_lines=10,
+        match_workers=3,
+    )
+
+    async def scenario():
+        ticks = 0
+        task = asyncio.create_task(monitor.run())
+        # Deliveries are acknowledged in the database after the send returns
+        while (len(monitor.delivered) < 49 or monitor._pending_event_count()) and ticks < 2000:
+            await asyncio.sleep(0.005)
+            ticks += 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return ticks
+
+    ticks = asyncio.run(scenario())
+
+    assert ticks < 2000
+    assert monitor.delivered == [f"SELECT {i}" for i in range(49)]
+    with Session(create_engine(db_url)) as session:
+        statuses = set(session.execute(select(LogEvent.status)).scalars())
+        checkpoint = session.execute(select(LogCheckpoint)).scalar_one()
+    assert statuses == {"sent"}
+    assert checkpoint.committed_offset == log_file.stat().st_size
+
+
+def test_restart_after_a_commit_spanning_a_rotation_does_not_duplicate_events(tmp_path, db_url):
+    """Test that one group commit covering two files checkpoints both of them."""
+    first = tmp_path / "postgresql-01.log"
+    second = tmp_path / "postgresql-02.log"
+    first.write_text("".join(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT a{i}\n" for i in range(5)))
+    second.write_text("".join(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT b{i}\n" for i in range(5)))
+
+    def run_until(log_file, stored):
+        monitor = RecordingMonitor(
+            log_file_path=str(log_file),
+            patterns={},
+            http_endpoint="http://localhost",
+            db_url=db_url,
+            poll_interval=0.05,
+            read_batch_lines=2,
+            follow_pattern="*.log",
+        )
+
+        async def scenario():
+            ticks = 0
+            task = asyncio.create_task(monitor.run())
+            while len(_query_texts(db_url)) < stored and ticks < 2000:
+                await asyncio.sleep(0.005)
+                ticks += 1
+            # Give a duplicate the chance to show up
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(scenario())
+
+    run_until(first, 9)
+    checkpoints = CheckpointStore(create_engine(db_url))
+    with Session(create_engine(db_url)) as session:
+        paths = session.execute(select(LogCheckpoint.file_path)).scalars().all()
+    assert sorted(paths) == [str(first), str(second)]
+
+    # As after a restart of "metrum run", which starts at the oldest unfinished file
+    with second.open("a") as f:
+        f.write(f"{PREFIX} [1] LOG:  execute <unnamed>: SELECT b5\n")
+    run_until(checkpoints.first_unfinished([first, second]), 10)
+
+    assert _query_texts(db_url) == [f"SELECT a{i}" for i in range(5)] + [f"SELECT b{i}" for i in range(5)]
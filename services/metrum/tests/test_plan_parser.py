@@ -0,0 +1,92 @@
+import json
+
+from metrum.collector.log_reader.event_builder import EventBuilder
+from metrum.collector.log_reader.plan_parser import PlanNode, parse_plan
+
+JSON_PLAN = {
+    "Query Text": "SELECT a.name, count(*) FROM accounts a JOIN \"orders\" o ON o.account_id = a.id GROUP BY 1 ORDER BY 2",
+    "Plan": {
+        "Node Type": "Sort",
+        "Plan Rows": 100,
+        "Actual Startup Time": 41.2,
+        "Actual Total Time": 41.9,
+        "Actual Rows": 100,
+        "Actual Loops": 1,
+        "Sort Method": "external merge",
+        "Sort Space Used": 2048,
+        "Sort Space Type": "Disk",
+        "Temp Written Blocks": 256,
+        "Plans": [{
+            "Node Type": "Hash Join",
+            "Plan Rows": 5000,
+            "Actual Rows": 4800,
+            "Actual Loops": 1,
+            "Shared Hit Blocks": 120,
+            "Shared Read Blocks": 8,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "orders", "Actual Rows": 4800, "Actual Loops": 1},
+                {
+                    "Node Type": "Hash",
+                    "Hash Batches": 4,
+                    "Original Hash Batches": 1,
+                    "Peak Memory Usage": 4097,
+                    "Plans": [{
+                        "Node Type": "Index Scan",
+                        "Relation Name": "accounts",
+                        "Index Name": "accounts_pkey",
+                        "Actual Rows": 100,
+                        "Actual Loops": 1,
+                    }],
+                },
+            ],
+        }],
+    },
+}
+
+TEXT_PLAN = [
+    "",
+    "\tQuery Text: SELECT a.name, count(*)",
+    "\t  FROM accounts a JOIN orders o ON o.account_id = a.id GROUP BY 1 ORDER BY 2",
+    "\tSort  (cost=210.12..210.37 rows=100 width=40) (actual time=41.200..41.900 rows=100 loops=1)",
+    "\t  Sort Key: (count(*)) DESC",
+    "\t  Sort Method: external merge  Disk: 2048kB",
+    "\t  Buffers: shared hit=120 read=8, temp written=256",
+    "\t  ->  Hash Join  (cost=3.25..180.50 rows=5000 width=32) (actual time=0.100..30.000 rows=4800 loops=1)",
+    "\t        Hash Cond: (o.account_id = a.id)",
+    "\t        ->  Seq Scan on orders o  (cost=0.00..90.00 rows=5000 width=8) (actual time=0.010..5.000 rows=4800 loops=1)",
+    "\t        ->  Hash  (cost=2.00..2.00 rows=100 width=36) (actual time=0.050..0.050 rows=100 loops=1)",
+    "\t              Buckets: 1024  Batches: 4 (originally 1)  Memory Usage: 4097kB",
+    "\t              ->  Index Scan using accounts_pkey on accounts a  (cost=0.14..2.00 rows=100 width=36) (never executed)",
+]
+
+
+def test_json_and_text_plans_give_the_same_tree():
+    """Test that both auto_explain formats are reduced to nodes with rows, buffers and spills."""
+    for plan in (parse_plan(json.dumps(JSON_PLAN, indent=2).split("\n")), parse_plan(TEXT_PLAN)):
+        root = plan.root
+        assert [node.node_type for node in root.walk()] == ["Sort", "Hash Join", "Seq Scan", "Hash", "Index Scan"]
+        sort, join, scan, hash_node, index_scan = root.walk()
+        assert (sort.sort_method, sort.sort_space_kb, sort.sort_space_type) == ("external merge", 2048, "Disk")
+        assert (sort.total_ms, sort.actual_rows, sort.loops) == (41.9, 100, 1)
+        assert (scan.relation, scan.actual_rows) == ("orders", 4800)
+        assert (hash_node.hash_batches, hash_node.original_hash_batches, hash_node.peak_memory_kb) == (4, 1, 4097)
+        assert (index_scan.relation, index_scan.index) == ("accounts", "accounts_pkey")
+        assert [node.spilled for node in root.walk()] == [True, False, False, True, False]
+        assert plan.query_text.startswith("SELECT a.name, count(*)")
+
+    text_root = parse_plan(TEXT_PLAN).root
+    assert (text_root.shared_hit, text_root.shared_read, text_root.temp_written) == (120, 8, 256)
+    assert text_root.children[0].children[1].children[0].loops == 0
+    assert PlanNode.from_dict(json.loads(json.dumps(text_root.to_dict()))) == text_root
+
+
+def test_event_builder_stores_the_plan_tree():
+    """Test that events carry the parsed plan and take their query text from it."""
+    builder = EventBuilder({})
+    plan = json.dumps({"Query Text": 'SELECT "quoted" FROM accounts', "Plan": {"Node Type": "Seq Scan"}})
+    fields = builder.build(["SELECT 1"], ["\t" + plan], 1.5, "2025-03-08 17:06:20.123 GMT")
+    assert fields["query_text"] == 'SELECT "quoted" FROM accounts'
+    assert fields["plan"] == {"node_type": "Seq Scan"}
+
+    truncated = builder.build(["SELECT 1"], ['\t{"Query Text": "SELECT 2", "Plan": {'], 1.5, "2025-03-08 17:06:20.123 GMT")
+    assert (truncated["query_text"], truncated["plan"]) == ("SELECT 2", None)
@@ -0,0 +1,84 @@
+import json
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader.event_writer import insert_events
+from metrum.collector.log_reader.outbox import Outbox
+from metrum.collector.log_reader.plan_parser import parse_plan
+from metrum.collector.log_reader.plan_store import PlanStore, split_plan
+from metrum.db.models import Base, ExplainPlan, LogEvent
+
+
+def _plan(relation: str, rows: int, time_ms: float) -> str:
+    return json.dumps({
+        "Query Text": f"SELECT * FROM {relation} ORDER BY id",
+        "Plan": {
+            "Node Type": "Sort",
+            "Actual Rows": rows,
+            "Actual Loops": 1,
+            "Actual Total Time": time_ms,
+            "Sort Key": ["id"],
+            "Plans": [{"Node Type": "Seq Scan", "Relation Name": relation, "Actual Rows": rows, "Actual Loops": 1}],
+        },
+    })
+
+
+def _join(join_type: str, condition: str, rows: int = 10) -> Dict[str, Any]:
+    return parse_plan([json.dumps({"Plan": {
+        "Node Type": "Hash Join",
+        "Join Type": join_type,
+        "Hash Cond": "(o.account_id = a.id)",
+        "Filter": condition,
+        "Actual Rows": rows,
+        "Rows Removed by Filter": rows // 5,
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "orders", "Actual Rows": 12},
+            {"Node Type": "Hash", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "accounts"}]},
+        ],
+    }})]).root.to_dict()
+
+
+def test_events_reference_plans_stored_once_per_shape(tmp_path):
+    """Test that plans differing only in figures share a row, and events keep their own figures."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    explains = [_plan("accounts", 10, 1.5), _plan("accounts", 12, 2.5), _plan("orders", 3, 0.5)]
+    trees = [parse_plan([explain]).root.to_dict() for explain in explains]
+    rows = [
+        {"timestamp": datetime(2025, 3, 8, 17, 0, i), "query_text": "SELECT", "explain_text": explain, "plan": tree}
+        for i, (explain, tree) in enumerate(zip(explains, trees))
+    ]
+
+    store = PlanStore()
+    with Session(engine) as session:
+        insert_events(session, rows[:2], store)
+        session.commit()
+    with Session(engine) as session:
+        # The first transaction's shapes are now cached
+        insert_events(session, rows, store)
+        session.commit()
+
+    with Session(engine) as session:
+        assert session.execute(select(func.count()).select_from(ExplainPlan)).scalar() == 2
+        stored = session.execute(select(LogEvent).order_by(LogEvent.id)).scalars().all()
+        assert [event.explain_text for event in stored] == explains[:2] + explains
+        assert stored[0].plan_id == stored[1].plan_id == stored[3].plan_id != stored[4].plan_id
+        # plan_rows, actual_rows, loops, startup_ms and total_ms of the Sort
+        assert stored[1].plan_stats[0] == [None, 12, 1, None, 2.5]
+        first = session.get(ExplainPlan, stored[0].plan_id)
+        assert first.explain_text == explains[0]
+
+    claimed = Outbox(engine).claim(10)
+    assert [row.plan for row in claimed] == trees[:2] + trees
+
+
+def test_plans_differing_in_attributes_have_different_shapes():
+    """Test that the join type and conditions are part of a plan's shape, and its figures are not."""
+    inner = split_plan(_join("Inner", "(o.total > 10)"))[0]
+
+    assert split_plan(_join("Left", "(o.total > 10)"))[0] != inner
+    assert split_plan(_join("Inner", "(o.total > 20)"))[0] != inner
+    assert split_plan(_join("Inner", "(o.total > 10)", rows=500))[0] == inner
@@ -0,0 +1,46 @@
+import pytest
+from pydantic import ValidationError
+
+from metrum.collector.queries import MetrumQuery, QueryAnalysisCache, query_analysis_cache
+from metrum.collector.queries.analysis_cache import QueryAnalysis
+
+
+def test_repeated_queries_are_analysed_once():
+    """Test that a cached analysis gives the same query, with its own containers and parameters."""
+    query_analysis_cache.clear()
+    query = "SELECT id FROM accounts WHERE owner = 'bob'"
+    first = MetrumQuery.from_query(query)
+    second = MetrumQuery.from_query(query, {"owner": "bob"}, query_id=42)
+
+    assert query_analysis_cache.stats()["hits"] == 1
+    assert query_analysis_cache.stats()["misses"] == 1
+    assert second.model_dump() == {**first.model_dump(), "parameters": {"owner": "bob"}, "query_id": 42}
+    second.tables.append("other")
+    assert MetrumQuery.from_query(query).tables == first.tables
+
+
+def test_cached_queries_validate_their_parameters():
+    """Test that parameters are validated whether or not the analysis is cached."""
+    query_analysis_cache.clear()
+    query = "SELECT id FROM accounts WHERE owner = 'bob'"
+    for _ in range(2):
+        with pytest.raises(ValidationError):
+            MetrumQuery.from_query(query, ["bob"])
+        MetrumQuery.from_query(query, {"owner": "bob"})
+
+    assert query_analysis_cache.stats()["hits"] == 3
+
+
+def test_least_recently_used_entries_are_evicted_over_budget():
+    """Test that the cache stays within its memory budget, keeping recently used entries."""
+    analysis = QueryAnalysis("hash", "SELECT $1", "SELECT", (), None)
+    cache = QueryAnalysisCache(max_bytes=2_000)
+    for index in range(3):
+        cache.put(f"SELECT {index}", analysis)
+    cache.get("SELECT 0")
+    cache.put("SELECT 3", analysis)
+
+    assert cache.bytes <= cache.max_bytes
+    assert cache.evictions == 1
+    assert cache.get("SELECT 1") is None
+    assert cache.get("SELECT 0") is analysis
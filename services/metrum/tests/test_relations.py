@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, text
+
+from metrum.collector.queries import MetrumQuery, RelationCatalog, extract_relations
+
+
+def test_relations_are_found_in_joins_subqueries_and_dml_targets():
+    """Test that JOINs, subqueries and DML targets are found, and CTE names, columns and functions are not."""
+    assert extract_relations(
+        "WITH recent AS (SELECT id FROM events WHERE ts > now()) "
+        "SELECT u.name, extract(year FROM u.created_at) FROM users u "
+        "JOIN recent r ON r.id = u.event_id LEFT JOIN public.orgs o USING (org_id), generate_series(1, 3) g "
+        "WHERE u.id IN (SELECT user_id FROM bans) FOR UPDATE"
+    ) == ["events", "users", "public.orgs", "bans"]
+    assert extract_relations("UPDATE accounts SET n = n + 1 FROM transfers t WHERE t.id = accounts.id") == [
+        "accounts", "transfers",
+    ]
+    assert extract_relations('DELETE FROM "Sessions" USING users u, orgs WHERE u.id = "Sessions".user_id') == [
+        "Sessions", "users", "orgs",
+    ]
+    assert extract_relations(
+        "MERGE INTO stock s USING deliveries d ON s.item = d.item "
+        "WHEN MATCHED THEN UPDATE SET qty = d.qty WHEN NOT MATCHED THEN INSERT (item, qty) VALUES (d.item, d.qty)"
+    ) == ["stock", "deliveries"]
+
+
+def test_views_are_told_from_tables_by_the_catalog(tmp_path):
+    """Test that views are looked up in the database once per refresh interval."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE orders (id INTEGER, total INTEGER)"))
+        conn.execute(text("CREATE VIEW big_orders AS SELECT * FROM orders WHERE total > 100"))
+    now = [0.0]
+    catalog = RelationCatalog(engine, refresh_interval=60.0, clock=lambda: now[0])
+
+    query = MetrumQuery.from_query("SELECT o.id FROM orders o JOIN big_orders b ON b.id = o.id", catalog=catalog)
+    assert (query.tables, query.views) == (["orders"], ["big_orders"])
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE VIEW small_orders AS SELECT * FROM orders WHERE total <= 100"))
+    assert "small_orders" not in catalog.views()
+    now[0] = 60.0
+    assert catalog.views() == {"big_orders", "small_orders"}
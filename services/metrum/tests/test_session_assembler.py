@@ -0,0 +1,122 @@
+import pytest
+
+from metrum.collector.log_reader import LogMonitor
+from metrum.collector.log_reader.pipeline import StageBatch
+from metrum.collector.log_reader.session_assembler import SessionAssembler
+
+
+def prefix(pid: int) -> str:
+    return f"2025-03-08 17:06:20.123 GMT [{pid}] "
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def assembler(clock):
+    """Create an assembler with small limits."""
+    return SessionAssembler(max_sessions=2, max_buffer_lines=3, idle_timeout=10.0, clock=clock)
+
+
+def test_interleaved_sessions_stay_separate(assembler):
+    """Test that plans are attached to the query of their own backend."""
+    statements = assembler.feed([
+        f"{prefix(1)}LOG:  execute <unnamed>: SELECT id",
+        "\tFROM accounts",
+        f"{prefix(2)}LOG:  execute <unnamed>: SELECT 2",
+        f"{prefix(1)}LOG:  duration: 3.500 ms  plan:",
+        '\t{"Plan": {}}',
+        f"{prefix(2)}LOG:  duration: 1.000 ms  plan:",
+        '\t{"Plan": {"Node Type": "Result"}}',
+        f"{prefix(1)}LOG:  execute <unnamed>: SELECT 3",
+    ])
+
+    assert len(statements) == 1
+    assert statements[0].session == "1"
+    assert statements[0].query_lines == ["SELECT id", "\tFROM accounts"]
+    assert statements[0].explain_lines == ['\t{"Plan": {}}']
+    assert statements[0].duration_ms == 3.5
+
+    remaining = {s.session: s for s in assembler.flush_all()}
+    assert remaining["2"].explain_lines == ['\t{"Plan": {"Node Type": "Result"}}']
+    assert remaining["1"].query_lines == ["SELECT 3"]
+
+
+def test_buffers_are_bounded(assembler):
+    """Test that continuation lines beyond the limit are dropped."""
+    assembler.feed([f"{prefix(1)}LOG:  execute <unnamed>: SELECT"] + [f"\tcol{i}," for i in range(5)])
+
+    statement, = assembler.flush_all()
+    assert statement.query_lines == ["SELECT", "\tcol0,", "\tcol1,"]
+    assert assembler.dropped_lines == 3
+
+
+def test_least_recently_active_session_is_evicted(assembler):
+    """Test that opening more than max_sessions flushes the oldest session."""
+    statements = assembler.feed([
+        f"{prefix(1)}LOG:  execute <unnamed>: SELECT 1",
+        f"{prefix(2)}LOG:  execute <unnamed>: SELECT 2",
+        f"{prefix(1)}LOG:  duration: 0.100 ms",
+        f"{prefix(3)}LOG:  execute <unnamed>: SELECT 3",
+    ])
+
+    assert [s.session for s in statements] == ["2"]
+    assert list(assembler.sessions) == ["1", "3"]
+
+
+def test_idle_sessions_are_flushed(assembler, clock):
+    """Test that sessions without new lines are flushed after the timeout."""
+    assembler.feed([f"{prefix(1)}LOG:  execute <unnamed>: SELECT 1"])
+    clock.now = 5.0
+    assembler.feed([f"{prefix(2)}LOG:  execute <unnamed>: SELECT 2"])
+
+    clock.now = 12.0
+    statements = assembler.flush_idle()
+
+    assert [s.session for s in statements] == ["1"]
+    assert list(assembler.sessions) == ["2"]
+
+
+def test_disconnection_flushes_session(assembler):
+    """Test that a backend's statement is completed when it disconnects."""
+    statements = assembler.feed([
+        f"{prefix(1)}LOG:  execute <unnamed>: SELECT 1",
+        f"{prefix(1)}LOG:  disconnection: session time: 0:00:01.000 user=postgres database=metrum",
+    ])
+
+    assert [s.query_lines for s in statements] == [["SELECT 1"]]
+    assert not assembler.sessions
+
+
+def test_monitor_builds_events_from_statements(tmp_path):
+    """Test that LogMonitor turns assembled statements into events."""
+    monitor = LogMonitor(
+        log_file_path=str(tmp_path / "postgresql.log"),
+        patterns={},
+        http_endpoint="http://localhost",
+        db_url="sqlite://",
+    )
+
+    events = monitor._build_events(monitor._assemble(StageBatch(0, None, [
+        f"{prefix(1)}LOG:  execute <unnamed>: SELECT id",
+        "\tFROM accounts",
+        f"{prefix(1)}LOG:  duration: 3.500 ms  plan:",
+        '\t{"Query Text": "SELECT id FROM accounts", "Plan": {}}',
+        f'{prefix(1)}LOG:  temporary file: path "base/pgsql_tmp/1", size 8192',
+    ])))
+
+    assert len(events) == 1
+    assert events[0]["query_text"] == "SELECT id FROM accounts"
+    assert events[0]["duration_ms"] == 3.5
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from metrum.collector.log_reader import LogMonitor
+from metrum.collector.log_reader.pipeline import StageBatch
+from metrum.collector.log_reader.structured_log import (
+    CsvLogParser,
+    JsonLogParser,
+    RecordAssembler,
+    create_record_parser,
+)
+
+PLAN = '{\n  "Query Text": "SELECT * FROM accounts",\n  "Plan": {"Node Type": "Seq Scan"}\n}'
+
+
+def _csv_row(session_id: str, pid: int, message: str, query_id: str = "0") -> str:
+    """Build a PostgreSQL 14+ csvlog row."""
+    quoted = '"' + message.replace('"', '""') + '"'
+    return (
+        f'2025-03-08 17:06:20.123 GMT,"postgres","metrum",{pid},"[local]",{session_id},1,'
+        f'"SELECT","2025-03-08 17:06:00 GMT",3/7,0,LOG,00000,{quoted},,,,,,,,,"psql",'
+        f'client backend,,{query_id}\n'
+    )
+
+
+def _json_row(session_id: str, pid: int, message: str) -> str:
+    """Build a jsonlog row."""
+    return json.dumps({
+        "timestamp": "2025-03-08 17:06:20.123 GMT",
+        "user": "postgres",
+        "dbname": "metrum",
+        "pid": pid,
+        "session_id": session_id,
+        "error_severity": "LOG",
+        "message": message,
+        "application_name": "psql",
+        "query_id": 0,
+    }) + "\n"
+
+
+def test_csvlog_multi_line_fields_across_batches():
+    """Test that quoted newlines never split a csvlog record."""
+    lines = _csv_row("65f1.2a", 42, f"duration: 1.5 ms  plan:\n{PLAN}", query_id="-123").splitlines(True)
+    parser = CsvLogParser()
+
+    assert parser.feed(lines[:2]) == []
+    assert parser.has_partial_record
+    records = parser.feed(lines[2:])
+
+    assert len(records) == 1
+    assert not parser.has_partial_record
+    record = records[0]
+    assert record.message == f"duration: 1.5 ms  plan:\n{PLAN}"
+    assert (record.pid, record.session_id, record.user, record.database, record.application) == (
+        "42", "65f1.2a", "postgres", "metrum", "psql"
+    )
+    assert record.timestamp == "2025-03-08 17:06:20.123 GMT"
+    assert record.query_id == "-123"
+
+
+def test_jsonlog_keeps_partial_lines():
+    """Test that a partial jsonlog line is completed by the next batch."""
+    row = _json_row("65f1.2a", 42, "execute <unnamed>: SELECT 1")
+    parser = JsonLogParser()
+
+    assert parser.feed([row[:20]]) == []
+    assert parser.has_partial_record
+    records = parser.feed([row[20:], "not json\n"])
+    assert not parser.has_partial_record
+
+    assert [record.message for record in records] == ["execute <unnamed>: SELECT 1"]
+    assert records[0].pid == "42"
+    assert records[0].query_id is None
+    assert parser.skipped_records == 1
+
+
+@pytest.mark.parametrize("log_format, row", [("csvlog", _csv_row), ("jsonlog", _json_row)])
+def test_record_assembler_pairs_statements_and_plans(log_format, row):
+    """Test that interleaved sessions pair each statement with its own plan."""
+    assembler = RecordAssembler(create_record_parser(log_format))
+    lines = [
+        row("a.1", 1, "execute <unnamed>: SELECT * FROM accounts"),
+        row("b.2", 2, "execute S_1: SELECT 2"),
+        row("a.1", 1, f"duration: 1.5 ms  plan:\n{PLAN}"),
+        row("b.2", 2, "disconnection: session time: 0:00:01.000"),
+    ]
+
+    statements = assembler.feed("".join(lines).splitlines(True))
+
+    assert [(s.session, s.query_lines, s.duration_ms) for s in statements] == [
+        ("a.1", ["SELECT * FROM accounts"], 1.5),
+        ("b.2", ["SELECT 2"], None),
+    ]
+    assert statements[0].explain_lines == [PLAN]
+    assert assembler.sessions == {}
+
+
+def test_monitor_builds_events_from_csvlog(tmp_path):
+    """Test that LogMonitor turns csvlog records into events."""
+    monitor = LogMonitor(
+        log_file_path=str(tmp_path / "postgresql.csv"),
+        patterns={},
+        http_endpoint="http://localhost",
+        db_url="sqlite://",
+        log_format="csvlog",
+    )
+    lines = _csv_row("a.1", 1, "execute <unnamed>: SELECT * FROM accounts")
+    lines += _csv_row("a.1", 1, f"duration: 1.5 ms  plan:\n{PLAN}")
+
+    events = monitor._build_events(monitor._assemble(StageBatch(0, None, lines.splitlines(True))))
+
+    assert len(events) == 1
+    assert events[0]["query_text"] == "SELECT * FROM accounts"
+    assert events[0]["duration_ms"] == 1.5
+    assert events[0]["explain_text"] == PLAN
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from metrum.collector.log_reader.event_writer import insert_events
+from metrum.db.models import Base, LogEvent
+from metrum.db.text_codec import TextCodec, text_codec
+
+
+def _queries(count: int):
+    return [
+        f"SELECT o.id, o.total, o.created_at FROM orders o JOIN customers c ON c.id = o.customer_id "
+        f"WHERE o.customer_id = {i} AND o.status = 'shipped' ORDER BY o.created_at DESC LIMIT {i % 50}"
+        for i in range(count)
+    ]
+
+
+def test_trained_dictionary_compresses_better_and_is_needed_to_decode(tmp_path):
+    """Test that a dictionary trained on past queries shrinks new ones, which name it."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    codec = TextCodec("zlib")
+    query = _queries(1001)[-1]
+    without = codec.encode(query)
+
+    with Session(engine) as session:
+        dictionary_id = codec.train(session, _queries(1000))
+        session.commit()
+    with_dictionary = codec.encode(query)
+
+    assert len(with_dictionary) < len(without) / 2
+    assert codec.decode(with_dictionary) == codec.decode(without) == query
+    assert int.from_bytes(with_dictionary[1:5], "big") == dictionary_id
+    assert TextCodec("zlib").decode(codec.encode("SELECT 1")) == "SELECT 1"
+    with pytest.raises(LookupError):
+        TextCodec("zlib").decode(with_dictionary)
+
+    # Another process finds the dictionary in the database
+    reader = TextCodec("zlib")
+    with Session(engine) as session:
+        assert reader.load(session) == dictionary_id
+    assert reader.decode(with_dictionary) == query
+
+
+def test_dictionary_trained_by_another_process_is_loaded_on_first_use(tmp_path):
+    """Test that a value naming a dictionary trained since the last load is decoded without waiting to reload."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    reader = TextCodec("zlib", clock=lambda: 0.0)
+    with Session(engine) as session:
+        assert reader.load(session) is None
+
+    writer = TextCodec("zlib")
+    with Session(engine) as session:
+        writer.train(session, _queries(1000))
+        session.commit()
+    query = _queries(1001)[-1]
+
+    assert reader.decode(writer.encode(query)) == query
+
+
+def test_events_store_compressed_text_read_lazily(tmp_path):
+    """Test that event text is compressed in the table and only decompressed when read."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrum.db'}")
+    Base.metadata.create_all(engine)
+    queries = _queries(20)
+    with Session(engine) as session:
+        text_codec.train(session, queries)
+        insert_events(session, [{"timestamp": datetime(2025, 3, 8, 17, 0, 0), "query_text": query} for query in queries])
+        session.commit()
+
+    with engine.connect() as connection:
+        stored = connection.execute(text("SELECT query_text FROM log_events ORDER BY id")).scalars().all()
+    assert all(isinstance(value, bytes) and value[0] != 0 for value in stored)
+    assert sum(map(len, stored)) < sum(map(len, queries)) / 2
+
+    with Session(engine) as session:
+        events = session.execute(select(LogEvent).order_by(LogEvent.id)).scalars().all()
+        assert "query_text" not in inspect(events[0]).dict
+        assert [event.query_text for event in events] == queries
@@ -0,0 +1,87 @@
+import asyncio
+import io
+import os
+from datetime import datetime, timedelta
+
+from metrum.collector.log_reader.file_log_reader import FileLogReader
+from metrum.collector.log_reader.log_line_prefix import LogLinePrefix
+from metrum.collector.log_reader.time_range import LineTimestamps, seek_time
+
+START = datetime(2025, 3, 8)
+
+
+def _write_day(path, day: int, lines_per_hour: int = 60):
+    """Write one day of minute-spaced log lines, each followed by a continuation line."""
+    with path.open("w") as f:
+        for minute in range(24 * lines_per_hour):
+            moment = START + timedelta(days=day, minutes=minute * 60 // lines_per_hour)
+            f.write(f"{moment:%Y-%m-%d %H:%M:%S}.000 GMT [42] LOG:  execute <unnamed>: SELECT {minute}\n")
+            f.write("\tFROM accounts\n")
+    mtime = (START + timedelta(days=day + 1) - datetime(1970, 1, 1)).total_seconds()
+    os.utime(path, (mtime, mtime))
+
+
+def _read(reader, start_time, end_time):
+    async def collect():
+        return [line async for line in reader.read_logs(start_time=start_time, end_time=end_time)]
+    return asyncio.run(collect())
+
+
+def test_seek_time_probes_few_lines():
+    """Test that the binary search lands on the first line at or after the start time."""
+    data = io.BytesIO()
+    for minute in range(10_000):
+        moment = START + timedelta(minutes=minute)
+        data.write(f"{moment:%Y-%m-%d %H:%M:%S}.000 GMT [1] LOG:  x\n\tcontinued\n".encode())
+    size = data.tell()
+    extract = LineTimestamps(LogLinePrefix())
+    calls = []
+
+    def timestamp_of(line):
+        calls.append(line)
+        return extract(line)
+
+    offset = seek_time(data, size, START + timedelta(minutes=7_777), timestamp_of)
+    data.seek(offset)
+
+    # The continuation line of the last earlier message may come first
+    assert data.readline() == b"\tcontinued\n"
+    assert data.readline().startswith(f"{START + timedelta(minutes=7_777):%Y-%m-%d %H:%M:%S}".encode())
+    assert len(calls) < 100
+
+
+def test_read_logs_time_range_across_files(tmp_path):
+    """Test that only lines inside the window are read, continuation lines included."""
+    for day in range(3):
+        _write_day(tmp_path / f"postgresql-0{day}.log", day)
+    reader = FileLogReader(logs_dir=tmp_path, pattern="*.log", log_format="stderr")
+
+    lines = _read(
+        reader,
+        START + timedelta(days=1, hours=10),
+        START + timedelta(days=1, hours=10, minutes=2),
+    )
+
+    assert lines == [
+        "2025-03-09 10:00:00.000 GMT [42] LOG:  execute <unnamed>: SELECT 600",
+        "\tFROM accounts",
+        "2025-03-09 10:01:00.000 GMT [42] LOG:  execute <unnamed>: SELECT 601",
+        "\tFROM accounts",
+        "2025-03-09 10:02:00.000 GMT [42] LOG:  execute <unnamed>: SELECT 602",
+        "\tFROM accounts",
+    ]
+
+
+def test_read_logs_open_ended_ranges(tmp_path):
+    """Test ranges with only a start or only an end time."""
+    _write_day(tmp_path / "postgresql-00.log", 0)
+    reader = FileLogReader(logs_dir=tmp_path, pattern="*.log", log_format="stderr")
+
+    since = _read(reader, START + timedelta(hours=23, minutes=59), None)
+    until = _read(reader, None, START)
+
+    assert since[0].endswith("SELECT 1439") and len(since) == 2
+    assert until == [
+        "2025-03-08 00:00:00.000 GMT [42] LOG:  execute <unnamed>: SELECT 0",
+        "\tFROM accounts",
+    ]
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+import pytest
+
+from metrum.collector.log_reader.timestamp_decoder import TimestampDecoder
+
+
+@pytest.fixture
+def decoder():
+    """Create a timestamp decoder."""
+    return TimestampDecoder()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-03-08 17:06:20.123 GMT", datetime(2025, 3, 8, 17, 6, 20, 123000)),
+    ("2025-03-08 17:06:20.123 UTC", datetime(2025, 3, 8, 17, 6, 20, 123000)),
+    ("2025-03-08 17:06:20 GMT", datetime(2025, 3, 8, 17, 6, 20)),
+    ("2025-03-08 17:06:20.005 +05", datetime(2025, 3, 8, 12, 6, 20, 5000)),
+    ("2025-03-08 17:06:20 -0330", datetime(2025, 3, 8, 20, 36, 20)),
+    ("2025-03-08 17:06:20.999 CEST", datetime(2025, 3, 8, 17, 6, 20, 999000)),
+    ("2025-03-08 17:06:20.123", datetime(2025, 3, 8, 17, 6, 20, 123000)),
+    ("1741453580.123", datetime(2025, 3, 8, 17, 6, 20, 123000)),
+])
+def test_decode_prefix_timestamps(decoder, value, expected):
+    """Test %m, %t and %n tokens with UTC, numeric and unknown zones."""
+    assert decoder.decode(value) == expected
+
+
+def test_decode_reuses_cached_second(decoder):
+    """Test that lines within one second share a cache entry."""
+    first = decoder.decode("2025-03-08 17:06:20.001 GMT")
+    second = decoder.decode("2025-03-08 17:06:20.750 GMT")
+
+    assert len(decoder._seconds) == 1
+    assert (second - first).total_seconds() == pytest.approx(0.749)
+
+
+def test_decode_rejects_malformed_tokens(decoder):
+    """Test that malformed tokens decode to None."""
+    assert decoder.decode("2025-03-08 17:6:20.123 GMT") is None
+    assert decoder.decode("2025-03-08 17:06:20.1x3 GMT") is None
+    assert decoder.decode("yesterday") is None
+
+
+def test_cache_is_bounded():
+    """Test that the cache is cleared once it reaches max_entries."""
+    decoder = TimestampDecoder(max_entries=2)
+    for second in range(5):
+        decoder.decode(f"2025-03-08 17:06:{second:02d}.000 GMT")
+
+    assert len(decoder._seconds) <= 2